@@ -1,23 +1,62 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import List
+from contextlib import asynccontextmanager
+from datetime import date, datetime
 import os
 from dotenv import load_dotenv
 import io
 import asyncio
+import logging
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Application lifecycle: shared clients and pools are created once per process
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.database import init_db
+    from app.services.openai_service import get_openai_service, close_openai_service
+    from app.services.pdf_service import pdf_service
+    from app.services.ocr_service import ocr_service
+    from app.services.job_service import job_service, JOB_DRAIN_TIMEOUT
+    from app.services.warmup import warm_up
+    
+    init_db()
+    try:
+        get_openai_service()
+    except Exception as e:
+        # Keep serving (health checks, exports); AI endpoints report the error per request
+        logger.warning("OpenAI client not initialised: %s", e)
+    # Pay import and pool start-up costs before the first request, not during it
+    await warm_up()
+    await job_service.start()
+    
+    yield
+    
+    # Open HTTP requests have been drained by the server; let job files finish too
+    await job_service.stop(JOB_DRAIN_TIMEOUT)
+    await close_openai_service()
+    pdf_service.shutdown()
+    ocr_service.shutdown()
+
 # Create FastAPI app
 app = FastAPI(
     title="PDF Data Extraction API",
     description="AI-powered PDF data extraction and analysis tool",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Multipart file parts go straight to disk and are size-checked while they stream in
+from app.services.upload_service import UploadRoute
+from app.services.archive_service import ZIP_MAX_SIZE
+app.router.route_class = UploadRoute.with_limits({"/api/v1/batch-extract/zip": ZIP_MAX_SIZE})
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +66,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized request bodies before they are parsed; ZIP archives have their own limit
+from app.services.upload_service import UploadLimitMiddleware
+app.add_middleware(UploadLimitMiddleware, route_limits={"/api/v1/batch-extract/zip": ZIP_MAX_SIZE})
+
+# Request metrics and Server-Timing headers (outermost, so it sees every response)
+from app.services.metrics import MetricsMiddleware
+app.add_middleware(MetricsMiddleware)
+
 # Mount static files directory
 if not os.path.exists("uploads"):
     os.makedirs("uploads")
@@ -41,6 +88,15 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 async def health_check():
     return {"status": "healthy", "message": "PDF Extraction API is running"}
 
+# Prometheus metrics
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latency histograms, LLM latency/tokens and service counters"""
+    from app.services.metrics import registry
+    import app.services.extraction_service  # registers the service metrics
+    
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # Root endpoint - serve the frontend
 @app.get("/")
 async def root():
@@ -72,42 +128,26 @@ async def batch_extract_invoices(files: List[UploadFile] = File(...)):
                     detail=f"File {file.filename} is not a PDF. Only PDF files are allowed."
                 )
         
-        from app.services.openai_service import OpenAIService
-        ai_service = OpenAIService()
+        from app.services.openai_service import get_openai_service
+        from app.services.extraction_service import ExtractionService
+        extraction_service = ExtractionService(get_openai_service())
         
-        # Process all PDFs
-        processed_invoices = []
+        # Process all PDFs concurrently (bounded by BATCH_CONCURRENCY)
+        processed_invoices = await extraction_service.extract_invoices(files)
         
-        for file in files:
-            try:
-                # Read file content
-                content = await file.read()
-                
-                # Extract text with pdfplumber
-                import pdfplumber
-                with pdfplumber.open(io.BytesIO(content)) as pdf:
-                    full_text = ""
-                    for page in pdf.pages:
-                        text = page.extract_text()
-                        if text:
-                            full_text += text + "\n"
-                
-                # Extract structured invoice data for Excel
-                filename = file.filename or "unknown_file.pdf"
-                invoice_data = await ai_service.extract_invoice_for_excel(full_text, filename)
-                processed_invoices.append(invoice_data)
-                
-            except Exception as e:
-                # Add error record for failed files
-                filename = file.filename or "unknown_file.pdf"
-                processed_invoices.append({
-                    "error": f"Failed to process {filename}: {str(e)}",
-                    "invoice_summary": ai_service._get_empty_invoice_summary(filename),
-                    "line_items": []
-                })
+        # Keep the results server-side so the export only needs the batch id
+        from app.services.invoice_store import invoice_store
+        
+        try:
+            batch_id = await invoice_store.save_batch(processed_invoices)
+        except Exception as e:
+            logger.warning("Could not store batch results: %s", e)
+            batch_id = None
         
         return {
             "status": "success",
+            "batch_id": batch_id,
+            "export_url": f"/api/v1/batches/{batch_id}/export-excel" if batch_id else None,
             "processed_count": len(processed_invoices),
             "invoices": processed_invoices,
             "message": f"Successfully processed {len(processed_invoices)} invoice(s)"
@@ -116,94 +156,539 @@ async def batch_extract_invoices(files: List[UploadFile] = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Batch processing error: {str(e)}")
 
-# Excel export endpoint - NEW
-@app.post("/api/v1/export-excel")
-async def export_to_excel(invoice_data: dict):
-    """Export processed invoice data to Excel format"""
-    try:
-        from app.services.excel_service import ExcelService
-        
-        excel_service = ExcelService()
-        invoice_list = invoice_data.get('invoices', [])
+# Streaming batch endpoint: one NDJSON/SSE event per invoice as it completes
+@app.post("/api/v1/batch-extract/stream")
+async def batch_extract_invoices_stream(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    format: str = None
+):
+    """Process multiple PDF invoices, streaming each result as soon as it is ready"""
+    from app.services.streaming import STREAM_MEDIA_TYPES, encode_events, stream_format_for
+    
+    if len(files) > 50:  # Limit batch size
+        raise HTTPException(status_code=400, detail="Maximum 50 files allowed per batch")
+    
+    for file in files:
+        if file.content_type != "application/pdf":
+            raise HTTPException(
+                status_code=400,
+                detail=f"File {file.filename} is not a PDF. Only PDF files are allowed."
+            )
+    
+    from app.services.openai_service import get_openai_service
+    from app.services.extraction_service import ExtractionService
+    extraction_service = ExtractionService(get_openai_service())
+    stream_format = stream_format_for(format, request.headers.get("accept"))
+    
+    async def events():
+        total = len(files)
+        completed = 0
+        error_count = 0
+        batch_id = await _create_stream_batch()
+        yield {"event": "start", "total": total, "batch_id": batch_id}
         
-        if not invoice_list:
-            raise HTTPException(status_code=400, detail="No invoice data provided")
+        try:
+            async for index, invoice in extraction_service.iter_invoices(files):
+                completed += 1
+                batch_id = await _store_streamed(batch_id, index, invoice)
+                filename = files[index].filename or "unknown_file.pdf"
+                if invoice.get("error"):
+                    error_count += 1
+                    yield {"event": "error", "index": index, "filename": filename, "error": invoice["error"], "invoice": invoice}
+                else:
+                    yield {"event": "result", "index": index, "filename": filename, "invoice": invoice}
+                yield {"event": "progress", "completed": completed, "total": total}
+        except Exception as e:
+            yield {"event": "error", "error": f"Batch processing error: {str(e)}"}
         
-        # Generate Excel file
-        excel_bytes = excel_service.create_excel_from_invoices(invoice_list)
+        yield {
+            "event": "done",
+            "batch_id": batch_id,
+            "processed_count": completed,
+            "error_count": error_count,
+            "message": f"Successfully processed {completed} invoice(s)"
+        }
+    
+    return StreamingResponse(
+        encode_events(events(), stream_format),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ZIP ingestion: entries are extracted while the archive is still being uploaded
+@app.post("/api/v1/batch-extract/zip")
+async def batch_extract_zip(request: Request, format: str = None):
+    """Extract every PDF in a ZIP archive, streaming each result as soon as it is ready.
+
+    Send the archive as the raw request body (Content-Type: application/zip)
+    to have entries extracted while the upload is still arriving, or as the
+    `file` field of a multipart form. Events are the same as for
+    /api/v1/batch-extract/stream, except that the total is unknown up front.
+    """
+    from app.services.archive_service import ArchiveError, zip_reader
+    from app.services.streaming import DuplexStreamingResponse, STREAM_MEDIA_TYPES, encode_events, stream_format_for
+    
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not hasattr(upload, "read"):
+            await form.close()
+            raise HTTPException(status_code=400, detail="Send the ZIP archive in a 'file' field")
+        chunks = _read_form_upload(form, upload)
+    else:
+        chunks = request.stream()
+    
+    from app.services.openai_service import get_openai_service
+    from app.services.extraction_service import ExtractionService
+    extraction_service = ExtractionService(get_openai_service())
+    stream_format = stream_format_for(format, request.headers.get("accept"))
+    
+    async def events():
+        completed = 0
+        error_count = 0
+        batch_id = await _create_stream_batch()
+        yield {"event": "start", "total": None, "batch_id": batch_id}
         
-        # Create filename with timestamp
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"invoice_batch_{timestamp}.xlsx"
+        try:
+            documents = zip_reader.entries(chunks)
+            async for index, filename, invoice in extraction_service.iter_documents(documents):
+                completed += 1
+                batch_id = await _store_streamed(batch_id, index, invoice)
+                if invoice.get("error"):
+                    error_count += 1
+                    yield {"event": "error", "index": index, "filename": filename, "error": invoice["error"], "invoice": invoice}
+                else:
+                    yield {"event": "result", "index": index, "filename": filename, "invoice": invoice}
+                yield {"event": "progress", "completed": completed, "total": None}
+        except ArchiveError as e:
+            yield {"event": "error", "error": f"Archive error: {str(e)}"}
+        except HTTPException as e:
+            # The archive crossed ZIP_MAX_SIZE while it was being read
+            yield {"event": "error", "error": f"Archive too large: {e.detail}", "limit_bytes": ZIP_MAX_SIZE}
+        except Exception as e:
+            yield {"event": "error", "error": f"Batch processing error: {str(e)}"}
         
-        # Return Excel file as download
-        return StreamingResponse(
-            io.BytesIO(excel_bytes),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        yield {
+            "event": "done",
+            "batch_id": batch_id,
+            "processed_count": completed,
+            "error_count": error_count,
+            "message": f"Successfully processed {completed} invoice(s)"
+        }
+    
+    # The request body is read while the response streams
+    return DuplexStreamingResponse(
+        encode_events(events(), stream_format),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _create_stream_batch():
+    """Stored batch for a streamed extraction, or None when storage is unavailable"""
+    from app.services.invoice_store import invoice_store
+    
+    try:
+        return await invoice_store.create_batch()
+    except Exception as e:
+        logger.warning("Could not store batch results: %s", e)
+        return None
+
+async def _store_streamed(batch_id, index, invoice):
+    """Store one streamed result; returns None (and stops storing) once storage fails"""
+    from app.services.invoice_store import invoice_store
+    
+    if batch_id is None:
+        return None
+    try:
+        await invoice_store.add_invoices(batch_id, {index: invoice})
+        return batch_id
+    except Exception as e:
+        logger.warning("Could not store batch results: %s", e)
+        return None
+
+async def _read_form_upload(form, upload):
+    from app.services.upload_service import UPLOAD_CHUNK_SIZE
+    
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await form.close()
+
+# Background jobs: submit returns immediately, workers process the files
+@app.post("/api/v1/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...)):
+    """Queue PDF invoices for background extraction and return a job id"""
+    from app.services.job_service import job_service, JOB_MAX_FILES
+    
+    if len(files) > JOB_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Maximum {JOB_MAX_FILES} files allowed per job")
+    
+    for file in files:
+        if file.content_type != "application/pdf":
+            raise HTTPException(
+                status_code=400,
+                detail=f"File {file.filename} is not a PDF. Only PDF files are allowed."
+            )
+    
+    from app.services.upload_service import upload_service, UploadTooLargeError
+    
+    documents = []
+    try:
+        for file in files:
+            documents.append(await upload_service.spool(file))
+        job = await job_service.submit(documents)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Job submission error: {str(e)}")
+    finally:
+        for document in documents:
+            document.cleanup()
+    
+    job["status_url"] = f"/api/v1/jobs/{job['job_id']}"
+    job["results_url"] = f"/api/v1/jobs/{job['job_id']}/results"
+    return job
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Job status with per-file progress"""
+    from app.services.job_service import job_service, JobNotFoundError
+    
+    try:
+        return await job_service.get_status(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/v1/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    """Extracted invoices of a job (same shape as /api/v1/batch-extract)"""
+    from app.services.job_service import job_service, JobNotFoundError
+    
+    try:
+        return await job_service.get_results(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.delete("/api/v1/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a job; files that have not started are skipped"""
+    from app.services.job_service import job_service, JobNotFoundError
+    
+    try:
+        return await job_service.cancel(job_id)
+    except JobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# Vendor layout templates
+@app.get("/api/v1/templates")
+async def list_templates():
+    """Learned vendor templates; active ones replace the LLM for matching invoices"""
+    from app.services.template_service import template_service
+    
+    return {"templates": await template_service.list_templates()}
+
+@app.delete("/api/v1/templates/{template_id}")
+async def delete_template(template_id: int):
+    """Forget a template; the vendor's next invoices go through the LLM again"""
+    from app.services.template_service import template_service, TemplateNotFoundError
+    
+    try:
+        await template_service.delete(template_id)
+    except TemplateNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"deleted": template_id}
+
+# Excel export endpoint - NEW
+@app.post("/api/v1/export-excel")
+async def export_to_excel(invoice_data: dict, engine: str = "xlsxwriter", drop_duplicates: bool = False):
+    """Export processed invoice data to Excel format
+    
+    Send either the `invoices` returned by batch-extract or just its
+    `batch_id` (optionally with `vendor`, `date_from` and `date_to`) to export
+    the stored batch without uploading it again.
+    
+    engine=xlsxwriter (default) writes rows in constant memory and streams the
+    file; engine=openpyxl uses the original pandas/openpyxl writer.
+    drop_duplicates=true leaves out invoices flagged as near-duplicates
+    (`duplicate_of`) of an invoice extracted earlier.
+    """
+    try:
+        invoices = await _export_source(invoice_data, drop_duplicates)
+        return await _excel_response(invoices, engine)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Excel export error: {str(e)}")
 
+# Tabular export: CSV, Parquet or Arrow for analytics tools
+@app.post("/api/v1/export")
+async def export_table(
+    invoice_data: dict,
+    format: str = "csv",
+    table: str = "line_items",
+    drop_duplicates: bool = False
+):
+    """Export invoices as one flat table (`table`: line_items or summary)
+    
+    Takes the same body and drop_duplicates option as /api/v1/export-excel.
+    Numeric columns are typed and there is no row limit.
+    """
+    _check_table_export(format, table)
+    try:
+        invoices = await _export_source(invoice_data, drop_duplicates)
+        return await _table_response(invoices, format, table)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Export error: {str(e)}")
+
+# Stored batches
+@app.get("/api/v1/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Stored batch-extract results"""
+    from app.services.invoice_store import invoice_store, BatchNotFoundError
+    
+    try:
+        return await invoice_store.get_batch(batch_id)
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/v1/batches/{batch_id}/export-excel")
+async def export_batch_to_excel(
+    batch_id: str,
+    vendor: str = None,
+    date_from: date = None,
+    date_to: date = None,
+    engine: str = "xlsxwriter",
+    drop_duplicates: bool = False
+):
+    """Export a stored batch, optionally filtered by vendor name and invoice date range"""
+    try:
+        invoices = await _batch_invoices(batch_id, vendor, date_from, date_to, drop_duplicates)
+        return await _excel_response(invoices, engine)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Excel export error: {str(e)}")
+
+@app.get("/api/v1/batches/{batch_id}/export")
+async def export_batch_table(
+    batch_id: str,
+    format: str = "csv",
+    table: str = "line_items",
+    vendor: str = None,
+    date_from: date = None,
+    date_to: date = None,
+    drop_duplicates: bool = False
+):
+    """Export a stored batch as CSV, Parquet or Arrow"""
+    _check_table_export(format, table)
+    try:
+        invoices = await _batch_invoices(batch_id, vendor, date_from, date_to, drop_duplicates)
+        return await _table_response(invoices, format, table)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Export error: {str(e)}")
+
+async def _export_source(invoice_data: dict, drop_duplicates: bool = False):
+    """Invoices posted in the body, or read from the stored batch named by batch_id"""
+    if invoice_data.get('batch_id'):
+        try:
+            date_from = _parse_date_filter(invoice_data.get('date_from'), 'date_from')
+            date_to = _parse_date_filter(invoice_data.get('date_to'), 'date_to')
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return await _batch_invoices(
+            invoice_data['batch_id'], invoice_data.get('vendor'), date_from, date_to, drop_duplicates
+        )
+    
+    invoice_list = invoice_data.get('invoices', [])
+    
+    if not invoice_list:
+        raise HTTPException(status_code=400, detail="No invoice data provided")
+    if drop_duplicates:
+        invoice_list = [invoice for invoice in invoice_list if not invoice.get('duplicate_of')]
+    return invoice_list
+
+async def _batch_invoices(batch_id: str, vendor, date_from, date_to, drop_duplicates: bool = False):
+    from app.services.invoice_store import invoice_store, BatchNotFoundError
+    
+    try:
+        await invoice_store.get_batch(batch_id)
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    # Rows are read from the database page by page while the export is written
+    return invoice_store.iter_invoices(batch_id, vendor, date_from, date_to, drop_duplicates)
+
+async def _excel_response(invoices, engine: str):
+    from app.services.excel_service import ExcelService
+    from app.services.metrics import stage
+    
+    excel_service = ExcelService()
+    
+    # Generate Excel file (off the event loop)
+    with stage("excel_build"):
+        if engine == "openpyxl":
+            excel_bytes = await asyncio.to_thread(lambda: excel_service.create_excel_from_invoices(list(invoices)))
+            content = io.BytesIO(excel_bytes)
+        else:
+            content = await asyncio.to_thread(excel_service.stream_excel, invoices)
+    
+    # Create filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"invoice_batch_{timestamp}.xlsx"
+    
+    # Return Excel file as download
+    return StreamingResponse(
+        content,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+def _check_table_export(format: str, table: str):
+    from app.services.export_service import EXPORT_FORMATS, EXPORT_TABLES
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=400, detail=f"Invalid table. Use one of: {', '.join(EXPORT_TABLES)}")
+
+async def _table_response(invoices, format: str, table: str):
+    from app.services.export_service import TabularExportService, EXPORT_FORMATS
+    from app.services.metrics import stage
+    
+    export_service = TabularExportService()
+    media_type, extension = EXPORT_FORMATS[format]
+    
+    if format == "parquet":
+        # Parquet needs its footer written before the file can be sent
+        with stage("table_build"):
+            content = await asyncio.to_thread(export_service.stream_parquet, invoices, table)
+    elif format == "arrow":
+        content = export_service.stream_arrow(invoices, table)
+    else:
+        content = export_service.stream_csv(invoices, table)
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"invoice_{table}_{timestamp}.{extension}"
+    
+    # CSV and Arrow chunks are produced in a worker thread as the client reads them
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+def _parse_date_filter(value, name: str):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}, expected YYYY-MM-DD")
+
 # PDF extraction endpoint (keep existing for compatibility)
 @app.post("/api/v1/extract")
 async def extract_pdf_data(
+    request: Request,
     file: UploadFile = File(...),
-    extraction_type: str = Form("general")
+    extraction_type: str = Form("general"),
+    analysis_mode: str = Form(None),
+    stream: bool = Form(False),
+    format: str = None
 ):
-    """Extract data from uploaded PDF"""
+    """Extract data from uploaded PDF
+    
+    With stream=true the response is an NDJSON/SSE event stream: the PDF
+    metadata as soon as it is parsed, then the summary and analysis text as
+    the model writes it, and a final done event holding the full result.
+    """
+    from app.services.extraction_service import ANALYSIS_MODES, DEFAULT_ANALYSIS_MODE
+    from app.services.upload_service import UploadTooLargeError
+    
+    # Validate file type and analysis mode
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    
+    analysis_mode = analysis_mode or DEFAULT_ANALYSIS_MODE
+    if analysis_mode not in ANALYSIS_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid analysis_mode. Use one of: {', '.join(ANALYSIS_MODES)}"
+        )
+    
     try:
-        # Validate file type
-        if file.content_type != "application/pdf":
-            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-        
-        # Read file content
-        content = await file.read()
-        
-        # Process PDF with pdfplumber
-        import pdfplumber
-        
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            # Extract text from all pages
-            full_text = ""
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n"
-        
-        # Use OpenAI for intelligent analysis
-        from app.services.openai_service import OpenAIService
-        import time
-        
-        start_time = time.time()
-        ai_service = OpenAIService()
-        
-        # Get AI analysis
-        structured_data = await ai_service.analyze_pdf_content(full_text, extraction_type)
-        ai_summary = await ai_service.generate_summary(full_text, extraction_type)
-        entities = await ai_service.extract_entities(full_text)
-        
-        processing_time = f"{time.time() - start_time:.1f} seconds"
-        
-        results = {
-            "filename": file.filename,
-            "file_size": len(content),
-            "extraction_type": extraction_type,
-            "page_count": len(pdf.pages) if 'pdf' in locals() else 1,
-            "processing_time": processing_time,
-            "structured_data": structured_data,
-            "raw_text": full_text[:3000] + "..." if len(full_text) > 3000 else full_text,
-            "ai_summary": ai_summary,
-            "extracted_entities": entities
-        }
+        # Spool the upload to disk (size-checked) instead of reading it into memory
+        from app.services.upload_service import upload_service
         
-        return results
+        document = await upload_service.spool(file)
+        try:
+            # Parse and analyze the PDF; repeat uploads are served from the cache
+            from app.services.openai_service import get_openai_service
+            from app.services.extraction_service import ExtractionService
+            
+            extraction_service = ExtractionService(get_openai_service())
+            if stream:
+                response = _stream_extraction(request, format, extraction_service, document, extraction_type, analysis_mode)
+                document = None  # owned by the stream from here on
+                return response
+            
+            return await extraction_service.analyze_document(document, extraction_type, analysis_mode)
+        finally:
+            if document is not None:
+                document.cleanup()
         
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
+def _stream_extraction(request: Request, format: str, extraction_service, document, extraction_type: str, analysis_mode: str):
+    """Event stream of one document's analysis; the document is cleaned up when the stream ends"""
+    from starlette.background import BackgroundTask
+    from app.services.streaming import STREAM_MEDIA_TYPES, encode_events, stream_format_for
+    
+    stream_format = stream_format_for(format, request.headers.get("accept"))
+    
+    async def events():
+        queue = asyncio.Queue()
+        
+        async def analyze():
+            try:
+                results = await extraction_service.analyze_document(
+                    document, extraction_type, analysis_mode, on_event=queue.put
+                )
+                await queue.put({"event": "done", **results})
+            except Exception as e:
+                await queue.put({"event": "error", "error": f"Error processing PDF: {str(e)}"})
+            finally:
+                await queue.put(None)
+        
+        task = asyncio.create_task(analyze())
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            # The client may leave mid-stream; stop the analysis with it
+            task.cancel()
+            document.cleanup()
+    
+    # Also cleaned up after the response, in case the stream never started
+    return StreamingResponse(
+        encode_events(events(), stream_format),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(document.cleanup)
+    )
+
 # Basic upload endpoint for compatibility
 @app.post("/api/v1/upload")
 async def upload_pdf():
@@ -0,0 +1,6 @@
+# Database models
+from app.models.document_signature import DocumentSignature, DocumentSignatureBand
+from app.models.extraction_cache import ExtractionCacheEntry
+from app.models.invoice import InvoiceBatch, StoredInvoice, StoredLineItem
+from app.models.invoice_template import InvoiceTemplate
+from app.models.job import Job, JobFile
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+
+from app.database import Base
+
+
+class DocumentSignature(Base):
+    """MinHash signature of an extracted document's text, for near-duplicate lookups"""
+
+    __tablename__ = "document_signatures"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    content_hash = Column(String(64), nullable=False, unique=True)  # SHA-256 of the PDF
+    cache_key = Column(String(64), nullable=False)  # where its extraction is cached
+    filename = Column(String(255), nullable=True)
+    signature = Column(Text, nullable=False)  # JSON list of MinHash values
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class DocumentSignatureBand(Base):
+    """One LSH bucket a signature falls into; documents sharing a bucket are candidates"""
+
+    __tablename__ = "document_signature_bands"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    signature_id = Column(Integer, ForeignKey("document_signatures.id", ondelete="CASCADE"), nullable=False, index=True)
+    bucket = Column(String(24), nullable=False, index=True)  # band number and hash of its rows
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, Text
+
+from app.database import Base
+
+
+class ExtractionCacheEntry(Base):
+    """Persisted extraction result, keyed by PDF hash + extraction settings"""
+
+    __tablename__ = "extraction_cache"
+
+    cache_key = Column(String(64), primary_key=True)
+    kind = Column(String(64), nullable=False)
+    result = Column(Text, nullable=False)  # JSON encoded result
+    size_bytes = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import relationship
+
+from app.database import Base
+
+
+class InvoiceBatch(Base):
+    """Invoices extracted by one batch request, exportable by id"""
+
+    __tablename__ = "invoice_batches"
+
+    id = Column(String(32), primary_key=True)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    invoices = relationship(
+        "StoredInvoice",
+        back_populates="batch",
+        order_by="StoredInvoice.position",
+        cascade="all, delete-orphan"
+    )
+
+
+class StoredInvoice(Base):
+    """Invoice summary of one extracted file"""
+
+    __tablename__ = "invoices"
+    __table_args__ = (
+        Index("ix_invoices_batch_position", "batch_id", "position"),
+        Index("ix_invoices_batch_vendor", "batch_id", "vendor_name"),
+        Index("ix_invoices_batch_issued_on", "batch_id", "issued_on"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_id = Column(String(32), ForeignKey("invoice_batches.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    filename = Column(String(255), nullable=True)
+    invoice_number = Column(String(255), nullable=True)
+    vendor_name = Column(String(255), nullable=True)
+    invoice_date = Column(String(64), nullable=True)  # as extracted
+    issued_on = Column(Date, nullable=True)  # invoice_date parsed, for date range filters
+    due_date = Column(String(64), nullable=True)
+    subtotal = Column(Float, nullable=True)
+    tax_amount = Column(Float, nullable=True)
+    total_amount = Column(Float, nullable=True)
+    po_number = Column(String(255), nullable=True)
+    currency = Column(String(16), nullable=True)
+    payment_terms = Column(String(255), nullable=True)
+    vendor_address = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    duplicate_of = Column(String(255), nullable=True)  # filename of the earlier near-identical invoice
+
+    batch = relationship("InvoiceBatch", back_populates="invoices")
+    line_items = relationship(
+        "StoredLineItem",
+        back_populates="invoice",
+        order_by="StoredLineItem.position",
+        cascade="all, delete-orphan"
+    )
+
+
+class StoredLineItem(Base):
+    """One line item of a stored invoice"""
+
+    __tablename__ = "invoice_line_items"
+    __table_args__ = (
+        Index("ix_invoice_line_items_invoice_position", "invoice_id", "position"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    item_description = Column(Text, nullable=True)
+    category = Column(String(255), nullable=True)
+    quantity = Column(Float, nullable=True)
+    unit_price = Column(Float, nullable=True)
+    line_total = Column(Float, nullable=True)
+
+    invoice = relationship("StoredInvoice", back_populates="line_items")
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, Text
+
+from app.database import Base
+
+
+class InvoiceTemplate(Base):
+    """Learned layout of a recurring vendor's invoices"""
+
+    __tablename__ = "invoice_templates"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    vendor_name = Column(String(255), nullable=False, index=True)
+    fingerprint = Column(Text, nullable=False)  # JSON list of layout tokens
+    rules = Column(Text, nullable=False)  # JSON field anchors, table settings and constants
+    confirmations = Column(Integer, nullable=False, default=1)
+    uses = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
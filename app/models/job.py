@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, LargeBinary, String, Text
+from sqlalchemy.orm import relationship
+
+from app.database import Base
+
+
+class Job(Base):
+    """A batch of files submitted for background extraction"""
+
+    __tablename__ = "jobs"
+
+    id = Column(String(32), primary_key=True)
+    status = Column(String(20), nullable=False, default="pending", index=True)  # pending, running, completed, cancelled
+    total_files = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    files = relationship(
+        "JobFile",
+        back_populates="job",
+        order_by="JobFile.position",
+        cascade="all, delete-orphan"
+    )
+
+
+class JobFile(Base):
+    """One file of a job, with its processing state and result"""
+
+    __tablename__ = "job_files"
+    __table_args__ = (
+        Index("ix_job_files_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(32), ForeignKey("jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    filename = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed, cancelled
+    content = Column(LargeBinary, nullable=True)  # uploaded PDF, dropped once processed
+    result = Column(Text, nullable=True)  # JSON encoded invoice
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    job = relationship("Job", back_populates="files")
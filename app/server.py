@@ -0,0 +1,90 @@
+"""Production server: python -m app.server
+
+Pre-forks WEB_CONCURRENCY uvicorn worker processes sharing one socket, so
+throughput scales with cores (default: the container's CPU quota, at most 4). Each worker warms up (heavy imports, PDF parser
+processes, OpenAI client, database connection) in the lifespan hook before it
+accepts requests. On SIGTERM workers stop accepting connections, give open
+requests up to GRACEFUL_TIMEOUT seconds and then let background job files
+finish within JOB_DRAIN_TIMEOUT.
+
+Use `uvicorn app.main:app --reload` for development instead.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+MAX_DEFAULT_WORKERS = 4  # WEB_CONCURRENCY default is the CPU quota, capped at this
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))  # seconds for open requests on shutdown
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "5"))  # seconds an idle connection stays open
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: the cgroup quota if one is set, else the affinity mask.
+
+    os.cpu_count() reports the host's cores, which in a container limited to
+    a couple of CPUs would start far too many workers and pool processes.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            limit, period = f.read().split()[:2]
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:  # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+
+def main():
+    import uvicorn
+    from app.database import init_db
+
+    cpus = available_cpus()
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", str(min(cpus, MAX_DEFAULT_WORKERS)))))
+
+    # Create the tables once here; workers racing on CREATE TABLE would fail to start
+    init_db()
+
+    # Every web worker has its own PDF parser and OCR pools; share the cores
+    # between them unless the sizes are set explicitly (workers inherit the environment)
+    if "PDF_WORKERS" not in os.environ:
+        os.environ["PDF_WORKERS"] = str(max(1, cpus // workers))
+    if "OCR_WORKERS" not in os.environ:
+        os.environ["OCR_WORKERS"] = str(max(1, cpus // 2 // workers))
+
+    uvicorn.run(
+        "app.main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        log_level=LOG_LEVEL
+    )
+
+
+if __name__ == "__main__":
+    main()
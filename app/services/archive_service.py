@@ -0,0 +1,320 @@
+import hashlib
+import os
+import struct
+import tempfile
+import zlib
+from typing import AsyncIterator, Optional, Tuple, Union
+
+from app.services.upload_service import MAX_FILE_SIZE, UPLOAD_TMP_DIR, SpooledFile, UploadTooLargeError
+
+
+# Archive ingestion limits
+ZIP_MAX_FILES = int(os.getenv("ZIP_MAX_FILES", "10000"))
+# MB per archive upload, replacing MAX_REQUEST_SIZE for ZIP ingestion (0: no limit;
+# every entry is still held to MAX_FILE_SIZE)
+ZIP_MAX_SIZE = int(float(os.getenv("ZIP_MAX_SIZE", "0")) * 1024 * 1024)
+ZIP_READ_SIZE = 256 * 1024  # decompressed bytes produced per step
+
+LOCAL_FILE_HEADER = 0x04034B50
+DATA_DESCRIPTOR = 0x08074B50
+CENTRAL_DIRECTORY_HEADER = 0x02014B50
+END_OF_CENTRAL_DIRECTORY = 0x06054B50
+ZIP64_END_OF_CENTRAL_DIRECTORY = 0x06064B50
+
+STORED = 0
+DEFLATED = 8
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+
+
+class ArchiveError(Exception):
+    """Raised when the archive cannot be read any further"""
+
+
+class EntryError(Exception):
+    """One archive entry could not be extracted; the rest of the archive is still readable"""
+
+
+class _ChunkReader:
+    """Byte-exact reads over an async iterator of chunks"""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._buffer = bytearray()
+        self._eof = False
+        self.consumed = 0
+
+    async def _fill(self) -> bool:
+        if self._eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            return False
+        self._buffer += chunk
+        return True
+
+    async def read_exact(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            if not await self._fill():
+                raise ArchiveError("Archive ended unexpectedly")
+        return self._take(size)
+
+    async def read_some(self, limit: int) -> bytes:
+        """Up to limit buffered bytes, waiting for more only when the buffer is empty"""
+        if not self._buffer and not await self._fill():
+            raise ArchiveError("Archive ended unexpectedly")
+        return self._take(min(limit, len(self._buffer)))
+
+    def unread(self, data: bytes):
+        self._buffer[:0] = data
+        self.consumed -= len(data)
+
+    async def drain(self):
+        """Read and discard the rest of the stream (central directory)"""
+        self._buffer.clear()
+        while await self._fill():
+            self._buffer.clear()
+
+    def _take(self, size: int) -> bytes:
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.consumed += size
+        return data
+
+
+class ZipStreamReader:
+    """Reads a ZIP archive front to back from a stream, one entry at a time.
+
+    Uses the local file headers only, so nothing is buffered beyond the entry
+    being written: each PDF is decompressed straight into a temporary file
+    (hashed and size-checked like a regular upload) and handed over before
+    the next entry is read. Stored and deflated entries are supported,
+    including entries whose sizes follow in a data descriptor.
+    """
+
+    def __init__(self, max_file_size: int = MAX_FILE_SIZE, max_files: int = ZIP_MAX_FILES):
+        self.max_file_size = max_file_size
+        self.max_files = max_files
+
+    async def entries(
+        self, chunks: AsyncIterator[bytes]
+    ) -> AsyncIterator[Tuple[str, Union[SpooledFile, EntryError]]]:
+        """Yield (name, spooled PDF or EntryError) for every PDF in the archive.
+
+        Directories, macOS resource forks and non-PDF files are skipped. The
+        caller owns the yielded files and must clean them up.
+        """
+        reader = _ChunkReader(chunks)
+        count = 0
+        while True:
+            signature = struct.unpack("<I", await reader.read_exact(4))[0]
+            if signature in (CENTRAL_DIRECTORY_HEADER, END_OF_CENTRAL_DIRECTORY, ZIP64_END_OF_CENTRAL_DIRECTORY):
+                await reader.drain()
+                return
+            if signature != LOCAL_FILE_HEADER:
+                raise ArchiveError("Not a ZIP archive" if reader.consumed == 4 else "Corrupt ZIP archive")
+
+            (_, flags, method, _, _, crc, compressed_size, size,
+             name_length, extra_length) = struct.unpack("<HHHHHIIIHH", await reader.read_exact(26))
+            name = (await reader.read_exact(name_length)).decode("utf-8" if flags & 0x800 else "cp437", "replace")
+            extra = await reader.read_exact(extra_length)
+            compressed_size, size, zip64 = _zip64_sizes(extra, compressed_size, size)
+            has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+
+            wanted = _is_pdf(name)
+            if wanted:
+                count += 1
+                if count > self.max_files:
+                    raise ArchiveError(f"Archive has more than {self.max_files} PDF files")
+
+            error: Optional[EntryError] = None
+            if flags & FLAG_ENCRYPTED:
+                error = EntryError(f"{name} is encrypted")
+            elif method not in (STORED, DEFLATED):
+                error = EntryError(f"{name} uses unsupported compression method {method}")
+
+            if error is not None or not wanted:
+                if has_descriptor and not flags & FLAG_ENCRYPTED and method in (STORED, DEFLATED):
+                    # Read through without writing to find where the entry ends
+                    await self._copy(reader, name, method, compressed_size, has_descriptor, zip64, None)
+                elif has_descriptor and not compressed_size:
+                    raise ArchiveError(f"Cannot skip {name}: its size is only stored after the data")
+                else:
+                    await self._skip(reader, compressed_size)
+                if has_descriptor:
+                    await self._read_descriptor(reader, zip64)
+                if error is not None:
+                    yield name, error
+                continue
+
+            handle, path = tempfile.mkstemp(prefix="upload_", suffix=".pdf", dir=UPLOAD_TMP_DIR)
+            try:
+                with os.fdopen(handle, "wb") as out:
+                    written, digest, actual_crc = await self._copy(
+                        reader, name, method, compressed_size, has_descriptor, zip64, out
+                    )
+                if has_descriptor:
+                    crc = await self._read_descriptor(reader, zip64)
+            except BaseException:
+                os.remove(path)
+                raise
+
+            if isinstance(written, EntryError):
+                os.remove(path)
+                yield name, written
+            elif actual_crc != crc:
+                os.remove(path)
+                yield name, EntryError(f"{name} failed its CRC check")
+            else:
+                yield name, SpooledFile(name, path, written, digest)
+
+    async def _copy(
+        self, reader: _ChunkReader, name: str, method: int, compressed_size: int,
+        has_descriptor: bool, zip64: bool, out
+    ):
+        """Decompress one entry into out (or nowhere), returning (size or EntryError, sha256, crc32)"""
+        digest = hashlib.sha256()
+        crc = 0
+        written = 0
+        too_large = False
+
+        async for data in self._entry_data(reader, name, method, compressed_size, has_descriptor, zip64):
+            if out is None or too_large:
+                continue
+            written += len(data)
+            if written > self.max_file_size:
+                # Keep reading to find the next entry, but stop writing
+                too_large = True
+                continue
+            crc = zlib.crc32(data, crc)
+            digest.update(data)
+            out.write(data)
+
+        if too_large:
+            return EntryError(str(UploadTooLargeError(
+                f"File {name} exceeds the {self.max_file_size / (1024 * 1024):g}MB limit"
+            ))), None, None
+        return written, digest.hexdigest(), crc
+
+    async def _entry_data(
+        self, reader: _ChunkReader, name: str, method: int, compressed_size: int,
+        has_descriptor: bool, zip64: bool
+    ) -> AsyncIterator[bytes]:
+        """The decompressed data of one entry, leaving the reader at its data descriptor (if any)"""
+        if method == STORED:
+            if has_descriptor and not compressed_size:
+                async for data in self._stored_until_descriptor(reader, zip64):
+                    yield data
+                return
+            remaining = compressed_size
+            while remaining > 0:
+                data = await reader.read_some(min(ZIP_READ_SIZE, remaining))
+                remaining -= len(data)
+                yield data
+            return
+
+        # Without a descriptor the compressed size says where the entry ends;
+        # otherwise the end of the deflate stream does
+        decompressor = zlib.decompressobj(-15)
+        remaining = compressed_size
+        while not decompressor.eof:
+            if decompressor.unconsumed_tail:
+                raw = decompressor.unconsumed_tail
+            elif has_descriptor:
+                raw = await reader.read_some(ZIP_READ_SIZE)
+            elif remaining > 0:
+                raw = await reader.read_some(min(ZIP_READ_SIZE, remaining))
+                remaining -= len(raw)
+            else:
+                break
+            try:
+                yield decompressor.decompress(raw, ZIP_READ_SIZE)
+            except zlib.error:
+                raise ArchiveError(f"Corrupt compressed data in {name}")
+
+        if not decompressor.eof:
+            raise ArchiveError(f"Compressed data of {name} is truncated")
+        if decompressor.unused_data:
+            reader.unread(decompressor.unused_data)
+
+    @staticmethod
+    async def _stored_until_descriptor(reader: _ChunkReader, zip64: bool) -> AsyncIterator[bytes]:
+        """Data of a stored entry whose size only follows in the data descriptor.
+
+        Streaming writers (zipfile on a pipe, for one) produce these. The end is
+        the first descriptor signature followed by the CRC and size of all data
+        before it; a signature inside the data cannot match both by accident.
+        """
+        descriptor_size = 4 + (20 if zip64 else 12)
+        signature = struct.pack("<I", DATA_DESCRIPTOR)
+        pending = bytearray()
+        crc = 0
+        size = 0
+        while True:
+            pending += await reader.read_some(ZIP_READ_SIZE)
+            index = pending.find(signature)
+            while index != -1 and index + descriptor_size <= len(pending):
+                expected_crc = struct.unpack_from("<I", pending, index + 4)[0]
+                expected_size = struct.unpack_from("<Q" if zip64 else "<I", pending, index + 8)[0]
+                if size + index == expected_size and zlib.crc32(pending[:index], crc) == expected_crc:
+                    reader.unread(bytes(pending[index:]))
+                    yield bytes(pending[:index])
+                    return
+                index = pending.find(signature, index + 1)
+
+            # Everything before a possible (partial) signature is entry data
+            keep = index if index != -1 else max(0, len(pending) - 3)
+            if keep:
+                data = bytes(pending[:keep])
+                del pending[:keep]
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                yield data
+
+    @staticmethod
+    async def _skip(reader: _ChunkReader, size: int):
+        while size > 0:
+            size -= len(await reader.read_some(min(ZIP_READ_SIZE, size)))
+
+    @staticmethod
+    async def _read_descriptor(reader: _ChunkReader, zip64: bool) -> int:
+        """Read the data descriptor after an entry and return its CRC"""
+        head = await reader.read_exact(4)
+        if struct.unpack("<I", head)[0] != DATA_DESCRIPTOR:
+            reader.unread(head)  # the signature is optional
+        crc = struct.unpack("<I", await reader.read_exact(4))[0]
+        await reader.read_exact(16 if zip64 else 8)
+        return crc
+
+
+def _zip64_sizes(extra: bytes, compressed_size: int, size: int) -> Tuple[int, int, bool]:
+    """Sizes from the ZIP64 extra field when the header holds 0xFFFFFFFF placeholders"""
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, offset)
+        if header_id == 0x0001:
+            fields = extra[offset + 4:offset + 4 + length]
+            values = [struct.unpack_from("<Q", fields, i)[0] for i in range(0, len(fields) - 7, 8)]
+            if size == 0xFFFFFFFF and values:
+                size = values.pop(0)
+            if compressed_size == 0xFFFFFFFF and values:
+                compressed_size = values.pop(0)
+            return compressed_size, size, True
+        offset += 4 + length
+    return compressed_size, size, False
+
+
+def _is_pdf(name: str) -> bool:
+    base = os.path.basename(name)
+    return (
+        name.lower().endswith(".pdf")
+        and not name.startswith("__MACOSX/")
+        and not base.startswith("._")
+    )
+
+
+# Shared archive reader for the whole application
+zip_reader = ZipStreamReader()
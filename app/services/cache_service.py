@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_MB", "64")) * 1024 * 1024
+CACHE_TTL = int(os.getenv("CACHE_TTL", "86400"))  # seconds, in-memory tier
+CACHE_PERSISTENT = os.getenv("CACHE_PERSISTENT", "true").lower() == "true"
+CACHE_PERSISTENT_TTL = int(os.getenv("CACHE_PERSISTENT_TTL", str(30 * 86400)))  # seconds
+
+
+class ExtractionCache:
+    """Two-tier cache (in-memory LRU + database) for extraction results"""
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl: int = CACHE_TTL,
+        persistent: bool = CACHE_PERSISTENT,
+        persistent_ttl: int = CACHE_PERSISTENT_TTL
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persistent = persistent
+        self.persistent_ttl = persistent_ttl
+        # key -> (expires_at, size, encoded result)
+        self._entries: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        """SHA-256 of the raw PDF bytes"""
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, kind: str, prompt_version: str, model: str) -> str:
+        """Cache key for one extraction of one document"""
+        raw = "|".join([content_hash, kind, prompt_version, model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Look a result up in memory first, then in the database"""
+        encoded = self._get_memory(key)
+        if encoded is None and self.persistent:
+            encoded = await asyncio.to_thread(self._get_persistent, key)
+            if encoded is not None:
+                self._set_memory(key, encoded)
+
+        if encoded is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(encoded)
+
+    async def set(self, key: str, kind: str, value: Any):
+        """Store a result in both tiers"""
+        encoded = json.dumps(value)
+        self._set_memory(key, encoded)
+        if self.persistent:
+            await asyncio.to_thread(self._set_persistent, key, kind, encoded)
+
+    def clear(self):
+        """Drop the in-memory tier"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, size, encoded = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._size -= size
+                return None
+
+            self._entries.move_to_end(key)
+            return encoded
+
+    def _set_memory(self, key: str, encoded: str):
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+
+            self._entries[key] = (time.monotonic() + self.ttl, size, encoded)
+            self._size += size
+
+            # Evict least recently used entries until both limits hold
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def _get_persistent(self, key: str) -> Optional[str]:
+        from app.database import SessionLocal
+        from app.models import ExtractionCacheEntry
+
+        try:
+            db = SessionLocal()
+            try:
+                entry = db.get(ExtractionCacheEntry, key)
+                if entry is None:
+                    return None
+
+                if entry.created_at < datetime.utcnow() - timedelta(seconds=self.persistent_ttl):
+                    db.delete(entry)
+                    db.commit()
+                    return None
+
+                return entry.result
+            finally:
+                db.close()
+        except Exception as e:
+            logger.warning("Extraction cache lookup failed: %s", e)
+            return None
+
+    def _set_persistent(self, key: str, kind: str, encoded: str):
+        from sqlalchemy.exc import IntegrityError
+        from app.database import SessionLocal
+        from app.models import ExtractionCacheEntry
+
+        try:
+            db = SessionLocal()
+            try:
+                db.merge(ExtractionCacheEntry(
+                    cache_key=key,
+                    kind=kind,
+                    result=encoded,
+                    size_bytes=len(encoded),
+                    created_at=datetime.utcnow()
+                ))
+                db.commit()
+            except IntegrityError:
+                # A concurrent request stored the same document first
+                db.rollback()
+            finally:
+                db.close()
+        except Exception as e:
+            logger.warning("Extraction cache write failed: %s", e)
+
+
+# Shared cache for the whole application
+extraction_cache = ExtractionCache()
+
+registry.callback("extraction_cache_hits_total", "Extraction cache hits", lambda: extraction_cache.hits, type="counter")
+registry.callback("extraction_cache_misses_total", "Extraction cache misses", lambda: extraction_cache.misses, type="counter")
@@ -0,0 +1,184 @@
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+
+# Prompt budget per LLM call; longer documents are split into chunks of this size
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "6000"))
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+# Invoice summary fields that usually appear at the end of a document
+TRAILING_SUMMARY_FIELDS = ("subtotal", "tax_amount", "total_amount")
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character estimate
+    _ENCODING = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count of text (exact with tiktoken, ~4 characters per token otherwise)"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+class TextChunker:
+    """Splits document text into prompt-sized chunks along page and line boundaries"""
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS):
+        self.max_tokens = max(1, max_tokens)
+
+    def split(self, text: str, pages: Optional[List[str]] = None) -> List[str]:
+        """Return text unchanged when it fits, otherwise whole pages packed into chunks"""
+        if estimate_tokens(text) <= self.max_tokens:
+            return [text]
+
+        units: List[str] = []
+        for page in (pages if pages else [text]):
+            if not page:
+                continue
+            if estimate_tokens(page) <= self.max_tokens:
+                units.append(page)
+            else:
+                units.extend(self._split_oversized(page))
+
+        chunks: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+        for unit in units:
+            unit_tokens = estimate_tokens(unit)
+            if current and current_tokens + unit_tokens > self.max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(unit)
+            current_tokens += unit_tokens
+
+        if current:
+            chunks.append("\n".join(current))
+        return chunks or [text]
+
+    def _split_oversized(self, page: str) -> List[str]:
+        """Split a page that is too long on its own at line boundaries"""
+        pieces: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+
+        for line in page.split("\n"):
+            line_tokens = estimate_tokens(line)
+            if line_tokens > self.max_tokens:
+                # A single huge line: hard split by characters
+                step = max(1, len(line) * self.max_tokens // line_tokens)
+                if current:
+                    pieces.append("\n".join(current))
+                    current, current_tokens = [], 0
+                pieces.extend(line[i:i + step] for i in range(0, len(line), step))
+                continue
+
+            if current and current_tokens + line_tokens > self.max_tokens:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += line_tokens
+
+        if current:
+            pieces.append("\n".join(current))
+        return pieces
+
+
+def _is_empty(value: Any) -> bool:
+    """True for missing values and the placeholders the prompts use for them"""
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip() in ("", "N/A", "Unknown Vendor")
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return value == 0
+    if isinstance(value, (list, dict)):
+        return not value
+    return False
+
+
+def _dedupe(values: List[Any]) -> List[Any]:
+    seen = set()
+    unique = []
+    for value in values:
+        marker = json.dumps(value, sort_keys=True, default=str)
+        if marker not in seen:
+            seen.add(marker)
+            unique.append(value)
+    return unique
+
+
+def merge_structured(parts: List[Any]) -> Any:
+    """Merge per-chunk JSON results in chunk order.
+
+    Lists are concatenated and de-duplicated, objects are merged key by key
+    and for plain values the first non-empty one wins.
+    """
+    parts = [part for part in parts if not _is_empty(part)]
+    if not parts:
+        return {}
+
+    if all(isinstance(part, dict) for part in parts):
+        keys: List[str] = []
+        for part in parts:
+            keys.extend(key for key in part if key not in keys)
+        return {
+            key: merge_structured([part[key] for part in parts if key in part])
+            for key in keys
+        }
+
+    if all(isinstance(part, list) for part in parts):
+        return _dedupe([value for part in parts for value in part])
+
+    return parts[0]
+
+
+def merge_invoice_parts(parts: List[Dict[str, Any]], empty_summary: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge per-chunk invoice extractions into one invoice.
+
+    Header fields come from the first chunk that has them, totals from the last
+    one, and line items are concatenated in chunk order.
+    """
+    summary = dict(empty_summary)
+    for field in summary:
+        values = [
+            part["invoice_summary"].get(field)
+            for part in parts
+            if isinstance(part.get("invoice_summary"), dict)
+        ]
+        values = [value for value in values if not _is_empty(value)]
+        if values:
+            summary[field] = values[-1] if field in TRAILING_SUMMARY_FIELDS else values[0]
+
+    # Failed chunks carry placeholder items, so only successful chunks contribute
+    line_items = [
+        item
+        for part in parts
+        if "error" not in part and "extraction_note" not in part
+        for item in (part.get("line_items") or [])
+        if isinstance(item, dict)
+    ]
+
+    # Same rule as the single-call prompt: no visible items means one item for the total
+    if not line_items:
+        line_items = [{
+            "item_description": "Invoice total",
+            "quantity": 1,
+            "unit_price": summary.get("total_amount", 0),
+            "line_total": summary.get("total_amount", 0),
+            "category": "Unknown"
+        }]
+
+    merged = {"invoice_summary": summary, "line_items": line_items}
+    if any("extraction_note" in part or "error" in part for part in parts):
+        merged["extraction_note"] = "Partial extraction - please review"
+    return merged
@@ -0,0 +1,164 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.chunking_service import estimate_tokens
+from app.services.metrics import registry
+
+# Compaction of page text before it goes into prompts
+TEXT_COMPACTION = os.getenv("TEXT_COMPACTION", "true").lower() == "true"
+# Bump when compaction output changes so cached LLM results are not reused
+COMPACTION_VERSION = "2"
+
+# A line is a running header/footer when it appears on at least this share of pages
+REPEATED_LINE_SHARE = 0.5
+# Lines at the top and bottom of a page searched for running headers and footers
+EDGE_LINES = 3
+# Shortest run of lines without figures dropped as boilerplate after a terms heading
+BOILERPLATE_MIN_LINES = 4
+
+WHITESPACE = re.compile(r"[ \t\u00a0\u2000-\u200b]+")
+PAGE_NUMBER = re.compile(r"\bpage\s+\d+(\s*(of|/)\s*\d+)?\b|^\d+$|^-\s*\d+\s*-$", re.IGNORECASE)
+BOILERPLATE_HEADING = re.compile(
+    r"^(terms\s*(and|&)\s*conditions|general terms|standard terms|conditions of sale|"
+    r"terms of (sale|service|business)|legal notice|disclaimer|privacy (policy|notice))\b",
+    re.IGNORECASE
+)
+FIGURE = re.compile(r"\d")
+
+
+class TextCompactor:
+    """Removes text that costs tokens without informing the extraction.
+
+    - figure-free lines at the top or bottom of most pages (running headers,
+      footers, page numbers) are kept once, where they first appear
+    - runs of whitespace are collapsed and blank lines squeezed
+    - optionally, boilerplate blocks (terms and conditions and similar
+      headings followed by prose without figures) are dropped
+    """
+
+    def __init__(self, enabled: bool = TEXT_COMPACTION):
+        self.enabled = enabled
+        self.documents = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    @property
+    def version(self) -> str:
+        return COMPACTION_VERSION if self.enabled else "off"
+
+    def compact(self, pages: List[str], drop_boilerplate: bool = False) -> Tuple[List[str], Dict[str, Any]]:
+        """Return compacted page texts and token counts before and after"""
+        tokens_before = estimate_tokens("".join(text + "\n" for text in pages if text))
+        if not self.enabled:
+            return pages, self._stats(tokens_before, tokens_before, 0, 0)
+
+        page_lines = [
+            [WHITESPACE.sub(" ", line).strip() for line in page.split("\n")]
+            for page in pages
+        ]
+        repeated = self._repeated_lines(page_lines)
+
+        seen = set()
+        repeated_removed = 0
+        boilerplate_removed = 0
+        compacted = []
+        for lines in page_lines:
+            kept: List[str] = []
+            for line, key in zip(lines, _edge_keys(lines)):
+                if not line:
+                    if kept and kept[-1]:
+                        kept.append("")
+                    continue
+
+                if key is not None and key in repeated:
+                    if key in seen:
+                        repeated_removed += 1
+                        continue
+                    seen.add(key)
+                kept.append(line)
+
+            if drop_boilerplate:
+                kept, dropped = self._drop_boilerplate(kept)
+                boilerplate_removed += dropped
+
+            compacted.append("\n".join(kept).strip())
+
+        tokens_after = estimate_tokens("".join(text + "\n" for text in compacted if text))
+        self.documents += 1
+        self.tokens_before += tokens_before
+        self.tokens_after += tokens_after
+        return compacted, self._stats(tokens_before, tokens_after, repeated_removed, boilerplate_removed)
+
+    @staticmethod
+    def _repeated_lines(page_lines: List[List[str]]) -> set:
+        if len(page_lines) < 2:
+            return set()
+
+        counts = Counter()
+        for lines in page_lines:
+            counts.update({key for key in _edge_keys(lines) if key is not None})
+
+        min_pages = max(2, math.ceil(len(page_lines) * REPEATED_LINE_SHARE))
+        return {key for key, count in counts.items() if count >= min_pages}
+
+    @staticmethod
+    def _drop_boilerplate(lines: List[str]) -> Tuple[List[str], int]:
+        """Drop a terms-style heading and the figure-free prose that follows it"""
+        kept: List[str] = []
+        dropped = 0
+        index = 0
+        while index < len(lines):
+            if BOILERPLATE_HEADING.match(lines[index]):
+                end = index + 1
+                while end < len(lines) and not FIGURE.search(lines[end]):
+                    end += 1
+                if end - index >= BOILERPLATE_MIN_LINES:
+                    kept.append(f"[{lines[index]} omitted]")
+                    dropped += end - index
+                    index = end
+                    continue
+            kept.append(lines[index])
+            index += 1
+        return kept, dropped
+
+    @staticmethod
+    def _stats(tokens_before: int, tokens_after: int, repeated: int, boilerplate: int) -> Dict[str, Any]:
+        return {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved_pct": round(100 * (1 - tokens_after / tokens_before), 1) if tokens_before else 0.0,
+            "repeated_lines_removed": repeated,
+            "boilerplate_lines_removed": boilerplate
+        }
+
+
+def _edge_keys(lines: List[str]) -> List[Optional[str]]:
+    """Comparison keys for header/footer detection, None for lines that can never be dropped.
+
+    Only the first and last EDGE_LINES lines of a page are candidates, with
+    page numbers masked. Lines that still contain a figure after masking
+    (line items, totals, dates) are always kept, even when repeated.
+    """
+    content = [index for index, line in enumerate(lines) if line]
+    edges = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+    keys: List[Optional[str]] = []
+    for index, line in enumerate(lines):
+        key = PAGE_NUMBER.sub("#", line.lower()) if index in edges else None
+        keys.append(None if key is None or FIGURE.search(key) else key)
+    return keys
+
+
+# Shared compactor for the whole application
+text_compactor = TextCompactor()
+
+registry.callback(
+    "text_compaction_tokens_before_total", "Prompt tokens before text compaction",
+    lambda: text_compactor.tokens_before, type="counter"
+)
+registry.callback(
+    "text_compaction_tokens_after_total", "Prompt tokens after text compaction",
+    lambda: text_compactor.tokens_after, type="counter"
+)
@@ -0,0 +1,245 @@
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+# How /extract finds entities:
+#   local  - compiled patterns only; names/addresses come from the structured analysis
+#   hybrid - local patterns, plus the LLM when confidence is low or names are missing
+#   llm    - the previous full LLM extraction
+ENTITY_EXTRACTION_MODE = os.getenv("ENTITY_EXTRACTION_MODE", "hybrid")
+ENTITY_MIN_CONFIDENCE = float(os.getenv("ENTITY_MIN_CONFIDENCE", "0.5"))
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12
+}
+
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR"}
+
+_MONTH_NAME = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+
+DATE_PATTERNS = [
+    # 2024-01-31, 2024/01/31
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), "ymd"),
+    # 31/01/2024, 01-31-2024, 31.01.24
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{2,4})\b"), "dmy_or_mdy"),
+    # 31 January 2024, 31 Jan, 2024
+    (re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH_NAME}),?\s+(\d{{4}})\b", re.IGNORECASE), "d_month_y"),
+    # January 31, 2024
+    (re.compile(rf"\b({_MONTH_NAME})\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.IGNORECASE), "month_d_y"),
+]
+
+AMOUNT_PATTERN = re.compile(
+    r"(?P<prefix>[$€£¥₹]|\b(?:USD|EUR|GBP|CAD|AUD|JPY|INR|CHF)\b)\s?"
+    r"(?P<number>-?\d{1,3}(?:[,.\s]\d{3})*(?:[.,]\d{1,2})?|-?\d+(?:[.,]\d{1,2})?)"
+    r"|(?P<number2>-?\d{1,3}(?:,\d{3})*\.\d{2}|-?\d{1,3}(?:\.\d{3})*,\d{2}|-?\d+[.,]\d{2})(?!\d)\s?(?P<suffix>[$€£¥₹]|\b(?:USD|EUR|GBP|CAD|AUD|JPY|INR|CHF)\b)?",
+    re.IGNORECASE
+)
+
+# A label in front of a bare number (no currency) makes it an amount rather than a quantity or rate
+AMOUNT_LABEL_PATTERN = re.compile(
+    r"\b(?:total|sub-?total|amount|balance|due|tax|vat|gst|price|paid|payment|fee|charges?|cost|net|gross)\b"
+    r"[^\n\d]{0,20}$",
+    re.IGNORECASE
+)
+
+EMAIL_PATTERN = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+
+PHONE_PATTERN = re.compile(
+    r"(?<![\w.])(?:\+?\d{1,3}[\s.-]?)?(?:\(\d{2,4}\)|\d{2,4})[\s.-]?\d{3,4}[\s.-]?\d{3,4}(?![\w.])"
+)
+
+# A label in front of a number makes it a phone number rather than an id
+PHONE_LABEL_PATTERN = re.compile(r"(?:tel|phone|fax|mobile|cell|ph)\b\.?:?\s*$", re.IGNORECASE)
+
+
+class EntityExtractor:
+    """Deterministic extraction of dates, amounts, emails and phone numbers"""
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """Extract regular entities and a confidence score for the result"""
+        dates = self.extract_dates(text)
+        amounts = self.extract_amounts(text)
+        emails = self.extract_emails(text)
+        phone_numbers = self.extract_phone_numbers(text)
+
+        return {
+            "dates": dates,
+            "amounts": amounts,
+            "emails": emails,
+            "phone_numbers": phone_numbers,
+            "confidence": self._confidence(text, dates, amounts)
+        }
+
+    def extract_dates(self, text: str) -> List[str]:
+        """Dates normalised to YYYY-MM-DD, in order of appearance"""
+        found = []
+        for pattern, kind in DATE_PATTERNS:
+            for match in pattern.finditer(text):
+                normalized = self._normalize_date(match.groups(), kind)
+                if normalized:
+                    found.append((match.start(), normalized))
+
+        return _unique(value for _, value in sorted(found))
+
+    def extract_amounts(self, text: str) -> List[str]:
+        """Monetary amounts normalised to '<CURRENCY> <amount>' with two decimals"""
+        # Dotted dates (31.01.2024) would otherwise read as amounts
+        date_spans = [match.span() for pattern, _ in DATE_PATTERNS for match in pattern.finditer(text)]
+
+        amounts = []
+        for match in AMOUNT_PATTERN.finditer(text):
+            number = match.group("number") or match.group("number2")
+            marker = match.group("prefix") or match.group("suffix")
+            if any(start < match.end() and match.start() < end for start, end in date_spans):
+                continue
+
+            # Bare decimals are only amounts next to a label (Total: 120.00)
+            if not marker:
+                line_start = text.rfind("\n", 0, match.start()) + 1
+                if not AMOUNT_LABEL_PATTERN.search(text[line_start:match.start()]):
+                    continue
+
+            value = parse_number(number)
+            if value is None:
+                continue
+
+            currency = CURRENCY_SYMBOLS.get(marker, marker.upper()) if marker else None
+            amounts.append(f"{currency} {value:.2f}" if currency else f"{value:.2f}")
+
+        return _unique(amounts)
+
+    def extract_emails(self, text: str) -> List[str]:
+        return _unique(match.group(0).lower() for match in EMAIL_PATTERN.finditer(text))
+
+    def extract_phone_numbers(self, text: str) -> List[str]:
+        """Phone numbers with 7-15 digits, normalised to digits and a leading +"""
+        numbers = []
+        for match in PHONE_PATTERN.finditer(text):
+            raw = match.group(0)
+            digits = re.sub(r"\D", "", raw)
+            if not 7 <= len(digits) <= 15:
+                continue
+
+            # Bare digit runs are usually ids or amounts unless labelled as a phone
+            has_separators = bool(re.search(r"[\s().-]", raw.strip()))
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            labelled = bool(PHONE_LABEL_PATTERN.search(text[line_start:match.start()]))
+            if not (has_separators or labelled or raw.startswith("+")):
+                continue
+
+            # Skip dates that look like numbers (2024-01-31)
+            if re.fullmatch(r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}", raw.strip()):
+                continue
+
+            numbers.append(("+" if raw.strip().startswith("+") else "") + digits)
+
+        return _unique(numbers)
+
+    def _normalize_date(self, groups, kind: str) -> Optional[str]:
+        try:
+            if kind == "ymd":
+                year, month, day = int(groups[0]), int(groups[1]), int(groups[2])
+            elif kind == "dmy_or_mdy":
+                first, second, year = int(groups[0]), int(groups[1]), int(groups[2])
+                if year < 100:
+                    year += 2000
+                # Day-first unless that is impossible (US style 01/31/2024)
+                day, month = (first, second) if second <= 12 else (second, first)
+            elif kind == "d_month_y":
+                day, month, year = int(groups[0]), MONTHS[groups[1].lower()[:3]], int(groups[2])
+            else:
+                month, day, year = MONTHS[groups[0].lower()[:3]], int(groups[1]), int(groups[2])
+
+            return datetime(year, month, day).strftime("%Y-%m-%d")
+        except (KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _confidence(text: str, dates: List[str], amounts: List[str]) -> float:
+        """Rough confidence that the patterns captured the document's entities"""
+        if not text.strip():
+            return 0.0
+
+        score = 0.2
+        if dates:
+            score += 0.4
+        if amounts:
+            score += 0.4
+        return round(min(score, 1.0), 2)
+
+
+def parse_number(number: str) -> Optional[float]:
+    """Parse 1,234.56 / 1.234,56 / 1234,56 style numbers"""
+    cleaned = number.replace(" ", "")
+    if re.search(r",\d{1,2}$", cleaned) and "." in cleaned[:-3]:
+        cleaned = cleaned.replace(".", "").replace(",", ".")
+    elif re.search(r",\d{1,2}$", cleaned) and cleaned.count(",") == 1 and "." not in cleaned:
+        cleaned = cleaned.replace(",", ".")
+    else:
+        cleaned = cleaned.replace(",", "")
+
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """Amounts and quantities as floats, as stored and exported; 'N/A' and other text become None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return parse_number(value.strip().lstrip("$€£¥₹").strip()) if value.strip() else None
+    return None
+
+
+def entities_from_analysis(structured_data: Any) -> Dict[str, List[str]]:
+    """Names and addresses already present in the structured analysis"""
+    names: List[str] = []
+    addresses: List[str] = []
+    if not isinstance(structured_data, dict):
+        return {"names": names, "addresses": addresses}
+
+    def add(target: List[str], value: Any):
+        if isinstance(value, str) and value.strip() and value.strip() not in ("N/A", "Unknown"):
+            target.append(value.strip())
+        elif isinstance(value, list):
+            for entry in value:
+                add(target, entry)
+
+    entities = structured_data.get("entities")
+    if isinstance(entities, dict):
+        add(names, entities.get("people"))
+        add(names, entities.get("organizations"))
+        add(addresses, entities.get("locations"))
+
+    for party in ("vendor", "customer"):
+        details = structured_data.get(party)
+        if isinstance(details, dict):
+            add(names, details.get("name"))
+            add(addresses, details.get("address"))
+
+    parties = structured_data.get("parties")
+    if isinstance(parties, dict):
+        add(names, list(parties.values()))
+
+    return {"names": _unique(names), "addresses": _unique(addresses)}
+
+
+def _unique(values) -> List[Any]:
+    seen = set()
+    unique = []
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            unique.append(value)
+    return unique
+
+
+# Shared extractor (patterns are compiled once at import)
+entity_extractor = EntityExtractor()
@@ -1,8 +1,29 @@
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import io
 from datetime import datetime
 import os
+import tempfile
+
+
+# Column order of the Invoice Summary and Line Items sheets
+SUMMARY_COLUMNS = [
+    'filename', 'invoice_number', 'vendor_name', 'invoice_date', 
+    'due_date', 'subtotal', 'tax_amount', 'total_amount', 
+    'po_number', 'currency', 'payment_terms', 'vendor_address'
+]
+
+LINE_ITEM_COLUMNS = [
+    'filename', 'invoice_number', 'vendor_name', 'invoice_date',
+    'item_description', 'category', 'quantity', 'unit_price', 
+    'line_total'
+]
+
+# Columns coerced to numbers in typed (CSV/Parquet/Arrow) exports
+NUMERIC_COLUMNS = {'subtotal', 'tax_amount', 'total_amount', 'quantity', 'unit_price', 'line_total'}
+
+# Chunk size used when streaming a finished workbook to the client
+EXPORT_CHUNK_SIZE = 64 * 1024
 
 
 class ExcelService:
@@ -17,18 +38,10 @@ class ExcelService:
         line_items_data = []
         
         for invoice_data in invoice_data_list:
-            if 'invoice_summary' in invoice_data:
-                summary_data.append(invoice_data['invoice_summary'])
-            
-            if 'line_items' in invoice_data and invoice_data['line_items']:
-                for item in invoice_data['line_items']:
-                    # Add invoice info to each line item
-                    enhanced_item = item.copy()
-                    if 'invoice_summary' in invoice_data:
-                        enhanced_item['invoice_number'] = invoice_data['invoice_summary'].get('invoice_number', 'N/A')
-                        enhanced_item['vendor_name'] = invoice_data['invoice_summary'].get('vendor_name', 'Unknown')
-                        enhanced_item['invoice_date'] = invoice_data['invoice_summary'].get('invoice_date', 'N/A')
-                    line_items_data.append(enhanced_item)
+            summary, line_items = flatten_invoice(invoice_data)
+            if summary is not None:
+                summary_data.append(summary)
+            line_items_data.extend(line_items)
         
         # Create DataFrames
         summary_df = pd.DataFrame(summary_data) if summary_data else pd.DataFrame()
@@ -40,40 +53,28 @@ class ExcelService:
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             # Invoice Summary Sheet
             if not summary_df.empty:
-                # Reorder columns for better readability
-                summary_columns = [
-                    'filename', 'invoice_number', 'vendor_name', 'invoice_date', 
-                    'due_date', 'subtotal', 'tax_amount', 'total_amount', 
-                    'po_number', 'currency', 'payment_terms', 'vendor_address'
-                ]
-                
-                # Only include columns that exist
-                available_columns = [col for col in summary_columns if col in summary_df.columns]
+                # Reorder columns for better readability, only including columns that exist
+                available_columns = [col for col in SUMMARY_COLUMNS if col in summary_df.columns]
                 summary_df = summary_df[available_columns]
                 
                 summary_df.to_excel(writer, sheet_name='Invoice Summary', index=False)
                 
                 # Format the summary sheet
                 worksheet = writer.sheets['Invoice Summary']
+                _formulas_as_text(worksheet)
                 self._format_summary_sheet(worksheet, summary_df)
             
             # Line Items Sheet
             if not line_items_df.empty:
-                # Reorder columns for line items
-                line_item_columns = [
-                    'filename', 'invoice_number', 'vendor_name', 'invoice_date',
-                    'item_description', 'category', 'quantity', 'unit_price', 
-                    'line_total'
-                ]
-                
-                # Only include columns that exist
-                available_columns = [col for col in line_item_columns if col in line_items_df.columns]
+                # Reorder columns for line items, only including columns that exist
+                available_columns = [col for col in LINE_ITEM_COLUMNS if col in line_items_df.columns]
                 line_items_df = line_items_df[available_columns]
                 
                 line_items_df.to_excel(writer, sheet_name='Line Items', index=False)
                 
                 # Format the line items sheet
                 worksheet = writer.sheets['Line Items']
+                _formulas_as_text(worksheet)
                 self._format_line_items_sheet(worksheet, line_items_df)
             
             # Add summary statistics sheet
@@ -82,6 +83,74 @@ class ExcelService:
         output.seek(0)
         return output.getvalue()
     
+    def write_excel_streaming(self, invoice_data_list: Iterable[Dict[str, Any]], path: str):
+        """Write the invoice workbook row by row with xlsxwriter in constant_memory mode.
+        
+        Produces the same three sheets as create_excel_from_invoices, but rows go
+        straight from the invoice dicts to disk and column widths and summary
+        statistics are tracked while writing, so memory stays flat for any
+        number of invoices.
+        """
+        import xlsxwriter
+        
+        # Extracted text starting with '=' is written as text, never as a formula
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_formulas': False})
+        try:
+            summary_sheet = _StreamingSheet(workbook, 'Invoice Summary', SUMMARY_COLUMNS, '#366092', 50)
+            line_items_sheet = _StreamingSheet(workbook, 'Line Items', LINE_ITEM_COLUMNS, '#70AD47', 60)
+            stats = _ExportStats()
+            
+            for invoice_data in invoice_data_list:
+                summary, line_items = flatten_invoice(invoice_data)
+                if summary:
+                    summary_sheet.write_row(summary)
+                    stats.add_invoice(summary)
+                
+                for row in line_items:
+                    line_items_sheet.write_row(row)
+                    stats.add_line_item(row)
+            
+            summary_sheet.finish()
+            line_items_sheet.finish()
+            self._write_stats_sheet(workbook, stats)
+        finally:
+            workbook.close()
+    
+    def stream_excel(self, invoice_data_list: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        """Build the workbook in a temporary file and yield it in chunks"""
+        handle, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(handle)
+        try:
+            self.write_excel_streaming(invoice_data_list, path)
+        except Exception:
+            os.remove(path)
+            raise
+        return self._iter_file(path)
+    
+    def _iter_file(self, path: str) -> Iterator[bytes]:
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(EXPORT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            os.remove(path)
+    
+    def _write_stats_sheet(self, workbook, stats: '_ExportStats'):
+        """Summary statistics sheet for the streaming engine"""
+        worksheet = workbook.add_worksheet('Summary Stats')
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#C5504B', 'align': 'center'
+        })
+        
+        worksheet.set_column(0, 0, 25)
+        worksheet.set_column(1, 1, 20)
+        worksheet.write_row(0, 0, ['Metric', 'Value'], header_format)
+        for row_number, row in enumerate(stats.rows(), start=1):
+            worksheet.write_row(row_number, 0, row)
+    
     def _format_summary_sheet(self, worksheet, df):
         """Format the Invoice Summary sheet"""
         from openpyxl.styles import Font, PatternFill, Alignment
@@ -194,4 +263,113 @@ class ExcelService:
         
         # Make first column wider
         worksheet.column_dimensions['A'].width = 25
-        worksheet.column_dimensions['B'].width = 20 
\ No newline at end of file
+        worksheet.column_dimensions['B'].width = 20
+
+
+def flatten_invoice(invoice_data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Summary row and line item rows of one invoice; line items carry the invoice's number, vendor and date"""
+    summary = invoice_data.get('invoice_summary')
+    line_items = []
+    
+    for item in invoice_data.get('line_items') or []:
+        row = dict(item)
+        if summary:
+            row['invoice_number'] = summary.get('invoice_number', 'N/A')
+            row['vendor_name'] = summary.get('vendor_name', 'Unknown')
+            row['invoice_date'] = summary.get('invoice_date', 'N/A')
+        line_items.append(row)
+    
+    return summary, line_items
+
+
+class _StreamingSheet:
+    """Worksheet written in row order that tracks column widths as it goes"""
+    
+    def __init__(self, workbook, name: str, columns: List[str], header_color: str, max_width: int):
+        self.worksheet = workbook.add_worksheet(name)
+        self.columns = columns
+        self.max_width = max_width
+        self.widths = [len(column) for column in columns]
+        self.row_number = 1
+        
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': header_color, 'align': 'center'
+        })
+        self.worksheet.write_row(0, 0, columns, header_format)
+    
+    def write_row(self, record: Dict[str, Any]):
+        for column_number, column in enumerate(self.columns):
+            value = record.get(column)
+            if value is None:
+                continue
+            if isinstance(value, (dict, list)):
+                value = str(value)
+            
+            self.worksheet.write(self.row_number, column_number, value)
+            length = len(str(value))
+            if length > self.widths[column_number]:
+                self.widths[column_number] = length
+        self.row_number += 1
+    
+    def finish(self):
+        """Apply the column widths collected while writing"""
+        for column_number, width in enumerate(self.widths):
+            self.worksheet.set_column(column_number, column_number, min(width + 2, self.max_width))
+
+
+def _formulas_as_text(worksheet):
+    """Keep extracted text starting with '=' from being stored as an openpyxl formula"""
+    for row in worksheet.iter_rows():
+        for cell in row:
+            if cell.data_type == 'f':
+                cell.data_type = 's'
+
+
+class _ExportStats:
+    """Running totals for the Summary Stats sheet"""
+    
+    def __init__(self):
+        self.invoice_count = 0
+        self.total_amount = 0.0
+        self.vendors = set()
+        self.line_item_count = 0
+        self.categories: Dict[str, int] = {}
+    
+    def add_invoice(self, summary: Dict[str, Any]):
+        self.invoice_count += 1
+        try:
+            self.total_amount += float(summary.get('total_amount') or 0)
+        except (TypeError, ValueError):
+            pass
+        if summary.get('vendor_name') is not None:
+            self.vendors.add(summary['vendor_name'])
+    
+    def add_line_item(self, item: Dict[str, Any]):
+        self.line_item_count += 1
+        category = item.get('category')
+        if category is not None:
+            self.categories[category] = self.categories.get(category, 0) + 1
+    
+    def rows(self) -> List[List[Any]]:
+        rows = []
+        
+        if self.invoice_count:
+            rows.append(['Total Invoices Processed', self.invoice_count])
+            rows.append(['Total Amount (All Invoices)', f"${self.total_amount:,.2f}"])
+            rows.append(['Average Invoice Amount', f"${self.total_amount / self.invoice_count:,.2f}"])
+            rows.append(['Unique Vendors', len(self.vendors)])
+        
+        if self.line_item_count:
+            rows.append(['Total Line Items', self.line_item_count])
+            
+            if self.categories:
+                top_categories = sorted(self.categories.items(), key=lambda entry: -entry[1])[:5]
+                rows.append(['', ''])  # Empty row
+                rows.append(['Top Categories:', ''])
+                for category, count in top_categories:
+                    rows.append([f"  {category}", count])
+        
+        # Processing timestamp
+        rows.append(['', ''])
+        rows.append(['Processed On', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+        return rows
@@ -0,0 +1,169 @@
+import io
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List
+
+import pandas as pd
+
+from app.services.excel_service import (
+    EXPORT_CHUNK_SIZE, LINE_ITEM_COLUMNS, NUMERIC_COLUMNS, SUMMARY_COLUMNS, flatten_invoice
+)
+
+
+# Rows flattened, coerced and written per step of a streamed export
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# Number formats handled like entity_service.parse_amount
+LEADING_CURRENCY = r"^[$€£¥₹]\s*"
+DECIMAL_COMMA = r",\d{1,2}$"
+
+# line_items rows repeat the invoice number, vendor and date, so they load as one flat table
+EXPORT_TABLES = {
+    "line_items": LINE_ITEM_COLUMNS,
+    "summary": SUMMARY_COLUMNS,
+}
+
+class TabularExportService:
+    """CSV, Parquet and Arrow exports of the invoice summary or line item table.
+
+    Rows come from the same flattening as the Excel export and are processed
+    in chunks of EXPORT_CHUNK_ROWS: each chunk becomes a DataFrame whose
+    numeric columns are coerced in one vectorized step, then is written out,
+    so memory stays flat for any batch size and there is no row limit.
+    """
+
+    def __init__(self, chunk_rows: int = EXPORT_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+
+    def stream_csv(self, invoice_data_list: Iterable[Dict[str, Any]], table: str = "line_items") -> Iterator[bytes]:
+        """CSV with a header row, yielded chunk by chunk"""
+        header = True
+        for frame in self.iter_frames(invoice_data_list, table):
+            buffer = io.StringIO()
+            frame.to_csv(buffer, index=False, header=header)
+            header = False
+            yield buffer.getvalue().encode("utf-8")
+
+        if header:  # no rows at all
+            yield (",".join(EXPORT_TABLES[table]) + "\n").encode("utf-8")
+
+    def stream_arrow(self, invoice_data_list: Iterable[Dict[str, Any]], table: str = "line_items") -> Iterator[bytes]:
+        """Arrow IPC stream, one record batch per chunk"""
+        import pyarrow as pa
+
+        schema = self.schema(table)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for frame in self.iter_frames(invoice_data_list, table):
+                writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+                yield _drain(sink)
+        yield _drain(sink)
+
+    def stream_parquet(self, invoice_data_list: Iterable[Dict[str, Any]], table: str = "line_items") -> Iterator[bytes]:
+        """Write a Parquet file (one row group per chunk) to a temporary file and yield it in chunks"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self.schema(table)
+        handle, path = tempfile.mkstemp(suffix=".parquet")
+        os.close(handle)
+        try:
+            with pq.ParquetWriter(path, schema, compression="snappy") as writer:
+                for frame in self.iter_frames(invoice_data_list, table):
+                    writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+        except Exception:
+            os.remove(path)
+            raise
+        return _iter_file(path)
+
+    def iter_frames(self, invoice_data_list: Iterable[Dict[str, Any]], table: str) -> Iterator[pd.DataFrame]:
+        """Typed DataFrames of up to chunk_rows rows in the table's column order"""
+        columns = EXPORT_TABLES[table]
+        rows: List[Dict[str, Any]] = []
+        for invoice_data in invoice_data_list:
+            summary, line_items = flatten_invoice(invoice_data)
+            if table == "summary":
+                if summary:
+                    rows.append(summary)
+            else:
+                rows.extend(line_items)
+
+            if len(rows) >= self.chunk_rows:
+                yield self._frame(rows, columns)
+                rows = []
+
+        if rows:
+            yield self._frame(rows, columns)
+
+    def schema(self, table: str):
+        import pyarrow as pa
+
+        return pa.schema([
+            (column, pa.float64() if column in NUMERIC_COLUMNS else pa.string())
+            for column in EXPORT_TABLES[table]
+        ])
+
+    @staticmethod
+    def _frame(rows: List[Dict[str, Any]], columns: List[str]) -> pd.DataFrame:
+        frame = pd.DataFrame.from_records(rows, columns=columns)
+        for column in columns:
+            if column in NUMERIC_COLUMNS:
+                values = frame[column]
+                if not pd.api.types.is_numeric_dtype(values):
+                    values = _normalize_numbers(values)
+                frame[column] = pd.to_numeric(values, errors="coerce").astype("float64")
+            else:
+                # 'N/A' and friends stay as text; nested values are stringified like in Excel
+                frame[column] = frame[column].map(_text, na_action="ignore").astype(object)
+        return frame
+
+
+def _normalize_numbers(values: pd.Series) -> pd.Series:
+    """Vectorized entity_service.parse_amount: strip currency and thousands separators.
+
+    1,234.56 / 1.234,56 / 1234,56 all become 1234.56, so exports agree with
+    the stored amounts; anything else is left for to_numeric to coerce.
+    """
+    text = values.astype("string").str.strip().str.replace(LEADING_CURRENCY, "", regex=True)
+    text = text.str.replace(" ", "", regex=False)
+    decimal_comma = text.str.contains(DECIMAL_COMMA, regex=True)
+    has_dot = text.str.slice(stop=-3).str.contains(".", regex=False)
+    european = decimal_comma & has_dot
+    comma_only = decimal_comma & (text.str.count(",") == 1) & ~text.str.contains(".", regex=False)
+
+    return text.where(
+        ~european, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    ).where(
+        ~comma_only, text.str.replace(",", ".", regex=False)
+    ).where(
+        european | comma_only, text.str.replace(",", "", regex=False)
+    )
+
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else str(value)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def _iter_file(path: str) -> Iterator[bytes]:
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,558 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from fastapi import UploadFile
+
+from app.services.cache_service import ExtractionCache, extraction_cache
+from app.services.compaction_service import TextCompactor, text_compactor
+from app.services.metrics import registry, stage
+from app.services.entity_service import (
+    ENTITY_EXTRACTION_MODE, ENTITY_MIN_CONFIDENCE, EntityExtractor, entities_from_analysis, entity_extractor
+)
+from app.services.near_duplicate_service import NearDuplicateIndex, confirms_duplicate, near_duplicate_index
+from app.services.ocr_service import OCRService, ocr_service
+from app.services.openai_service import OpenAIService, PROMPT_VERSIONS
+from app.services.pdf_service import PDFService, pdf_service
+from app.services.rate_limiter import PRIORITY_BULK, request_priority
+from app.services.singleflight import SingleFlight
+from app.services.template_service import TemplateService, template_service
+from app.services.upload_service import SpooledFile, UploadService, upload_service
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of invoices extracted at the same time within one batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# How /extract runs its three LLM calls: one after another, concurrently,
+# or merged into a single structured completion
+ANALYSIS_MODES = ("sequential", "parallel", "combined")
+DEFAULT_ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "parallel")
+
+# In-flight extractions shared by every request in this process
+extraction_flights = SingleFlight()
+
+# Version of the cached page texts; bump when PDF text extraction changes
+PAGES_CACHE_VERSION = "2"
+
+
+class ExtractionService:
+    def __init__(
+        self,
+        ai_service: OpenAIService,
+        concurrency: int = BATCH_CONCURRENCY,
+        pdf: PDFService = pdf_service,
+        cache: ExtractionCache = extraction_cache,
+        uploads: UploadService = upload_service,
+        entities: EntityExtractor = entity_extractor,
+        entity_mode: str = ENTITY_EXTRACTION_MODE,
+        templates: TemplateService = template_service,
+        flights: SingleFlight = extraction_flights,
+        compactor: TextCompactor = text_compactor,
+        ocr: OCRService = ocr_service,
+        duplicates: NearDuplicateIndex = near_duplicate_index
+    ):
+        self.ai_service = ai_service
+        self.pdf = pdf
+        self.cache = cache
+        self.uploads = uploads
+        self.entities = entities
+        self.entity_mode = entity_mode
+        self.templates = templates
+        self.flights = flights
+        self.compactor = compactor
+        self.ocr = ocr
+        self.duplicates = duplicates
+        self.concurrency = max(1, concurrency)
+
+    async def extract_invoices(self, files: List[UploadFile]) -> List[Dict[str, Any]]:
+        """Extract a batch of invoices concurrently, keeping results in input order"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return list(await asyncio.gather(*(self._extract_upload(file, semaphore) for file in files)))
+
+    async def iter_invoices(self, files: List[UploadFile]) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Yield (input index, invoice) pairs as soon as each file finishes"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(index: int, file: UploadFile) -> Tuple[int, Dict[str, Any]]:
+            return index, await self._extract_upload(file, semaphore)
+
+        tasks = [asyncio.create_task(run(index, file)) for index, file in enumerate(files)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding work if the consumer goes away (client disconnect)
+            for task in tasks:
+                task.cancel()
+
+    async def iter_documents(
+        self, documents: AsyncIterator[Tuple[str, Union[SpooledFile, Exception]]]
+    ) -> AsyncIterator[Tuple[int, str, Dict[str, Any]]]:
+        """Extract documents as a source produces them, yielding (arrival index, name, invoice).
+
+        The source is only asked for its next document once one of the
+        concurrency slots is free, so a slow extraction slows down reading the
+        source (an upload stream) instead of piling up files. Exceptions the
+        source yields in place of a document become error records; one it
+        raises ends the stream after the documents already read have finished.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        in_flight: Dict[asyncio.Task, SpooledFile] = {}
+
+        async def run(index: int, name: str, document: SpooledFile):
+            request_priority.set(PRIORITY_BULK)
+            try:
+                invoice = await self.extract_invoice(document)
+            finally:
+                document.cleanup()
+                semaphore.release()
+            results.put_nowait((index, name, invoice))
+
+        async def feed():
+            source = documents.__aiter__()
+            index = 0
+            try:
+                while True:
+                    await semaphore.acquire()
+                    try:
+                        name, document = await source.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    if isinstance(document, Exception):
+                        semaphore.release()
+                        results.put_nowait((index, name, self._error_record(name, document)))
+                    else:
+                        task = asyncio.create_task(run(index, name, document))
+                        in_flight[task] = document
+                        task.add_done_callback(lambda done: in_flight.pop(done, None))
+                    index += 1
+            finally:
+                if in_flight:
+                    await asyncio.wait(list(in_flight))
+                results.put_nowait(None)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while True:
+                result = await results.get()
+                if result is None:
+                    break
+                yield result
+            await feeder  # re-raises a source error
+        finally:
+            # Stop outstanding work if the consumer goes away (client disconnect)
+            feeder.cancel()
+            for task, document in list(in_flight.items()):
+                task.cancel()
+                document.cleanup()  # a task cancelled before it started never cleans up
+
+    async def _extract_upload(self, file: UploadFile, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        # Runs in its own task, so this only lowers the priority of this file's LLM calls
+        request_priority.set(PRIORITY_BULK)
+        async with semaphore:
+            filename = file.filename or "unknown_file.pdf"
+            try:
+                document = await self.uploads.spool(file)
+            except Exception as e:
+                return self._error_record(filename, e)
+
+            try:
+                return await self.extract_invoice(document)
+            finally:
+                document.cleanup()
+
+    async def extract_invoice(self, document: SpooledFile) -> Dict[str, Any]:
+        """Extract structured invoice data from a single PDF for Excel export"""
+        filename = document.filename
+        try:
+            key = self._cache_key(document.sha256, "invoice_excel")
+
+            cached = await self.cache.get(key)
+            if cached is not None:
+                # A resend of a document extracted before is an exact duplicate of it
+                earlier = await self.duplicates.earlier_copy(document.sha256) if self.duplicates.enabled else None
+                return self._with_filename(self._as_duplicate(cached, earlier), filename)
+
+            # Identical PDFs extracted at the same time share one extraction;
+            # every caller but the first gets it as a duplicate of the first
+            joined = self.flights.running(key)
+            invoice_data = await self.flights.do(
+                key, lambda: self._extract_invoice(document.link(), key)
+            )
+            if joined and self.duplicates.enabled:
+                summary = invoice_data.get("invoice_summary") or {}
+                invoice_data = self._as_duplicate(invoice_data, {
+                    "filename": summary.get("filename"), "content_hash": document.sha256, "similarity": 1.0
+                })
+            return self._with_filename(invoice_data, filename)
+        except Exception as e:
+            return self._error_record(filename, e)
+
+    async def _extract_invoice(self, document: SpooledFile, key: str) -> Dict[str, Any]:
+        """Parse and extract one invoice; document is a link owned by this call"""
+        filename = document.filename
+        try:
+            parsed = await self.pdf.extract_pages(document.path, layout=self.templates.enabled)
+            parsed = await self.ocr.fill_blank_pages(document.path, parsed)
+        finally:
+            document.cleanup()
+
+        pages, compaction = self._compact(filename, parsed["pages"], drop_boilerplate=True)
+        full_text = self.pdf.join_pages(pages)
+
+        # A resent copy of an earlier invoice (new timestamp, reminder stamp)
+        # reuses that invoice's extraction. The signature leaves out boilerplate
+        # shared by every invoice of a vendor.
+        signature = None
+        if self.duplicates.enabled:
+            with stage("near_duplicate"):
+                signature = await asyncio.to_thread(self.duplicates.signature, full_text)
+                earlier = await self._near_duplicate(signature, full_text) if signature else None
+            if earlier is not None:
+                await self.cache.set(key, "invoice_excel", earlier)
+                return earlier
+
+        layout = parsed.get("layout")
+        empty_summary = self.ai_service._get_empty_invoice_summary(filename)
+
+        # Known vendor layouts are read directly, without an LLM call
+        if layout is not None:
+            with stage("template"):
+                invoice_data = await self.templates.apply(layout, empty_summary)
+            if invoice_data is not None:
+                return invoice_data
+
+        invoice_data = await self.ai_service.extract_invoice_for_excel(full_text, filename, pages)
+        invoice_data["text_compaction"] = compaction
+
+        if self._is_cacheable(invoice_data):
+            await self.cache.set(key, "invoice_excel", invoice_data)
+            if self.duplicates.enabled:
+                await self.duplicates.add(document.sha256, key, filename, signature)
+            if layout is not None:
+                await self.templates.learn(layout, invoice_data, empty_summary)
+        return invoice_data
+
+    async def _near_duplicate(self, signature: List[int], text: str) -> Optional[Dict[str, Any]]:
+        """The cached extraction of an earlier near-identical document, flagged as a duplicate"""
+        match = await self.duplicates.find(signature)
+        if match is None:
+            return None
+
+        invoice_data = await self.cache.get(match["cache_key"])
+        if invoice_data is None:
+            return None  # evicted, or cached under an older prompt version
+        if not confirms_duplicate(invoice_data, text):
+            logger.info(
+                "Document resembles %s (%.3f) but lacks its invoice number or total; extracting it",
+                match["filename"], match["similarity"]
+            )
+            return None
+
+        invoice_data["duplicate_of"] = {
+            "filename": match["filename"],
+            "content_hash": match["content_hash"],
+            "similarity": match["similarity"]
+        }
+        return invoice_data
+
+    async def analyze_document(
+        self,
+        document: SpooledFile,
+        extraction_type: str,
+        analysis_mode: str = DEFAULT_ANALYSIS_MODE,
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Full AI analysis of a single PDF (structured data, summary, entities)
+
+        on_event is called with progress events while the analysis runs: a
+        metadata event once the PDF is parsed, summary_delta and analysis_delta
+        events with the model's text as it streams in, and summary, analysis
+        and entities events as each result is ready.
+        """
+        if analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode '{analysis_mode}'. Use one of: {', '.join(ANALYSIS_MODES)}")
+
+        content_hash = document.sha256
+        timings: Dict[str, float] = {}
+
+        parsed = await self._timed("pdf_parse", timings, self._cached(
+            self.cache.make_key(content_hash, "pages", PAGES_CACHE_VERSION, "pdfplumber"),
+            "pages",
+            lambda: self._extract_pages(document.link())
+        ))
+        emit = on_event or _ignore_event
+        await emit({
+            "event": "metadata",
+            "filename": document.filename,
+            "file_size": document.size,
+            "page_count": parsed["page_count"],
+            "extraction_type": extraction_type,
+            "analysis_mode": analysis_mode
+        })
+
+        raw_text = self.pdf.join_pages(parsed["pages"])
+        pages, compaction = await self._timed("compaction", timings, asyncio.to_thread(
+            self._compact, document.filename, parsed["pages"], extraction_type == "invoice"
+        ))
+        full_text = self.pdf.join_pages(pages)
+
+        start_time = time.time()
+
+        if analysis_mode == "combined":
+            structured_data, ai_summary, entities = await self._analyze_combined(
+                full_text, pages, content_hash, extraction_type, timings
+            )
+            await emit({"event": "analysis", "structured_data": structured_data})
+            await emit({"event": "summary", "summary": ai_summary})
+            await emit({"event": "entities", "entities": entities})
+        else:
+            calls = [
+                self._reported(emit, "analysis", "structured_data", self._timed("analysis", timings, self._cached(
+                    self._cache_key(content_hash, "analysis", extraction_type),
+                    "analysis",
+                    lambda: self.ai_service.analyze_pdf_content(
+                        full_text, extraction_type, pages, on_delta=_deltas(on_event, "analysis_delta")
+                    )
+                ))),
+                self._reported(emit, "summary", "summary", self._timed("summary", timings, self._cached(
+                    self._cache_key(content_hash, "summary", extraction_type),
+                    "summary",
+                    lambda: self.ai_service.generate_summary(
+                        full_text, extraction_type, pages, on_delta=_deltas(on_event, "summary_delta")
+                    ),
+                    cacheable=lambda summary: not summary.startswith("Could not generate summary")
+                )))
+            ]
+            if self.entity_mode == "llm":
+                calls.append(self._reported(emit, "entities", "entities", self._timed(
+                    "entities", timings, self._llm_entities(full_text, pages, content_hash)
+                )))
+
+            if analysis_mode == "parallel":
+                results = await asyncio.gather(*calls)
+            else:
+                results = [await call for call in calls]
+
+            structured_data, ai_summary = results[0], results[1]
+            if self.entity_mode == "llm":
+                entities = results[2]
+            else:
+                entities = await self._timed("entities", timings, self._local_entities(
+                    raw_text, full_text, pages, content_hash, structured_data
+                ))
+                await emit({"event": "entities", "entities": entities})
+
+        timings["llm_total"] = self._elapsed_ms(start_time)
+        processing_time = f"{time.time() - start_time:.1f} seconds"
+
+        return {
+            "filename": document.filename,
+            "file_size": document.size,
+            "extraction_type": extraction_type,
+            "page_count": parsed["page_count"],
+            "processing_time": processing_time,
+            "analysis_mode": analysis_mode,
+            "timings_ms": timings,
+            "text_compaction": compaction,
+            "structured_data": structured_data,
+            "raw_text": raw_text[:3000] + "..." if len(raw_text) > 3000 else raw_text,
+            "ai_summary": ai_summary,
+            "extracted_entities": entities
+        }
+
+    async def _analyze_combined(
+        self,
+        full_text: str,
+        pages: List[str],
+        content_hash: str,
+        extraction_type: str,
+        timings: Dict[str, float]
+    ) -> Tuple[Any, str, Any]:
+        """Run the single-request analysis and split it into the three results"""
+        combined = await self._timed("combined", timings, self._cached(
+            self._cache_key(content_hash, "combined", extraction_type),
+            "combined",
+            lambda: self.ai_service.analyze_combined(full_text, extraction_type, pages)
+        ))
+
+        if "error" in combined:
+            return combined, f"Could not generate summary: {combined['error']}", combined
+
+        return combined["structured_data"], combined["summary"], combined["entities"]
+
+    async def _local_entities(
+        self,
+        raw_text: str,
+        full_text: str,
+        pages: List[str],
+        content_hash: str,
+        structured_data: Any
+    ) -> Dict[str, Any]:
+        """Regular entities from patterns, names and addresses from the analysis.
+
+        In hybrid mode the LLM is only asked when the patterns found little or
+        the analysis named nobody; its regular fields are replaced by the local ones.
+        """
+        local = self.entities.extract(raw_text)
+        confidence = local.pop("confidence")
+        named = entities_from_analysis(structured_data)
+
+        if self.entity_mode == "hybrid" and (confidence < ENTITY_MIN_CONFIDENCE or not named["names"]):
+            llm_entities = await self._llm_entities(full_text, pages, content_hash)
+            if isinstance(llm_entities, dict) and "error" not in llm_entities:
+                for field in ("names", "addresses"):
+                    if isinstance(llm_entities.get(field), list):
+                        named[field] = llm_entities[field]
+                return {**local, **named, "source": "hybrid", "confidence": confidence}
+
+        return {**local, **named, "source": "local", "confidence": confidence}
+
+    def _compact(self, filename: str, pages: List[str], drop_boilerplate: bool) -> Tuple[List[str], Dict[str, Any]]:
+        """Compact page texts for the prompts and log the token savings"""
+        with stage("compaction"):
+            pages, stats = self.compactor.compact(pages, drop_boilerplate=drop_boilerplate)
+        logger.info(
+            "Compacted %s: %d -> %d tokens (%.1f%% saved)",
+            filename, stats["tokens_before"], stats["tokens_after"], stats["tokens_saved_pct"]
+        )
+        return pages, stats
+
+    def _llm_entities(self, full_text: str, pages: List[str], content_hash: str) -> Awaitable[Any]:
+        return self._cached(
+            self._cache_key(content_hash, "entities"),
+            "entities",
+            lambda: self.ai_service.extract_entities(full_text, pages)
+        )
+
+    @staticmethod
+    async def _reported(
+        emit: Callable[[Dict[str, Any]], Awaitable[None]], event: str, field: str, awaitable: Awaitable[Any]
+    ) -> Any:
+        """Await a step and report its result as an event"""
+        result = await awaitable
+        await emit({"event": event, field: result})
+        return result
+
+    async def _timed(self, name: str, timings: Dict[str, float], awaitable: Awaitable[Any]) -> Any:
+        """Await a step and record its wall time in milliseconds"""
+        start_time = time.time()
+        try:
+            return await awaitable
+        finally:
+            timings[name] = self._elapsed_ms(start_time)
+
+    @staticmethod
+    def _elapsed_ms(start_time: float) -> float:
+        return round((time.time() - start_time) * 1000, 1)
+
+    async def _cached(
+        self,
+        key: str,
+        kind: str,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """Return the cached value for key, computing and storing it on a miss.
+
+        Concurrent misses for the same key share a single computation.
+        """
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        return await self.flights.do(key, lambda: self._compute_and_store(key, kind, compute(), cacheable))
+
+    async def _compute_and_store(
+        self,
+        key: str,
+        kind: str,
+        pending: Awaitable[Any],
+        cacheable: Optional[Callable[[Any], bool]]
+    ) -> Any:
+        value = await pending
+        if (cacheable or self._is_cacheable)(value):
+            await self.cache.set(key, kind, value)
+        return value
+
+    async def _extract_pages(self, document: SpooledFile) -> Dict[str, Any]:
+        """Parse page texts, OCRing pages without text; document is a link owned by this call"""
+        try:
+            parsed = await self.pdf.extract_pages(document.path)
+            return await self.ocr.fill_blank_pages(document.path, parsed)
+        finally:
+            document.cleanup()
+
+    def _cache_key(self, content_hash: str, kind: str, variant: str = "") -> str:
+        """Cache key for an LLM extraction, tied to its prompt version, text compaction and models"""
+        return self.cache.make_key(
+            content_hash,
+            f"{kind}:{variant}" if variant else kind,
+            f"{PROMPT_VERSIONS[kind]}+{self.compactor.version}",
+            self.ai_service.router.version
+        )
+
+    @staticmethod
+    def _is_cacheable(value: Any) -> bool:
+        """Errors and partial extractions are retried next time, not cached"""
+        if isinstance(value, dict):
+            return "error" not in value and "extraction_note" not in value
+        return True
+
+    @staticmethod
+    def _as_duplicate(invoice_data: Dict[str, Any], earlier: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Flag an invoice as a copy of an earlier document (keeping a near-duplicate flag it already has)"""
+        if earlier is not None and not invoice_data.get("duplicate_of") and not invoice_data.get("error"):
+            invoice_data["duplicate_of"] = {
+                "filename": earlier["filename"],
+                "content_hash": earlier["content_hash"],
+                "similarity": earlier["similarity"]
+            }
+        return invoice_data
+
+    @staticmethod
+    def _with_filename(invoice_data: Dict[str, Any], filename: str) -> Dict[str, Any]:
+        """Stamp the current upload's filename onto a cached invoice"""
+        if isinstance(invoice_data.get('invoice_summary'), dict):
+            invoice_data['invoice_summary']['filename'] = filename
+
+        for item in invoice_data.get('line_items') or []:
+            item['filename'] = filename
+
+        return invoice_data
+
+    def _error_record(self, filename: str, error: Exception) -> Dict[str, Any]:
+        """Error record for a file that could not be processed"""
+        return {
+            "error": f"Failed to process {filename}: {str(error)}",
+            "invoice_summary": self.ai_service._get_empty_invoice_summary(filename),
+            "line_items": []
+        }
+
+
+async def _ignore_event(event: Dict[str, Any]):
+    pass
+
+
+def _deltas(
+    on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]], event: str
+) -> Optional[Callable[[str], Awaitable[None]]]:
+    """Stream callback reporting each piece of model output as an event, or None to not stream"""
+    if on_event is None:
+        return None
+    return lambda text: on_event({"event": event, "text": text})
+
+
+registry.callback(
+    "extraction_coalesced_total", "Requests that joined an identical in-flight extraction",
+    lambda: extraction_flights.coalesced, type="counter"
+)
+registry.callback(
+    "extraction_in_flight", "Distinct extraction steps currently running",
+    lambda: extraction_flights.in_flight
+)
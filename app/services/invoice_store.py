@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import insert, select
+
+from app.database import SessionLocal
+from app.models import InvoiceBatch, StoredInvoice, StoredLineItem
+from app.services.entity_service import entity_extractor, parse_amount
+
+
+logger = logging.getLogger(__name__)
+
+# Invoices read per query while streaming an export
+INVOICE_EXPORT_PAGE_SIZE = int(os.getenv("INVOICE_EXPORT_PAGE_SIZE", "200"))
+
+TEXT_FIELDS = (
+    "filename", "invoice_number", "vendor_name", "invoice_date", "due_date",
+    "po_number", "currency", "payment_terms", "vendor_address"
+)
+AMOUNT_FIELDS = ("subtotal", "tax_amount", "total_amount")
+LINE_ITEM_TEXT_FIELDS = ("item_description", "category")
+LINE_ITEM_NUMBER_FIELDS = ("quantity", "unit_price", "line_total")
+
+
+class BatchNotFoundError(Exception):
+    """Raised when a batch id does not exist"""
+
+
+class InvoiceStore:
+    """Extracted invoices and line items, stored per batch for server-side export"""
+
+    def __init__(self, page_size: int = INVOICE_EXPORT_PAGE_SIZE):
+        self.page_size = page_size
+
+    async def create_batch(self) -> str:
+        return await asyncio.to_thread(self._create_batch)
+
+    async def add_invoices(self, batch_id: str, invoices: Dict[int, Dict[str, Any]]):
+        """Store invoices under their position in the batch"""
+        await asyncio.to_thread(self._add_invoices, batch_id, invoices)
+
+    async def save_batch(self, invoices: List[Dict[str, Any]]) -> str:
+        """Store a finished batch and return its id"""
+        batch_id = await self.create_batch()
+        await self.add_invoices(batch_id, dict(enumerate(invoices)))
+        return batch_id
+
+    async def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._get_batch, batch_id)
+
+    def iter_invoices(
+        self,
+        batch_id: str,
+        vendor: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        drop_duplicates: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """Invoices of a batch in the batch-extract response shape, read page by page.
+
+        Blocking; meant to be consumed by the Excel writer in a worker thread,
+        so only one page of invoices is in memory at a time. drop_duplicates
+        leaves out invoices flagged as near-duplicates of an earlier one.
+        """
+        db = SessionLocal()
+        try:
+            if db.get(InvoiceBatch, batch_id) is None:
+                raise BatchNotFoundError(f"Batch {batch_id} not found")
+
+            query = select(StoredInvoice).where(StoredInvoice.batch_id == batch_id)
+            if vendor:
+                query = query.where(StoredInvoice.vendor_name.ilike(f"%{_escape_like(vendor)}%", escape="\\"))
+            if date_from:
+                query = query.where(StoredInvoice.issued_on >= date_from)
+            if date_to:
+                query = query.where(StoredInvoice.issued_on <= date_to)
+            if drop_duplicates:
+                query = query.where(StoredInvoice.duplicate_of.is_(None))
+
+            last_position = -1
+            while True:
+                page = db.scalars(
+                    query.where(StoredInvoice.position > last_position)
+                    .order_by(StoredInvoice.position)
+                    .limit(self.page_size)
+                ).all()
+                if not page:
+                    return
+
+                items = self._line_items(db, [invoice.id for invoice in page])
+                for invoice in page:
+                    yield self._to_dict(invoice, items.get(invoice.id, []))
+                last_position = page[-1].position
+                db.expunge_all()
+        finally:
+            db.close()
+
+    # Database operations (run in a thread)
+
+    def _create_batch(self) -> str:
+        db = SessionLocal()
+        try:
+            batch = InvoiceBatch(id=uuid.uuid4().hex, invoice_count=0)
+            db.add(batch)
+            db.commit()
+            return batch.id
+        finally:
+            db.close()
+
+    def _add_invoices(self, batch_id: str, invoices: Dict[int, Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            stored = 0
+            line_items = []
+            for position, invoice in invoices.items():
+                summary = invoice.get("invoice_summary")
+                if not isinstance(summary, dict):
+                    continue
+
+                row = StoredInvoice(batch_id=batch_id, position=position, **self._summary_columns(summary))
+                row.error = invoice.get("error")
+                duplicate_of = invoice.get("duplicate_of")
+                if isinstance(duplicate_of, dict):
+                    row.duplicate_of = _text(duplicate_of.get("filename") or duplicate_of.get("content_hash"))
+                db.add(row)
+                db.flush()
+                stored += 1
+
+                for item_position, item in enumerate(invoice.get("line_items") or []):
+                    if isinstance(item, dict):
+                        line_items.append({
+                            "invoice_id": row.id,
+                            "position": item_position,
+                            **self._line_item_columns(item)
+                        })
+
+            if line_items:
+                db.execute(insert(StoredLineItem), line_items)
+
+            batch = db.get(InvoiceBatch, batch_id)
+            batch.invoice_count += stored
+            db.commit()
+        finally:
+            db.close()
+
+    def _get_batch(self, batch_id: str) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            batch = db.get(InvoiceBatch, batch_id)
+            if batch is None:
+                raise BatchNotFoundError(f"Batch {batch_id} not found")
+            return {"batch_id": batch.id, "invoice_count": batch.invoice_count, "created_at": batch.created_at}
+        finally:
+            db.close()
+
+    def _line_items(self, db, invoice_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        columns = [getattr(StoredLineItem, field) for field in LINE_ITEM_TEXT_FIELDS + LINE_ITEM_NUMBER_FIELDS]
+        rows = db.execute(
+            select(StoredLineItem.invoice_id, *columns)
+            .where(StoredLineItem.invoice_id.in_(invoice_ids))
+            .order_by(StoredLineItem.invoice_id, StoredLineItem.position)
+        )
+
+        items: Dict[int, List[Dict[str, Any]]] = {}
+        for invoice_id, *values in rows:
+            items.setdefault(invoice_id, []).append(
+                dict(zip(LINE_ITEM_TEXT_FIELDS + LINE_ITEM_NUMBER_FIELDS, values))
+            )
+        return items
+
+    @staticmethod
+    def _summary_columns(summary: Dict[str, Any]) -> Dict[str, Any]:
+        columns = {field: _text(summary.get(field)) for field in TEXT_FIELDS}
+        columns.update({field: parse_amount(summary.get(field)) for field in AMOUNT_FIELDS})
+        columns["issued_on"] = _parse_date(columns["invoice_date"])
+        return columns
+
+    @staticmethod
+    def _line_item_columns(item: Dict[str, Any]) -> Dict[str, Any]:
+        columns = {field: _text(item.get(field)) for field in LINE_ITEM_TEXT_FIELDS}
+        columns.update({field: parse_amount(item.get(field)) for field in LINE_ITEM_NUMBER_FIELDS})
+        return columns
+
+    @staticmethod
+    def _to_dict(invoice: StoredInvoice, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        summary = {field: getattr(invoice, field) for field in TEXT_FIELDS + AMOUNT_FIELDS}
+        for item in items:
+            item["filename"] = invoice.filename
+
+        result = {"invoice_summary": summary, "line_items": items}
+        if invoice.error:
+            result["error"] = invoice.error
+        if invoice.duplicate_of:
+            result["duplicate_of"] = {"filename": invoice.duplicate_of}
+        return result
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    dates = entity_extractor.extract_dates(value)
+    return date.fromisoformat(dates[0]) if dates else None
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Shared invoice store for the whole application
+invoice_store = InvoiceStore()
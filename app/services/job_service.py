@@ -0,0 +1,370 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, update
+
+from app.database import SessionLocal
+from app.models import Job, JobFile
+from app.services.rate_limiter import PRIORITY_BULK, request_priority
+from app.services.upload_service import SpooledFile, upload_service
+
+
+logger = logging.getLogger(__name__)
+
+# Job worker configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # in-process workers per web process, 0 to disable
+JOB_MAX_FILES = int(os.getenv("JOB_MAX_FILES", "500"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))  # seconds between idle polls
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "900"))  # seconds before a running file is requeued
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "20"))  # seconds in-flight files may finish on shutdown
+
+FINISHED_FILE_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobNotFoundError(Exception):
+    """Raised when a job id does not exist"""
+
+
+class JobService:
+    """Database-backed job queue with a pool of asyncio workers"""
+
+    def __init__(self, poll_interval: float = JOB_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    # Submission and status
+
+    async def submit(self, documents: List[SpooledFile]) -> Dict[str, Any]:
+        """Store a new job with its files and wake the workers"""
+        job = await asyncio.to_thread(self._create_job, documents)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get_status(self, job_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._get_status, job_id)
+
+    async def get_results(self, job_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._get_results, job_id)
+
+    async def cancel(self, job_id: str) -> Dict[str, Any]:
+        await asyncio.to_thread(self._cancel, job_id)
+        return await self.get_status(job_id)
+
+    # Workers
+
+    async def start(self, worker_count: int = JOB_WORKERS):
+        """Start background workers in the current event loop"""
+        if worker_count <= 0 or self._workers:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._worker_loop(index), name=f"job-worker-{index}")
+            for index in range(worker_count)
+        ]
+
+    async def stop(self, drain_timeout: float = 0):
+        """Stop the workers.
+
+        Idle workers exit at once; files being processed get up to
+        drain_timeout seconds to finish. Workers still busy after that are
+        cancelled and their files go back to the queue.
+        """
+        workers, self._workers = self._workers, []
+        if not workers:
+            return
+
+        self._stopping = True
+        if drain_timeout > 0:
+            self._wakeup.set()
+            await asyncio.wait(workers, timeout=drain_timeout)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def run_forever(
+        self,
+        worker_count: int = JOB_WORKERS,
+        stop_event: Optional[asyncio.Event] = None,
+        drain_timeout: float = JOB_DRAIN_TIMEOUT
+    ):
+        """Run workers until cancelled or stop_event is set (standalone worker process)"""
+        await self.start(max(1, worker_count))
+        try:
+            if stop_event is None:
+                await asyncio.gather(*self._workers)
+            else:
+                await stop_event.wait()
+        finally:
+            draining = stop_event is not None and stop_event.is_set()
+            await self.stop(drain_timeout if draining else 0)
+
+    async def _worker_loop(self, index: int):
+        from app.services.extraction_service import ExtractionService
+        from app.services.openai_service import get_openai_service
+
+        # Background jobs yield to interactive requests for OpenAI budget
+        request_priority.set(PRIORITY_BULK)
+        while not self._stopping:
+            file_id = None
+            try:
+                claimed = await asyncio.to_thread(self._claim_next_file)
+                if claimed is None:
+                    if index == 0:
+                        await asyncio.to_thread(self._requeue_stale_files)
+                    await self._wait_for_work()
+                    continue
+
+                file_id, filename, content = claimed
+                document = await upload_service.spool_bytes(content, filename)
+                del content
+                try:
+                    extraction_service = ExtractionService(get_openai_service())
+                    invoice = await extraction_service.extract_invoice(document)
+                except Exception as e:
+                    invoice = {"error": f"Failed to process {filename}: {str(e)}", "line_items": []}
+                finally:
+                    document.cleanup()
+                await asyncio.to_thread(self._store_result, file_id, invoice)
+            except asyncio.CancelledError:
+                # Stopped mid-file: hand it back now rather than after JOB_STALE_AFTER
+                if file_id is not None:
+                    await asyncio.to_thread(self._release_file, file_id)
+                raise
+            except Exception as e:
+                logger.exception("Job worker %s failed: %s", index, e)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _wait_for_work(self):
+        if self._stopping:
+            return
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    # Database operations (run in a thread)
+
+    def _create_job(self, documents: List[SpooledFile]) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            job = Job(id=uuid.uuid4().hex, status="pending", total_files=len(documents))
+            db.add(job)
+            db.flush()
+
+            # Insert one file at a time so only one upload is in memory at once
+            for position, document in enumerate(documents):
+                job_file = JobFile(
+                    job_id=job.id,
+                    position=position,
+                    filename=document.filename,
+                    content=document.read_bytes(),
+                    status="pending"
+                )
+                db.add(job_file)
+                db.flush()
+                db.expunge(job_file)
+
+            db.commit()
+            return self._job_summary(db, job)
+        finally:
+            db.close()
+
+    def _get_job(self, db, job_id: str) -> Job:
+        job = db.get(Job, job_id)
+        if job is None:
+            raise JobNotFoundError(f"Job {job_id} not found")
+        return job
+
+    def _get_status(self, job_id: str) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            job = self._get_job(db, job_id)
+            status = self._job_summary(db, job)
+            status["files"] = [
+                {
+                    "position": file.position,
+                    "filename": file.filename,
+                    "status": file.status,
+                    "error": file.error,
+                    "started_at": file.started_at,
+                    "finished_at": file.finished_at
+                }
+                for file in db.query(
+                    JobFile.position, JobFile.filename, JobFile.status, JobFile.error,
+                    JobFile.started_at, JobFile.finished_at
+                ).filter(JobFile.job_id == job_id).order_by(JobFile.position)
+            ]
+            return status
+        finally:
+            db.close()
+
+    def _get_results(self, job_id: str) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            job = self._get_job(db, job_id)
+            rows = db.query(JobFile.result).filter(
+                JobFile.job_id == job_id,
+                JobFile.result.isnot(None)
+            ).order_by(JobFile.position)
+
+            invoices = [json.loads(result) for (result,) in rows]
+            summary = self._job_summary(db, job)
+            summary["processed_count"] = len(invoices)
+            summary["invoices"] = invoices
+            return summary
+        finally:
+            db.close()
+
+    def _cancel(self, job_id: str):
+        db = SessionLocal()
+        try:
+            job = self._get_job(db, job_id)
+            if job.status in ("completed", "cancelled"):
+                return
+
+            db.execute(
+                update(JobFile)
+                .where(JobFile.job_id == job_id, JobFile.status == "pending")
+                .values(status="cancelled", content=None, finished_at=datetime.utcnow())
+            )
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim_next_file(self) -> Optional[Tuple[int, str, bytes]]:
+        """Atomically move the oldest pending file to running"""
+        db = SessionLocal()
+        try:
+            while True:
+                candidate = db.query(JobFile.id).filter(
+                    JobFile.status == "pending"
+                ).order_by(JobFile.id).first()
+                if candidate is None:
+                    return None
+
+                # Conditional update so concurrent workers (or processes) never
+                # claim the same file twice
+                claimed = db.execute(
+                    update(JobFile)
+                    .where(JobFile.id == candidate.id, JobFile.status == "pending")
+                    .values(
+                        status="running",
+                        started_at=datetime.utcnow(),
+                        attempts=JobFile.attempts + 1
+                    )
+                ).rowcount
+                db.commit()
+                if not claimed:
+                    continue
+
+                file = db.get(JobFile, candidate.id)
+                job = file.job
+                if job.status == "pending":
+                    job.status = "running"
+                    db.commit()
+                return file.id, file.filename, file.content
+        finally:
+            db.close()
+
+    def _store_result(self, file_id: int, invoice: Dict[str, Any]):
+        db = SessionLocal()
+        try:
+            file = db.get(JobFile, file_id)
+            file.result = json.dumps(invoice)
+            file.error = invoice.get("error")
+            file.status = "failed" if invoice.get("error") else "completed"
+            file.content = None
+            file.finished_at = datetime.utcnow()
+            db.commit()
+
+            job = file.job
+            remaining = db.query(func.count(JobFile.id)).filter(
+                JobFile.job_id == job.id,
+                JobFile.status.notin_(FINISHED_FILE_STATUSES)
+            ).scalar()
+            if not remaining and job.status == "running":
+                job.status = "completed"
+                job.finished_at = datetime.utcnow()
+                db.commit()
+        finally:
+            db.close()
+
+    def _release_file(self, file_id: int):
+        """Return a file this worker was processing to the queue"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(JobFile)
+                .where(JobFile.id == file_id, JobFile.status == "running")
+                .values(status="pending", attempts=JobFile.attempts - 1)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _requeue_stale_files(self):
+        """Return files left running by a crashed or stopped worker to the queue"""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+            db.execute(
+                update(JobFile)
+                .where(
+                    JobFile.status == "running",
+                    JobFile.started_at < cutoff,
+                    JobFile.attempts < JOB_MAX_ATTEMPTS
+                )
+                .values(status="pending")
+            )
+            db.execute(
+                update(JobFile)
+                .where(
+                    JobFile.status == "running",
+                    JobFile.started_at < cutoff,
+                    JobFile.attempts >= JOB_MAX_ATTEMPTS
+                )
+                .values(
+                    status="failed",
+                    content=None,
+                    error="Worker stopped repeatedly while processing this file",
+                    finished_at=datetime.utcnow()
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _job_summary(self, db, job: Job) -> Dict[str, Any]:
+        counts = dict(db.query(JobFile.status, func.count(JobFile.id)).filter(
+            JobFile.job_id == job.id
+        ).group_by(JobFile.status).all())
+
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "total_files": job.total_files,
+            "file_counts": {
+                status: counts.get(status, 0)
+                for status in ("pending", "running", "completed", "failed", "cancelled")
+            },
+            "created_at": job.created_at,
+            "finished_at": job.finished_at
+        }
+
+
+# Shared job service for the whole application
+job_service = JobService()
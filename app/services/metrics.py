@@ -0,0 +1,260 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Latency buckets in seconds, from a cache hit to a slow multi-chunk LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+INF_LABEL = 'le="+Inf"'
+
+# Stage timings of the current request, reported in its Server-Timing header
+request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="%s"' % _number(bound)
+                    lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_bucket{self._labels(key, INF_LABEL)} {count}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {_number(total)}")
+                lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """A value read from a service when /metrics is scraped"""
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], float], type: str = "gauge"):
+        super().__init__(name, documentation)
+        self.type = type
+        self.fn = fn
+
+    def _samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {_number(self.fn())}"]
+        except Exception:
+            return []
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def callback(self, name: str, documentation: str, fn: Callable[[], float], type: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, fn, type))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# Process-wide registry and the metrics shared across services
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "pdf_extraction_stage_seconds", "Time spent in each processing stage", ["stage"]
+)
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+)
+HTTP_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response starts", ["method", "route"]
+)
+LLM_SECONDS = registry.histogram(
+    "llm_request_duration_seconds", "OpenAI chat completion latency (including retries)", ["operation", "model"]
+)
+LLM_FIRST_TOKEN_SECONDS = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time until a streamed OpenAI completion sends its first token", ["operation", "model"]
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "OpenAI tokens used", ["operation", "model", "type"]
+)
+LLM_ERRORS = registry.counter(
+    "llm_errors_total", "OpenAI calls that failed after retries", ["operation", "model"]
+)
+LLM_ESCALATIONS = registry.counter(
+    "llm_escalations_total", "OpenAI replies that failed validation and were retried on a stronger model",
+    ["operation", "model"]
+)
+
+
+class stage:
+    """Time a processing stage: `with stage("pdf_parse"): ...`
+
+    The duration goes into the stage histogram and the current request's
+    Server-Timing header. Works around awaits and inside worker threads
+    started with asyncio.to_thread.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+        self.seconds = 0.0
+
+    def __enter__(self) -> "stage":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        record_stage(self.name, self.seconds)
+        return False
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing value; repeated stages (e.g. several LLM calls) are summed"""
+    totals: Dict[str, List[float]] = {}
+    for name, seconds in list(timings):
+        totals.setdefault(name, []).append(seconds)
+
+    entries = []
+    for name, durations in totals.items():
+        entry = f"{name};dur={sum(durations) * 1000:.1f}"
+        if len(durations) > 1:
+            entry += f';desc="{len(durations)} calls"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """Counts and times HTTP requests and adds a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - start
+                HTTP_SECONDS.observe(elapsed, method=scope["method"], route=_route(scope))
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings, elapsed).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            request_timings.reset(token)
+            HTTP_REQUESTS.inc(method=scope["method"], route=_route(scope), status=str(status))
+
+
+def _route(scope) -> str:
+    """Route template (/api/v1/jobs/{job_id}) so ids do not explode label cardinality"""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    return "unmatched"
@@ -0,0 +1,177 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.entity_service import parse_number
+
+
+# Model routing: small documents go to a cheaper, faster model and replies
+# that fail validation are retried once on a stronger one
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+OPENAI_SMALL_MODEL = os.getenv("OPENAI_SMALL_MODEL", "gpt-3.5-turbo")
+OPENAI_ESCALATION_MODEL = os.getenv("OPENAI_ESCALATION_MODEL", "gpt-4o")  # empty: never escalate
+SMALL_DOCUMENT_TOKENS = int(os.getenv("SMALL_DOCUMENT_TOKENS", "1500"))  # prompt tokens
+OPENAI_JSON_MODE = os.getenv("OPENAI_JSON_MODE", "true").lower() == "true"
+
+# Document types simple enough for the small model; contracts always get the default one
+SMALL_MODEL_TYPES = ("invoice", "general")
+
+# Completion budget per operation: (minimum, tokens per prompt token, maximum).
+# The maximum is the fixed max_tokens every call used before routing.
+OUTPUT_BUDGETS = {
+    "invoice_excel": (600, 0.8, 2000),
+    "analysis": (500, 0.5, 2000),
+    "summary": (200, 0.1, 500),
+    "entities": (300, 0.3, 800),
+    "combined": (800, 0.6, 3000),
+}
+
+# Operations answered with a JSON object
+JSON_OPERATIONS = ("invoice_excel", "analysis", "entities", "combined")
+
+INVOICE_AMOUNT_FIELDS = ("subtotal", "tax_amount", "total_amount")
+LINE_ITEM_NUMBER_FIELDS = ("quantity", "unit_price", "line_total")
+MISSING_VALUES = ("", "n/a", "na", "none", "null", "-")
+
+
+class ModelRouter:
+    """Picks the model and max_tokens of each completion and checks its reply.
+
+    A route is a dict with `model` and `max_tokens`. The completion budget
+    grows with the prompt, so short documents do not reserve (and wait for
+    rate-limit capacity for) tokens they will never use. Replies to JSON
+    operations must parse and pass the operation's schema check; otherwise
+    escalation() names the stronger route to retry on.
+    """
+
+    def __init__(
+        self,
+        default_model: str,
+        enabled: bool = MODEL_ROUTING,
+        small_model: str = OPENAI_SMALL_MODEL,
+        escalation_model: str = OPENAI_ESCALATION_MODEL,
+        small_document_tokens: int = SMALL_DOCUMENT_TOKENS,
+        json_mode: bool = OPENAI_JSON_MODE
+    ):
+        self.default_model = default_model
+        self.enabled = enabled
+        self.small_model = small_model or default_model
+        self.escalation_model = escalation_model
+        self.small_document_tokens = small_document_tokens
+        self.json_mode = json_mode
+
+    @property
+    def version(self) -> str:
+        """Identifies the models results can come from, for cache keys"""
+        if not self.enabled:
+            return self.default_model
+        return f"{self.small_model}<={self.small_document_tokens}|{self.default_model}|{self.escalation_model}"
+
+    def route(self, operation: str, prompt_tokens: int, extraction_type: str = "invoice") -> Dict[str, Any]:
+        minimum, per_prompt_token, maximum = OUTPUT_BUDGETS[operation]
+        if not self.enabled:
+            return {"model": self.default_model, "max_tokens": maximum}
+
+        small = prompt_tokens <= self.small_document_tokens and extraction_type in SMALL_MODEL_TYPES
+        return {
+            "model": self.small_model if small else self.default_model,
+            "max_tokens": int(min(maximum, max(minimum, prompt_tokens * per_prompt_token)))
+        }
+
+    def escalation(self, operation: str, route: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Route to retry on after a reply failed validation, or None when there is none"""
+        if not self.enabled or not self.escalation_model:
+            return None
+
+        escalated = {"model": self.escalation_model, "max_tokens": 2 * OUTPUT_BUDGETS[operation][2]}
+        return None if escalated == route else escalated
+
+    def request_params(self, operation: str, route: Dict[str, Any]) -> Dict[str, Any]:
+        params = dict(route)
+        if self.json_mode and operation in JSON_OPERATIONS:
+            params["response_format"] = {"type": "json_object"}
+        return params
+
+    def parse(self, operation: str, content: str, finish_reason: Optional[str]) -> Tuple[Any, List[str]]:
+        """Parsed reply and the problems found with it (none means usable)"""
+        if finish_reason == "length":
+            return None, ["reply was cut off at max_tokens"]
+
+        try:
+            data = json.loads(_strip_code_fence(content))
+        except json.JSONDecodeError as e:
+            return None, [f"invalid JSON: {e}"]
+
+        return data, VALIDATORS[operation](data)
+
+
+def validate_invoice(data: Any) -> List[str]:
+    """Problems with an invoice_excel reply that would make it unusable for export"""
+    if not isinstance(data, dict):
+        return ["reply is not a JSON object"]
+
+    problems = []
+    summary = data.get("invoice_summary")
+    if not isinstance(summary, dict):
+        problems.append("invoice_summary is missing or not an object")
+    else:
+        problems += [
+            f"invoice_summary.{field} is not a number" for field in INVOICE_AMOUNT_FIELDS
+            if not _is_number(summary.get(field))
+        ]
+
+    line_items = data.get("line_items")
+    if not isinstance(line_items, list):
+        problems.append("line_items is missing or not a list")
+    else:
+        for index, item in enumerate(line_items):
+            if not isinstance(item, dict):
+                problems.append(f"line_items[{index}] is not an object")
+                continue
+            problems += [
+                f"line_items[{index}].{field} is not a number" for field in LINE_ITEM_NUMBER_FIELDS
+                if not _is_number(item.get(field))
+            ]
+    return problems
+
+
+def validate_object(data: Any) -> List[str]:
+    return [] if isinstance(data, dict) else ["reply is not a JSON object"]
+
+
+def validate_combined(data: Any) -> List[str]:
+    if not isinstance(data, dict):
+        return ["reply is not a JSON object"]
+    return [
+        f"{key} is missing or not {kind.__name__}" for key, kind in
+        (("structured_data", dict), ("summary", str), ("entities", dict))
+        if not isinstance(data.get(key), kind)
+    ]
+
+
+VALIDATORS = {
+    "invoice_excel": validate_invoice,
+    "analysis": validate_object,
+    "entities": validate_object,
+    "combined": validate_combined,
+}
+
+
+def _is_number(value: Any) -> bool:
+    """Numbers, numeric strings and explicitly missing values are all fine"""
+    if value is None or isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True
+    if isinstance(value, str):
+        text = value.strip().lstrip("$€£¥₹").strip()
+        return text.lower() in MISSING_VALUES or parse_number(text) is not None
+    return False
+
+
+def _strip_code_fence(content: str) -> str:
+    """Models without JSON mode often wrap the object in ```json fences"""
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import insert, select
+
+from app.database import SessionLocal
+from app.models import DocumentSignature, DocumentSignatureBand
+from app.services.entity_service import parse_amount, parse_number
+
+
+logger = logging.getLogger(__name__)
+
+# Near-duplicate detection (resent invoices with a new timestamp or reminder stamp)
+NEAR_DUPLICATES_ENABLED = os.getenv("NEAR_DUPLICATES", "true").lower() == "true"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))  # estimated Jaccard similarity, 0-1
+
+SHINGLE_WORDS = 5  # words per shingle
+MIN_SHINGLES = 20  # shorter texts are never matched
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16  # 16 bands of 8 rows: pairs above ~0.7 similarity share a bucket
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_random = np.random.RandomState(1)  # fixed, so stored signatures stay comparable
+HASH_A = _random.randint(1, MAX_HASH, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+HASH_B = _random.randint(0, MAX_HASH, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+WORD = re.compile(r"\w+")
+NUMBER = re.compile(r"\d(?:[\d.,]*\d)?")
+WHITESPACE = re.compile(r"\s+")
+MISSING_VALUES = ("", "n/a", "na", "none", "null", "unknown", "-")
+
+
+class NearDuplicateIndex:
+    """Finds earlier documents whose text is nearly the same as a new one.
+
+    Signatures should be built from compacted text with boilerplate
+    removed: a shared terms page can make two different invoices from one
+    vendor look nearly identical. Texts are cut into overlapping word shingles and reduced to a MinHash
+    signature; the share of equal signature values estimates the Jaccard
+    similarity of two texts. Signatures are stored with their LSH band
+    buckets, so a lookup only compares the few documents that share a bucket
+    instead of every document seen so far.
+    """
+
+    def __init__(self, enabled: bool = NEAR_DUPLICATES_ENABLED, threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        self.enabled = enabled
+        self.threshold = threshold
+
+    def signature(self, text: str) -> Optional[List[int]]:
+        """MinHash signature of a text, or None when it is too short to compare"""
+        words = WORD.findall(text.lower())
+        shingles = {
+            " ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)
+        }
+        if len(shingles) < MIN_SHINGLES:
+            return None
+
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        # Both factors stay below 2**32, so the products fit in 64 bits
+        permuted = (np.outer(hashes, HASH_A) + HASH_B) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).tolist()
+
+    async def find(self, signature: List[int]) -> Optional[Dict[str, Any]]:
+        """The most similar indexed document at or above the threshold, if any"""
+        return await asyncio.to_thread(self._find, signature)
+
+    async def add(self, content_hash: str, cache_key: str, filename: str, signature: Optional[List[int]]):
+        """Index a document whose extraction is cached under cache_key.
+
+        Documents too short for a signature are still recorded, so exact
+        copies of them are recognised by earlier_copy().
+        """
+        await asyncio.to_thread(self._add, content_hash, cache_key, filename, signature)
+
+    async def earlier_copy(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """The indexed document with exactly this content, if any"""
+        return await asyncio.to_thread(self._earlier_copy, content_hash)
+
+    # Database operations (run in a thread)
+
+    def _find(self, signature: List[int]) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            candidates = db.scalars(
+                select(DocumentSignature).where(
+                    DocumentSignature.id.in_(
+                        select(DocumentSignatureBand.signature_id)
+                        .where(DocumentSignatureBand.bucket.in_(_buckets(signature)))
+                    )
+                )
+            ).all()
+
+            best, best_similarity = None, 0.0
+            for candidate in candidates:
+                similarity = estimate_similarity(signature, json.loads(candidate.signature))
+                if similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+
+            if best is None or best_similarity < self.threshold:
+                return None
+            return {
+                "content_hash": best.content_hash,
+                "cache_key": best.cache_key,
+                "filename": best.filename,
+                "similarity": round(best_similarity, 3)
+            }
+        finally:
+            db.close()
+
+    def _earlier_copy(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            row = db.scalar(select(DocumentSignature).where(DocumentSignature.content_hash == content_hash))
+            if row is None:
+                return None
+            return {"content_hash": row.content_hash, "cache_key": row.cache_key, "filename": row.filename, "similarity": 1.0}
+        finally:
+            db.close()
+
+    def _add(self, content_hash: str, cache_key: str, filename: str, signature: Optional[List[int]]):
+        db = SessionLocal()
+        try:
+            if db.scalar(select(DocumentSignature.id).where(DocumentSignature.content_hash == content_hash)):
+                return
+
+            row = DocumentSignature(
+                content_hash=content_hash,
+                cache_key=cache_key,
+                filename=filename,
+                signature=json.dumps(signature or [])
+            )
+            db.add(row)
+            db.flush()
+            if signature:
+                db.execute(insert(DocumentSignatureBand), [
+                    {"signature_id": row.id, "bucket": bucket} for bucket in _buckets(signature)
+                ])
+            db.commit()
+        except Exception as e:
+            # Most likely the same document indexed concurrently; one row is enough
+            db.rollback()
+            logger.debug("Could not index document %s: %s", content_hash, e)
+        finally:
+            db.close()
+
+
+def confirms_duplicate(invoice_data: Dict[str, Any], text: str) -> bool:
+    """The earlier invoice's number and total both appear in the new document's text.
+
+    Similar text alone is not proof: a match is only reused when its key
+    fields are in the new document too. Without both fields nothing can be
+    checked, so nothing is reused.
+    """
+    summary = invoice_data.get("invoice_summary")
+    if not isinstance(summary, dict):
+        return False
+
+    number = WHITESPACE.sub("", str(summary.get("invoice_number") or "")).lower()
+    total = parse_amount(summary.get("total_amount"))
+    if number in MISSING_VALUES or total is None:
+        return False
+
+    if number not in WHITESPACE.sub("", text).lower():
+        return False
+    return any(
+        abs(value - abs(total)) < 0.005 for value in map(parse_number, NUMBER.findall(text)) if value is not None
+    )
+
+
+def estimate_similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def _buckets(signature: List[int]) -> List[str]:
+    rows = len(signature) // LSH_BANDS
+    return [
+        f"{band}:" + hashlib.blake2b(
+            json.dumps(signature[band * rows:(band + 1) * rows]).encode("ascii"), digest_size=8
+        ).hexdigest()
+        for band in range(LSH_BANDS)
+    ]
+
+
+# Shared near-duplicate index for the whole application
+near_duplicate_index = NearDuplicateIndex()
@@ -0,0 +1,130 @@
+import asyncio
+import importlib.util
+import logging
+import os
+import shutil
+from typing import Any, Dict, Optional
+
+from app.services.cache_service import ExtractionCache, extraction_cache
+from app.services.metrics import stage
+from app.services.pdf_service import PDFExtractionError, PDFService
+
+
+logger = logging.getLogger(__name__)
+
+# OCR for scanned pages (needs pytesseract and the tesseract binary)
+OCR_ENABLED = os.getenv("OCR", "true").lower() == "true"
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "120"))  # seconds per page
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+
+# Version of the cached OCR texts; bump when rendering or OCR settings change
+OCR_CACHE_VERSION = "1"
+
+
+def _ocr_page(source: str, index: int, dpi: int, language: str, tesseract_cmd: str) -> str:
+    """Render one page and read it with Tesseract. Runs inside a pool worker process."""
+    import pypdfium2 as pdfium
+    import pytesseract
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    document = pdfium.PdfDocument(source)
+    try:
+        image = document[index].render(scale=dpi / 72).to_pil()
+    finally:
+        document.close()
+    return pytesseract.image_to_string(image, lang=language)
+
+
+class OCRService(PDFService):
+    """OCR fallback for pages without a text layer.
+
+    Only the pages pdfplumber found no text on are rendered (at OCR_DPI) and
+    read with Tesseract, one page per task in a process pool of their own,
+    so born-digital documents never queue behind a scan. Texts are cached by
+    page content hash, so a page seen before is not OCRed again, whichever
+    document it comes in.
+    """
+
+    task_name = "OCR"
+
+    def __init__(
+        self,
+        max_workers: int = OCR_WORKERS,
+        timeout: float = OCR_TIMEOUT,
+        dpi: int = OCR_DPI,
+        language: str = OCR_LANGUAGE,
+        enabled: bool = OCR_ENABLED,
+        tesseract_cmd: str = TESSERACT_CMD,
+        cache: ExtractionCache = extraction_cache
+    ):
+        super().__init__(max_workers=max_workers, timeout=timeout)
+        self.dpi = dpi
+        self.language = language
+        self.enabled = enabled
+        self.tesseract_cmd = tesseract_cmd
+        self.cache = cache
+        self._available: Optional[bool] = None
+
+    @property
+    def available(self) -> bool:
+        """OCR is enabled and pytesseract, pypdfium2 and the tesseract binary are installed"""
+        if self._available is None:
+            missing = [
+                name for name, found in (
+                    ("pytesseract", importlib.util.find_spec("pytesseract") is not None),
+                    ("pypdfium2", importlib.util.find_spec("pypdfium2") is not None),
+                    (self.tesseract_cmd, shutil.which(self.tesseract_cmd) is not None),
+                ) if not found
+            ]
+            if self.enabled and missing:
+                logger.warning("OCR fallback disabled, not installed: %s", ", ".join(missing))
+            self._available = self.enabled and not missing
+        return self._available
+
+    async def fill_blank_pages(self, source: str, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """Put OCR text into the pages PDFService.extract_pages found no text on.
+
+        source is the PDF file path; parsed is the extract_pages result and is
+        returned with its pages filled in and the OCRed page numbers listed.
+        """
+        blank_pages = parsed.get("blank_pages")
+        if not blank_pages or not self.available:
+            return parsed
+
+        with stage("ocr"):
+            texts = await asyncio.gather(*(
+                self._page_text(source, index, page_hash) for index, page_hash in blank_pages
+            ))
+
+        pages = list(parsed["pages"])
+        for (index, _), text in zip(blank_pages, texts):
+            pages[index] = text
+        parsed["pages"] = pages
+        parsed["ocr_pages"] = [index + 1 for (index, _), text in zip(blank_pages, texts) if text.strip()]
+        return parsed
+
+    async def _page_text(self, source: str, index: int, page_hash: str) -> str:
+        key = self.cache.make_key(page_hash, "ocr", OCR_CACHE_VERSION, f"tesseract:{self.language}:{self.dpi}")
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        try:
+            text = await self._run_in_pool(
+                _ocr_page, source, index, self.dpi, self.language, self.tesseract_cmd
+            )
+        except PDFExtractionError as e:
+            # The page just stays empty; the rest of the document is still usable
+            logger.warning("OCR of page %d failed: %s", index + 1, e)
+            return ""
+
+        text = text.strip()
+        await self.cache.set(key, "ocr", text)
+        return text
+
+
+# Shared OCR pool for the whole application
+ocr_service = OCRService()
@@ -1,40 +1,242 @@
 import os
-from openai import OpenAI
-import json
-from typing import Dict, Any, List
+import asyncio
+import importlib.util
+import logging
+import time
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+from app.services.chunking_service import (
+    TextChunker, merge_structured, merge_invoice_parts, estimate_tokens, CHUNK_CONCURRENCY
+)
+from app.services.metrics import LLM_ERRORS, LLM_ESCALATIONS, LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, LLM_TOKENS, stage
+from app.services.model_router import ModelRouter
+from app.services.rate_limiter import RequestScheduler, request_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Default model, also used for long documents (128k context); see model_router
+# for the small and escalation models
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# HTTP client configuration (the client is shared by the whole process)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # e.g. a local stand-in for tests
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 without it
+OPENAI_HTTP2 = (
+    os.getenv("OPENAI_HTTP2", "true").lower() == "true"
+    and importlib.util.find_spec("h2") is not None
+)
+
+# Bump a version whenever its prompt changes so cached results are not reused
+PROMPT_VERSIONS = {
+    "invoice_excel": "3",
+    "analysis": "2",
+    "summary": "2",
+    "entities": "2",
+    "combined": "2"
+}
 
 class OpenAIService:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        base_url: Optional[str] = OPENAI_BASE_URL,
+        scheduler: RequestScheduler = request_scheduler,
+        router: Optional[ModelRouter] = None
+    ):
+        self.http_client = DefaultAsyncHttpxClient(
+            http2=OPENAI_HTTP2,
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+            )
+        )
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0  # retries are handled by the scheduler
+        )
+        self.model = OPENAI_MODEL
+        self.router = router or ModelRouter(self.model)
+        self.chunker = TextChunker()
+        self.scheduler = scheduler
+    
+    async def close(self):
+        """Close pooled connections"""
+        await self.client.close()
     
-    async def analyze_pdf_content(self, raw_text: str, extraction_type: str) -> Dict[str, Any]:
-        """Use ChatGPT to intelligently analyze and structure PDF content"""
+    async def _complete(self, operation: str, **params) -> Any:
+        """Chat completion admitted by the rate-limit scheduler, with latency and token metrics"""
+        estimated_tokens = self._estimated_tokens(params)
+        model = params.get("model", self.model)
         
-        prompts = {
-            "general": self._get_general_prompt(),
-            "invoice": self._get_invoice_prompt(),
-            "contract": self._get_contract_prompt()
-        }
+        start = time.perf_counter()
+        try:
+            with stage("llm"):
+                response = await self.scheduler.run(
+                    lambda: self.client.chat.completions.create(**params),
+                    estimated_tokens
+                )
+        except Exception:
+            LLM_ERRORS.inc(operation=operation, model=model)
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - start, operation=operation, model=model)
         
-        prompt = prompts.get(extraction_type, prompts["general"])
+        self._record_tokens(operation, model, getattr(response, "usage", None))
+        return response
+    
+    async def _stream_complete(
+        self, operation: str, on_delta: Callable[[str], Awaitable[None]], **params
+    ) -> Tuple[str, Optional[str]]:
+        """Streamed chat completion: on_delta gets each piece of text as it arrives
+        
+        Returns the whole content and the finish reason. Admission and retries
+        work as for _complete; a stream that fails halfway is not retried.
+        """
+        estimated_tokens = self._estimated_tokens(params)
+        model = params.get("model", self.model)
+        parts: List[str] = []
+        finish_reason = None
         
+        start = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
+            with stage("llm"):
+                stream = await self.scheduler.run(
+                    lambda: self.client.chat.completions.create(
+                        stream=True, stream_options={"include_usage": True}, **params
+                    ),
+                    estimated_tokens
+                )
+                # Closing the stream releases the connection if the consumer goes away
+                async with stream:
+                    async for chunk in stream:
+                        if getattr(chunk, "usage", None) is not None:
+                            self._record_tokens(operation, model, chunk.usage)
+                        if not chunk.choices:
+                            continue
+                        choice = chunk.choices[0]
+                        finish_reason = choice.finish_reason or finish_reason
+                        text = choice.delta.content if choice.delta is not None else None
+                        if text:
+                            if not parts:
+                                LLM_FIRST_TOKEN_SECONDS.observe(
+                                    time.perf_counter() - start, operation=operation, model=model
+                                )
+                            parts.append(text)
+                            await on_delta(text)
+        except Exception:
+            LLM_ERRORS.inc(operation=operation, model=model)
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - start, operation=operation, model=model)
+        
+        return "".join(parts), finish_reason
+    
+    @staticmethod
+    def _estimated_tokens(params: Dict[str, Any]) -> int:
+        return sum(
+            estimate_tokens(message.get("content") or "") for message in params.get("messages", [])
+        ) + params.get("max_tokens", 0)
+    
+    @staticmethod
+    def _record_tokens(operation: str, model: str, usage: Any):
+        if usage is not None:
+            LLM_TOKENS.inc(usage.prompt_tokens or 0, operation=operation, model=model, type="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens or 0, operation=operation, model=model, type="completion")
+    
+    async def _complete_json(
+        self,
+        operation: str,
+        messages: List[Dict[str, str]],
+        extraction_type: str = "invoice",
+        temperature: float = 0.1,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Tuple[Any, str]:
+        """JSON completion on the routed model, retried once on a stronger model if the reply is unusable
+        
+        Returns the parsed and validated reply (None when every attempt failed
+        validation) and the raw content of the last reply. With on_delta the
+        first attempt is streamed; an escalated retry is not.
+        """
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        route = self.router.route(operation, prompt_tokens, extraction_type)
+        content = ""
+        
+        while route is not None:
+            params = dict(messages=messages, temperature=temperature, **self.router.request_params(operation, route))
+            if on_delta is not None:
+                content, finish_reason = await self._stream_complete(operation, on_delta, **params)
+                on_delta = None
+            else:
+                choice = (await self._complete(operation, **params)).choices[0]
+                content, finish_reason = choice.message.content or "", getattr(choice, "finish_reason", None)
+            data, problems = self.router.parse(operation, content, finish_reason)
+            if not problems:
+                return data, content
+            
+            escalated = self.router.escalation(operation, route)
+            if escalated is not None:
+                LLM_ESCALATIONS.inc(operation=operation, model=route["model"])
+                logger.info(
+                    "Escalating %s from %s to %s: %s",
+                    operation, route["model"], escalated["model"], "; ".join(problems[:3])
+                )
+            route = escalated
+        
+        return None, content
+    
+    async def analyze_pdf_content(
+        self,
+        raw_text: str,
+        extraction_type: str,
+        pages: Optional[List[str]] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Use ChatGPT to intelligently analyze and structure PDF content
+        
+        on_delta receives the raw JSON as the model writes it (single-chunk
+        documents only; chunked ones are merged from several replies).
+        """
+        
+        chunks = self.chunker.split(raw_text, pages)
+        if len(chunks) == 1:
+            return await self._analyze_chunk(chunks[0], extraction_type, on_delta=on_delta)
+        
+        parts = await self._map_chunks(
+            chunks, lambda chunk, part: self._analyze_chunk(chunk, extraction_type, part)
+        )
+        successful = [part for part in parts if "error" not in part]
+        return merge_structured(successful) if successful else parts[0]
+    
+    async def _analyze_chunk(
+        self,
+        raw_text: str,
+        extraction_type: str,
+        part: str = "",
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        prompt = self._get_analysis_prompt(extraction_type)
+        
+        try:
+            structured_data, content = await self._complete_json(
+                "analysis",
+                [
                     {"role": "system", "content": prompt},
-                    {"role": "user", "content": f"Please analyze this document:\n\n{raw_text}"}
+                    {"role": "user", "content": f"Please analyze this document{part}:\n\n{raw_text}"}
                 ],
-                max_tokens=2000,
-                temperature=0.1
+                extraction_type,
+                on_delta=on_delta
             )
             
-            content = response.choices[0].message.content or ""
-            
-            # Try to parse as JSON, fallback to structured response
-            try:
-                structured_data = json.loads(content)
-            except json.JSONDecodeError:
+            # Fall back to the plain reply when no valid JSON came back
+            if structured_data is None:
                 structured_data = {"analysis": content}
             
             return structured_data
@@ -42,12 +244,47 @@ class OpenAIService:
         except Exception as e:
             return {"error": f"OpenAI API error: {str(e)}"}
     
-    async def generate_summary(self, raw_text: str, extraction_type: str) -> str:
-        """Generate an intelligent summary of the document"""
+    async def generate_summary(
+        self,
+        raw_text: str,
+        extraction_type: str,
+        pages: Optional[List[str]] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        """Generate an intelligent summary of the document
+        
+        on_delta receives the summary text as the model writes it; for chunked
+        documents that is the final summary of the partial summaries.
+        """
+        
+        chunks = self.chunker.split(raw_text, pages)
+        if len(chunks) == 1:
+            return await self._summarize_chunk(chunks[0], extraction_type, on_delta=on_delta)
         
+        # Map: summarize each chunk; reduce: summarize the partial summaries in order
+        partial_summaries = await self._map_chunks(
+            chunks, lambda chunk, part: self._summarize_chunk(chunk, extraction_type, part)
+        )
+        if all(summary.startswith("Could not generate summary") for summary in partial_summaries):
+            return partial_summaries[0]
+        
+        combined = "\n\n".join(
+            f"Part {index} of {len(chunks)}:\n{summary}"
+            for index, summary in enumerate(partial_summaries, start=1)
+        )
+        return await self._summarize_chunk(combined, f"{extraction_type} (partial summaries)", on_delta=on_delta)
+    
+    async def _summarize_chunk(
+        self,
+        raw_text: str,
+        extraction_type: str,
+        part: str = "",
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            route = self.router.route("summary", estimate_tokens(raw_text), extraction_type)
+            params = dict(
+                **route,
                 messages=[
                     {
                         "role": "system", 
@@ -55,87 +292,140 @@ class OpenAIService:
                     },
                     {
                         "role": "user", 
-                        "content": f"Summarize this {extraction_type} document:\n\n{raw_text[:4000]}"
+                        "content": f"Summarize this {extraction_type} document{part}:\n\n{raw_text}"
                     }
                 ],
-                max_tokens=500,
                 temperature=0.3
             )
             
-            return response.choices[0].message.content or "Summary not available"
+            if on_delta is not None:
+                content, _ = await self._stream_complete("summary", on_delta, **params)
+            else:
+                content = (await self._complete("summary", **params)).choices[0].message.content
+            return content or "Summary not available"
             
         except Exception as e:
             return f"Could not generate summary: {str(e)}"
     
-    async def extract_entities(self, raw_text: str) -> Dict[str, Any]:
+    async def extract_entities(self, raw_text: str, pages: Optional[List[str]] = None) -> Dict[str, Any]:
         """Extract key entities like dates, amounts, emails, etc."""
         
+        chunks = self.chunker.split(raw_text, pages)
+        if len(chunks) == 1:
+            return await self._extract_entities_chunk(chunks[0])
+        
+        parts = await self._map_chunks(chunks, lambda chunk, part: self._extract_entities_chunk(chunk))
+        successful = [part for part in parts if "error" not in part]
+        return merge_structured(successful) if successful else parts[0]
+    
+    async def _extract_entities_chunk(self, raw_text: str) -> Dict[str, Any]:
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
+            entities, content = await self._complete_json(
+                "entities",
+                [
                     {
                         "role": "system",
-                        "content": """Extract key entities from the document and return as JSON:
-                        {
-                            "dates": ["list of dates"],
-                            "amounts": ["list of monetary amounts"],
-                            "emails": ["list of email addresses"],
-                            "phone_numbers": ["list of phone numbers"],
-                            "names": ["list of person/company names"],
-                            "addresses": ["list of addresses"]
-                        }"""
+                        "content": self._get_entities_prompt()
                     },
-                    {"role": "user", "content": raw_text[:3000]}
-                ],
-                max_tokens=800,
-                temperature=0.1
+                    {"role": "user", "content": raw_text}
+                ]
             )
             
-            content = response.choices[0].message.content or "{}"
-            try:
-                return json.loads(content)
-            except json.JSONDecodeError:
+            if entities is None:
                 return {"entities": content}
+            return entities
                 
         except Exception as e:
             return {"error": f"Entity extraction failed: {str(e)}"}
     
-    async def extract_invoice_for_excel(self, raw_text: str, filename: str) -> Dict[str, Any]:
-        """Extract invoice data specifically formatted for Excel export with line items"""
+    async def analyze_combined(
+        self, raw_text: str, extraction_type: str, pages: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Structured analysis, summary and entities from a single completion"""
+        
+        if len(self.chunker.split(raw_text, pages)) > 1:
+            # Too long for one request: run the chunked extractions concurrently instead
+            structured_data, summary, entities = await asyncio.gather(
+                self.analyze_pdf_content(raw_text, extraction_type, pages),
+                self.generate_summary(raw_text, extraction_type, pages),
+                self.extract_entities(raw_text, pages)
+            )
+            return {"structured_data": structured_data, "summary": summary, "entities": entities}
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self._get_excel_invoice_prompt()},
-                    {"role": "user", "content": f"Extract data from this invoice file '{filename}':\n\n{raw_text}"}
+            combined, content = await self._complete_json(
+                "combined",
+                [
+                    {"role": "system", "content": self._get_combined_prompt(extraction_type)},
+                    {"role": "user", "content": f"Please analyze this {extraction_type} document:\n\n{raw_text}"}
                 ],
-                max_tokens=2000,
-                temperature=0.1
+                extraction_type
             )
             
-            content = response.choices[0].message.content or ""
+            if combined is None:
+                return {
+                    "structured_data": {"analysis": content},
+                    "summary": "Summary not available",
+                    "entities": {}
+                }
             
-            try:
-                structured_data = json.loads(content)
-                # Ensure we have the required structure
-                if not isinstance(structured_data, dict):
-                    return self._get_fallback_invoice_structure(filename)
-                
-                # Add filename to each record
-                if 'invoice_summary' in structured_data:
-                    structured_data['invoice_summary']['filename'] = filename
-                
-                if 'line_items' in structured_data:
-                    for item in structured_data['line_items']:
-                        item['filename'] = filename
-                
-                return structured_data
-                
-            except json.JSONDecodeError:
+            return {
+                "structured_data": combined.get("structured_data") or {},
+                "summary": combined.get("summary") or "Summary not available",
+                "entities": combined.get("entities") or {}
+            }
+            
+        except Exception as e:
+            return {"error": f"OpenAI API error: {str(e)}"}
+    
+    async def extract_invoice_for_excel(
+        self, raw_text: str, filename: str, pages: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Extract invoice data specifically formatted for Excel export with line items"""
+        
+        chunks = self.chunker.split(raw_text, pages)
+        if len(chunks) == 1:
+            return await self._extract_invoice_chunk(chunks[0], filename)
+        
+        parts = await self._map_chunks(
+            chunks, lambda chunk, part: self._extract_invoice_chunk(chunk, filename, part)
+        )
+        if all("error" in part or "extraction_note" in part for part in parts):
+            return parts[0]
+        
+        merged = merge_invoice_parts(parts, self._get_empty_invoice_summary(filename))
+        for item in merged["line_items"]:
+            item["filename"] = filename
+        return merged
+    
+    async def _extract_invoice_chunk(self, raw_text: str, filename: str, part: str = "") -> Dict[str, Any]:
+        user_prompt = f"Extract data from this invoice file '{filename}':\n\n{raw_text}"
+        if part:
+            user_prompt = (
+                f"Extract data from this invoice file '{filename}'{part}. Only return line items "
+                f"visible in this part; return an empty line_items list if there are none.\n\n{raw_text}"
+            )
+        
+        try:
+            structured_data, _ = await self._complete_json(
+                "invoice_excel",
+                [
+                    {"role": "system", "content": self._get_excel_invoice_prompt(chunked=bool(part))},
+                    {"role": "user", "content": user_prompt}
+                ]
+            )
+            
+            # Not valid invoice JSON, even from the escalation model
+            if structured_data is None:
                 return self._get_fallback_invoice_structure(filename)
             
+            # Add filename to each record
+            structured_data['invoice_summary']['filename'] = filename
+            for item in structured_data['line_items']:
+                item['filename'] = filename
+            
+            return structured_data
+            
         except Exception as e:
             return {
                 "error": f"OpenAI API error: {str(e)}",
@@ -143,7 +433,27 @@ class OpenAIService:
                 "line_items": []
             }
     
-    def _get_excel_invoice_prompt(self) -> str:
+    async def _map_chunks(
+        self,
+        chunks: List[str],
+        extract: Callable[[str, str], Awaitable[Any]]
+    ) -> List[Any]:
+        """Run extract on every chunk concurrently, returning results in chunk order"""
+        semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+        
+        async def run(index: int, chunk: str) -> Any:
+            async with semaphore:
+                return await extract(chunk, f" (part {index} of {len(chunks)})")
+        
+        return list(await asyncio.gather(*(run(index, chunk) for index, chunk in enumerate(chunks, start=1))))
+    
+    def _get_excel_invoice_prompt(self, chunked: bool = False) -> str:
+        # A part of a longer invoice must not invent a total line: merged with the
+        # real items from the other parts it would count the invoice twice
+        if chunked:
+            line_item_rule = "- This is one part of a longer invoice: if no line items are visible in it, return an empty line_items list"
+        else:
+            line_item_rule = "- If no line items visible, create one line item with the total amount"
         return """You are an expert invoice processor. Extract invoice data in this EXACT JSON format for Excel export:
         {
             "invoice_summary": {
@@ -178,7 +488,7 @@ class OpenAIService:
         - Dates must be YYYY-MM-DD format
         - Extract ALL line items, even if partially visible
         - Categorize items professionally (Office Supplies, Professional Services, Equipment, etc.)
-        - If no line items visible, create one line item with the total amount"""
+        """ + line_item_rule
     
     def _get_fallback_invoice_structure(self, filename: str) -> Dict[str, Any]:
         """Fallback structure when AI parsing fails"""
@@ -211,6 +521,39 @@ class OpenAIService:
             "filename": filename
         }
     
+    def _get_analysis_prompt(self, extraction_type: str) -> str:
+        prompts = {
+            "general": self._get_general_prompt,
+            "invoice": self._get_invoice_prompt,
+            "contract": self._get_contract_prompt
+        }
+        return prompts.get(extraction_type, prompts["general"])()
+    
+    def _get_entities_prompt(self) -> str:
+        return """Extract key entities from the document and return as JSON:
+                        {
+                            "dates": ["list of dates"],
+                            "amounts": ["list of monetary amounts"],
+                            "emails": ["list of email addresses"],
+                            "phone_numbers": ["list of phone numbers"],
+                            "names": ["list of person/company names"],
+                            "addresses": ["list of addresses"]
+                        }"""
+    
+    def _get_combined_prompt(self, extraction_type: str) -> str:
+        return f"""You are an expert document analyst. Return ONLY valid JSON with exactly these three keys:
+        {{
+            "structured_data": <object following the analysis format below>,
+            "summary": "clear, concise summary highlighting the most important information",
+            "entities": <object following the entities format below>
+        }}
+        
+        ANALYSIS FORMAT:
+        {self._get_analysis_prompt(extraction_type)}
+        
+        ENTITIES FORMAT:
+        {self._get_entities_prompt()}"""
+    
     def _get_general_prompt(self) -> str:
         return """You are an expert document analyst. Analyze the document and extract key information in JSON format:
         {
@@ -280,4 +623,22 @@ class OpenAIService:
             "renewal_terms": "renewal conditions if any",
             "confidentiality": "confidentiality requirements",
             "confidence_score": "1-10 rating"
-        }""" 
\ No newline at end of file
+        }"""
+
+
+# Process-wide service instance, created at app startup
+_service: Optional[OpenAIService] = None
+
+def get_openai_service() -> OpenAIService:
+    """Shared OpenAIService (one connection pool per process)"""
+    global _service
+    if _service is None:
+        _service = OpenAIService()
+    return _service
+
+async def close_openai_service():
+    """Close the shared service's connections on shutdown"""
+    global _service
+    service, _service = _service, None
+    if service is not None:
+        await service.close()
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from app.services.metrics import stage
+
+
+# PDF parsing pool configuration
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 2)))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", "60"))  # seconds per document
+PDF_MAX_TASKS_PER_CHILD = int(os.getenv("PDF_MAX_TASKS_PER_CHILD", "100"))
+
+# extract_tables() settings tried when reading a document's layout
+TABLE_STRATEGIES = {
+    "lines": {},
+    "text": {"vertical_strategy": "text", "horizontal_strategy": "text"}
+}
+
+
+class PDFExtractionError(Exception):
+    """Raised when a PDF cannot be parsed (timeout, worker crash, corrupt file)"""
+
+
+def _extract_pages(source: Union[str, bytes], layout: bool = False) -> Dict[str, Any]:
+    """Extract the text of every page. Runs inside a pool worker process.
+
+    source is a file path (preferred: nothing is copied between processes)
+    or the raw PDF bytes. With layout=True the first page's words (with
+    positions) and the table rows found by each of TABLE_STRATEGIES are
+    returned as well, for layout templates.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        pages = [page.extract_text() or "" for page in pdf.pages]
+        result = {"pages": pages, "page_count": len(pages)}
+        if layout and pdf.pages:
+            result["layout"] = _extract_layout(pdf.pages)
+
+        # Pages without a text layer (scans) are identified by content for OCR
+        blank_pages = [
+            [index, _page_hash(page)] for index, (page, text) in enumerate(zip(pdf.pages, pages))
+            if not text.strip()
+        ]
+        if blank_pages:
+            result["blank_pages"] = blank_pages
+
+    return result
+
+
+def _page_hash(page) -> str:
+    """SHA-256 of a page's size, content streams and images, without rendering it"""
+    from pdfminer.pdftypes import resolve1
+
+    digest = hashlib.sha256(f"{float(page.width)}x{float(page.height)}".encode("ascii"))
+    streams = [resolve1(stream) for stream in page.page_obj.contents]
+    streams += [image["stream"] for image in page.images]
+    for stream in streams:
+        data = getattr(stream, "rawdata", None)
+        digest.update(data if data is not None else stream.get_data())
+    return digest.hexdigest()
+
+
+def _warm_up_worker() -> int:
+    """Import pdfplumber in a pool worker so the first document does not pay for it"""
+    import pdfplumber  # noqa: F401
+
+    return os.getpid()
+
+
+def _extract_layout(pages) -> Dict[str, Any]:
+    first = pages[0]
+    words = [
+        [word["text"], round(word["x0"], 1), round(word["top"], 1), round(word["x1"], 1)]
+        for word in first.extract_words()
+    ]
+
+    tables = {}
+    for name, settings in TABLE_STRATEGIES.items():
+        rows = []
+        for page in pages:
+            for table in page.extract_tables(settings):
+                rows.extend([[cell or "" for cell in row] for row in table])
+        tables[name] = rows
+
+    return {"width": float(first.width), "height": float(first.height), "words": words, "tables": tables}
+
+
+class PDFService:
+    """Runs pdfplumber in a process pool so parsing never blocks the event loop"""
+
+    task_name = "PDF parsing"  # used in timeout and crash errors
+
+    def __init__(
+        self,
+        max_workers: int = PDF_WORKERS,
+        timeout: float = PDF_TIMEOUT,
+        max_tasks_per_child: int = PDF_MAX_TASKS_PER_CHILD
+    ):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Jobs wait here rather than in the pool, so the timeout only covers running
+        self._slots = asyncio.Semaphore(self.max_workers)
+
+    async def extract_pages(self, source: Union[str, bytes], layout: bool = False) -> Dict[str, Any]:
+        """Parse a PDF in the pool and return its page texts and page count"""
+        with stage("pdf_parse"):
+            return await self._run_in_pool(_extract_pages, source, layout)
+
+    async def _run_in_pool(self, function: Callable[..., Any], *args: Any) -> Any:
+        async with self._slots:
+            # A crashed or killed worker breaks the whole pool, so documents that
+            # were merely sharing it get one retry on a fresh pool
+            for attempt in range(2):
+                executor = self._get_executor()
+                loop = asyncio.get_running_loop()
+                try:
+                    future = loop.run_in_executor(executor, function, *args)
+                    return await asyncio.wait_for(future, timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    # The worker is still busy with the document; kill the pool so it
+                    # cannot hold a slot forever. Other running jobs see BrokenProcessPool
+                    # and are resubmitted to the new pool.
+                    self._reset_executor(executor, terminate=True)
+                    raise PDFExtractionError(f"{self.task_name} timed out after {self.timeout:g} seconds")
+                except BrokenProcessPool:
+                    self._reset_executor(executor)
+                    if attempt:
+                        raise PDFExtractionError(f"{self.task_name} worker crashed while reading this document")
+                except Exception as e:
+                    raise PDFExtractionError(f"Could not read PDF: {str(e)}")
+
+    async def warm_up(self):
+        """Start every worker process and import pdfplumber in each"""
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, _warm_up_worker) for _ in range(self.max_workers)
+        ))
+
+    async def extract_text(self, source: Union[str, bytes]) -> str:
+        """Parse a PDF in the pool and return the text of all pages"""
+        result = await self.extract_pages(source)
+        return self.join_pages(result["pages"])
+
+    @staticmethod
+    def join_pages(pages: List[str]) -> str:
+        """Join page texts, skipping pages without text"""
+        return "".join(text + "\n" for text in pages if text)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn keeps workers independent of the server's threads and sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    max_tasks_per_child=self.max_tasks_per_child or None
+                )
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor, terminate: bool = False):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if terminate:
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+            # Leave the other jobs to fail with BrokenProcessPool (and be retried)
+            # instead of cancelling them, which would cancel their callers
+            executor.shutdown(wait=False)
+        else:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared pool for the whole application
+pdf_service = PDFService()
@@ -0,0 +1,237 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+import openai
+
+from app.services.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+# OpenAI account limits for this process (0 = unlimited)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "0"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "0"))
+# Retries on 429 and 5xx responses, with jittered exponential backoff
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "1"))  # seconds
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "60"))  # seconds
+
+# Priority classes: lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+# Priority of the LLM calls made by the current request or task
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "request_priority", default=PRIORITY_INTERACTIVE
+)
+
+
+@contextmanager
+def priority(level: int):
+    """Run the enclosed LLM calls (and tasks started inside) at the given priority"""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class TokenBucket:
+    """Refills continuously up to a per-minute budget"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 when it is available now)"""
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def take(self, amount: float):
+        self.available -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Correct an earlier estimate; the budget may go into debt"""
+        self.refill()
+        self.available = min(self.capacity, self.available - amount)
+
+
+class RequestScheduler:
+    """Admits OpenAI requests within RPM/TPM budgets, highest priority first.
+
+    Waiting requests are queued by (priority, arrival). Only the head of the
+    queue may take budget, so bulk work never overtakes an interactive call.
+    Rate-limit and server errors are retried with jittered exponential
+    backoff; a 429 also pauses admission for everyone until the backoff ends.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = OPENAI_RPM,
+        tokens_per_minute: int = OPENAI_TPM,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        base_delay: float = OPENAI_RETRY_BASE_DELAY,
+        max_delay: float = OPENAI_RETRY_MAX_DELAY
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._changed: Optional[asyncio.Event] = None
+        self.retries = 0
+        self.rate_limited = 0
+
+    async def run(self, call: Callable[[], Awaitable[Any]], estimated_tokens: int = 0) -> Any:
+        """Run call once budget allows, retrying rate-limit and server errors"""
+        level = request_priority.get()
+        attempt = 0
+        while True:
+            await self._acquire(estimated_tokens, level)
+            try:
+                response = await call()
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self.retries += 1
+                logger.info("OpenAI request failed (%s), retry %d in %.1fs", e.__class__.__name__, attempt, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self._record_usage(response, estimated_tokens)
+            return response
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    async def _acquire(self, tokens: float, level: int):
+        if self.requests is None and self.tokens is None and time.monotonic() >= self._paused_until:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (level, next(self._sequence), tokens, future))
+        self._notify()
+        await future
+
+    def _notify(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._changed = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        else:
+            self._changed.set()
+
+    async def _dispatch(self):
+        """Grant budget to the head of the queue, sleeping until it refills"""
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():  # the caller was cancelled
+                heapq.heappop(self._waiters)
+                continue
+
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                heapq.heappop(self._waiters)
+                future.set_result(None)
+                continue
+
+            # Wake early when a higher-priority request arrives
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _reserve(self, tokens: float) -> float:
+        """Take budget for one request, or return the seconds to wait for it"""
+        wait = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        if wait > 0:
+            return wait
+
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        return 0.0
+
+    def _record_usage(self, response: Any, estimated_tokens: int):
+        """Charge the token bucket with the real usage instead of the estimate"""
+        usage = getattr(response, "usage", None)
+        if self.tokens is not None and usage is not None and getattr(usage, "total_tokens", None):
+            self.tokens.adjust(usage.total_tokens - estimated_tokens)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+
+        if isinstance(error, openai.RateLimitError):
+            # Hold back every queued request, not just this one, to avoid a storm of 429s
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            # Quota exhaustion is reported as 429 too, but waiting will not fix it
+            if getattr(error, "code", None) == "insufficient_quota":
+                return False
+            return error.status_code in RETRYABLE_STATUS_CODES
+        return False
+
+
+# Shared scheduler for every OpenAI call in this process
+request_scheduler = RequestScheduler()
+
+registry.callback("llm_queued_requests", "OpenAI requests waiting for rate-limit budget", lambda: request_scheduler.queued)
+registry.callback(
+    "llm_retries_total", "OpenAI requests retried after 429/5xx", lambda: request_scheduler.retries, type="counter"
+)
+registry.callback(
+    "llm_rate_limited_total", "OpenAI 429 responses", lambda: request_scheduler.rate_limited, type="counter"
+)
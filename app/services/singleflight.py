@@ -0,0 +1,63 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent computations of the same key into one.
+
+    The first caller for a key starts the computation in its own task; callers
+    arriving while it runs wait for the same task. Every waiter gets its own
+    copy of the result (or the same exception). A waiter that is cancelled
+    just stops waiting; the computation is cancelled once nobody is waiting.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Run compute() for key, or join the run already in flight.
+
+        compute() is called synchronously when a new flight starts, so it can
+        claim resources (e.g. link a temporary file) before the caller moves on.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(compute()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # Nobody is left to use the result; later callers start afresh
+                self._finish(key, flight)
+                flight.task.cancel()
+
+        return copy.deepcopy(result)
+
+    def running(self, key: str) -> bool:
+        """Whether a computation for key is in flight, so do() would join it"""
+        return key in self._flights
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def _finish(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
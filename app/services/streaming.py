@@ -0,0 +1,49 @@
+import json
+from typing import Any, AsyncIterator, Dict
+
+from starlette.responses import StreamingResponse
+
+
+# Supported streaming formats and their media types
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream"
+}
+
+
+def encode_event(event: Dict[str, Any], stream_format: str = "ndjson") -> str:
+    """Encode one event as an NDJSON line or a Server-Sent Event"""
+    data = json.dumps(event, default=str)
+    if stream_format == "sse":
+        return f"event: {event.get('event', 'message')}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def encode_events(events: AsyncIterator[Dict[str, Any]], stream_format: str = "ndjson") -> AsyncIterator[str]:
+    """Encode a stream of events for a StreamingResponse"""
+    async for event in events:
+        yield encode_event(event, stream_format)
+
+
+def stream_format_for(requested: str, accept: str = "") -> str:
+    """Pick the stream format from an explicit choice or the Accept header"""
+    if requested in STREAM_MEDIA_TYPES:
+        return requested
+    if "text/event-stream" in (accept or ""):
+        return "sse"
+    return "ndjson"
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """A StreamingResponse that may be sent while the request body is still being read.
+
+    StreamingResponse reads from `receive` itself to notice disconnects, which
+    would take body chunks away from an endpoint that consumes the request
+    stream as it responds. A disconnect still ends this response, because
+    sending to a closed connection fails.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,572 @@
+import asyncio
+import calendar
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from app.database import SessionLocal
+from app.models import InvoiceTemplate
+from app.services.entity_service import MONTHS, entity_extractor, parse_number
+
+
+logger = logging.getLogger(__name__)
+
+# Vendor layout templates
+# Off by default: learning needs the layout of every invoice, which makes parsing slower
+TEMPLATES_ENABLED = os.getenv("TEMPLATES_ENABLED", "false").lower() == "true"
+TEMPLATE_MATCH_THRESHOLD = float(os.getenv("TEMPLATE_MATCH_THRESHOLD", "0.8"))  # layout similarity, 0-1
+TEMPLATE_MIN_CONFIRMATIONS = int(os.getenv("TEMPLATE_MIN_CONFIRMATIONS", "2"))  # agreeing LLM extractions before use
+# Seconds the in-memory templates are used before re-reading them, so changes made by
+# other processes (learned or deleted templates) are picked up
+TEMPLATE_RELOAD_SECONDS = float(os.getenv("TEMPLATE_RELOAD_SECONDS", "30"))
+
+# Share of the first page (from the top) whose words make up the layout fingerprint
+HEADER_FRACTION = 0.3
+LINE_TOLERANCE = 3  # points between word tops on the same line
+
+# Summary fields located next to a label, and how their value is parsed
+ANCHORED_FIELDS = {
+    "invoice_number": "text",
+    "po_number": "text",
+    "invoice_date": "date",
+    "due_date": "date",
+    "subtotal": "amount",
+    "tax_amount": "amount",
+    "total_amount": "amount"
+}
+# Summary fields that do not change between a vendor's invoices
+CONSTANT_FIELDS = ("vendor_name", "vendor_address", "currency", "payment_terms")
+LINE_ITEM_COLUMNS = ("item_description", "quantity", "unit_price", "line_total")
+TOTAL_ROW_LABELS = ("subtotal", "sub-total", "sub total", "total", "tax", "vat", "balance", "amount due")
+
+MONTH_WORDS = set(MONTHS) | {"sept"} | {name.lower() for name in calendar.month_name if name}
+AMOUNT_PATTERN = re.compile(r"-?\d{1,3}(?:[,.]\d{3})+(?:[.,]\d{1,2})?|-?\d+(?:[.,]\d{1,2})?")
+
+
+class TemplateNotFoundError(Exception):
+    """Raised when a template id does not exist"""
+
+
+class TemplateService:
+    """Learns recurring vendor layouts from LLM extractions and applies them directly.
+
+    A document's layout is fingerprinted from the words at the top of its first
+    page and the shape of its tables. A consistent LLM extraction (line items
+    add up to the totals) teaches a template where each summary field sits and
+    which table columns hold the line items. Later LLM extractions of the same
+    layout confirm the template when the template reproduces them; once
+    confirmed often enough it replaces the LLM for that layout.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TEMPLATES_ENABLED,
+        match_threshold: float = TEMPLATE_MATCH_THRESHOLD,
+        min_confirmations: int = TEMPLATE_MIN_CONFIRMATIONS,
+        reload_seconds: float = TEMPLATE_RELOAD_SECONDS
+    ):
+        self.enabled = enabled
+        self.match_threshold = match_threshold
+        self.min_confirmations = max(1, min_confirmations)
+        self.reload_seconds = reload_seconds
+        self._templates: Optional[List[Dict[str, Any]]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._learn_lock = asyncio.Lock()
+
+    async def apply(self, layout: Dict[str, Any], empty_summary: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Invoice data from a confirmed matching template, or None to use the LLM"""
+        template = await self.match(layout)
+        if template is None or template["confirmations"] < self.min_confirmations:
+            return None
+
+        invoice = self._apply(template, layout, empty_summary)
+        if invoice is not None:
+            await asyncio.to_thread(self._record_use, template["id"])
+        return invoice
+
+    async def learn(self, layout: Dict[str, Any], invoice: Dict[str, Any], empty_summary: Dict[str, Any]):
+        """Learn from (or confirm a template with) a successful LLM extraction"""
+        try:
+            if not _is_consistent(invoice):
+                return
+
+            rules = self._learn(layout, invoice)
+            if rules is None:
+                return
+
+            async with self._learn_lock:
+                template = await self.match(layout)
+                if template is None:
+                    await asyncio.to_thread(self._create, fingerprint(layout), rules)
+                    return
+
+                shadow = self._apply(template, layout, empty_summary)
+                if shadow is not None and _agrees(shadow, invoice):
+                    await asyncio.to_thread(self._confirm, template["id"], rules)
+                else:
+                    # The layout changed or the template was wrong: start over from this extraction
+                    await asyncio.to_thread(self._replace, template["id"], fingerprint(layout), rules)
+        except Exception as e:
+            logger.warning("Could not learn invoice template: %s", e)
+
+    async def match(self, layout: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The most similar template above the match threshold"""
+        templates = await asyncio.to_thread(self._load)
+        tokens = set(fingerprint(layout))
+
+        best, best_score = None, self.match_threshold
+        for template in templates:
+            score = similarity(tokens, template["fingerprint"])
+            if score >= best_score:
+                best, best_score = template, score
+        return best
+
+    async def list_templates(self) -> List[Dict[str, Any]]:
+        templates = await asyncio.to_thread(self._load)
+        return [
+            {
+                "id": template["id"],
+                "vendor_name": template["vendor_name"],
+                "confirmations": template["confirmations"],
+                "uses": template["uses"],
+                "active": template["confirmations"] >= self.min_confirmations,
+                "fields": sorted(template["rules"]["fields"])
+            }
+            for template in templates
+        ]
+
+    async def delete(self, template_id: int):
+        await asyncio.to_thread(self._delete, template_id)
+
+    # Learning and applying (pure functions of the layout)
+
+    def _learn(self, layout: Dict[str, Any], invoice: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        summary = invoice.get("invoice_summary") or {}
+        lines = _lines(layout["words"])
+
+        fields = {}
+        for field, kind in ANCHORED_FIELDS.items():
+            value = summary.get(field)
+            if value in (None, "", "N/A", 0):
+                continue
+            rule = _learn_field(lines, value, kind)
+            if rule is not None:
+                fields[field] = rule
+
+        if "total_amount" not in fields:
+            return None
+
+        line_items = [item for item in invoice.get("line_items") or [] if isinstance(item, dict)]
+        table = _learn_table(layout["tables"], line_items)
+        if table is None:
+            return None
+
+        categories = {
+            str(item.get("item_description", "")).strip().lower(): item.get("category")
+            for item in line_items
+            if item.get("category")
+        }
+        category_counts = Counter(categories.values())
+
+        return {
+            "fields": fields,
+            "table": table,
+            "constants": {field: summary.get(field) for field in CONSTANT_FIELDS if field in summary},
+            "categories": categories,
+            "default_category": category_counts.most_common(1)[0][0] if category_counts else "Unknown"
+        }
+
+    def _apply(
+        self,
+        template: Dict[str, Any],
+        layout: Dict[str, Any],
+        empty_summary: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        rules = template["rules"]
+        lines = _lines(layout["words"])
+
+        summary = dict(empty_summary)
+        summary.update(rules["constants"])
+        for field, rule in rules["fields"].items():
+            value = _apply_field(lines, rule)
+            if value is None:
+                return None
+            summary[field] = value
+
+        line_items = _apply_table(layout["tables"], rules)
+        for item in line_items:
+            item["filename"] = summary.get("filename")
+
+        invoice = {"invoice_summary": summary, "line_items": line_items}
+        if not _is_consistent(invoice):
+            return None
+
+        invoice["template_id"] = template["id"]
+        return invoice
+
+    # Database operations (run in a thread)
+
+    def _load(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._templates is None or time.monotonic() - self._loaded_at >= self.reload_seconds:
+                db = SessionLocal()
+                try:
+                    self._templates = [self._to_dict(row) for row in db.query(InvoiceTemplate).all()]
+                    self._loaded_at = time.monotonic()
+                finally:
+                    db.close()
+            return list(self._templates)
+
+    def _create(self, tokens: List[str], rules: Dict[str, Any]):
+        db = SessionLocal()
+        try:
+            row = InvoiceTemplate(
+                vendor_name=str(rules["constants"].get("vendor_name") or "Unknown Vendor")[:255],
+                fingerprint=json.dumps(tokens),
+                rules=json.dumps(rules),
+                confirmations=1
+            )
+            db.add(row)
+            db.commit()
+            self._store(row)
+        finally:
+            db.close()
+
+    def _confirm(self, template_id: int, rules: Dict[str, Any]):
+        db = SessionLocal()
+        try:
+            row = db.get(InvoiceTemplate, template_id)
+            if row is None:
+                return
+            stored = json.loads(row.rules)
+            stored["categories"].update(rules["categories"])
+            row.rules = json.dumps(stored)
+            row.confirmations += 1
+            db.commit()
+            self._store(row)
+        finally:
+            db.close()
+
+    def _replace(self, template_id: int, tokens: List[str], rules: Dict[str, Any]):
+        db = SessionLocal()
+        try:
+            row = db.get(InvoiceTemplate, template_id)
+            if row is None:
+                return
+            row.fingerprint = json.dumps(tokens)
+            row.rules = json.dumps(rules)
+            row.confirmations = 1
+            db.commit()
+            self._store(row)
+        finally:
+            db.close()
+
+    def _record_use(self, template_id: int):
+        db = SessionLocal()
+        try:
+            row = db.get(InvoiceTemplate, template_id)
+            if row is not None:
+                row.uses += 1
+                db.commit()
+                self._store(row)
+        finally:
+            db.close()
+
+    def _delete(self, template_id: int):
+        db = SessionLocal()
+        try:
+            row = db.get(InvoiceTemplate, template_id)
+            if row is None:
+                raise TemplateNotFoundError(f"Template {template_id} not found")
+            db.delete(row)
+            db.commit()
+        finally:
+            db.close()
+
+        with self._lock:
+            if self._templates is not None:
+                self._templates = [t for t in self._templates if t["id"] != template_id]
+
+    def _store(self, row: InvoiceTemplate):
+        """Update the in-memory copy after a write"""
+        template = self._to_dict(row)
+        with self._lock:
+            if self._templates is None:
+                return
+            self._templates = [t for t in self._templates if t["id"] != template["id"]] + [template]
+
+    @staticmethod
+    def _to_dict(row: InvoiceTemplate) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "vendor_name": row.vendor_name,
+            "fingerprint": set(json.loads(row.fingerprint)),
+            "rules": json.loads(row.rules),
+            "confirmations": row.confirmations,
+            "uses": row.uses
+        }
+
+
+def fingerprint(layout: Dict[str, Any]) -> List[str]:
+    """Layout tokens: label words at the top of page one plus table shapes.
+
+    Words with digits and month names are left out, since they change from
+    one invoice to the next.
+    """
+    cutoff = layout["height"] * HEADER_FRACTION
+    tokens = set()
+    for text, _x0, top, _x1 in layout["words"]:
+        if top > cutoff or any(char.isdigit() for char in text):
+            continue
+        token = re.sub(r"[^a-z]", "", text.lower())
+        if len(token) >= 3 and token not in MONTH_WORDS:
+            tokens.add(token)
+
+    for name, rows in layout["tables"].items():
+        if rows:
+            width = Counter(len(row) for row in rows).most_common(1)[0][0]
+            tokens.add(f"#table:{name}:{width}")
+
+    return sorted(tokens)
+
+
+def similarity(a, b) -> float:
+    """Jaccard similarity of two token sets"""
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _lines(words: List[List[Any]]) -> List[List[List[Any]]]:
+    """Group positioned words into lines, top to bottom and left to right"""
+    lines: List[List[List[Any]]] = []
+    for word in sorted(words, key=lambda w: (w[2], w[1])):
+        if lines and abs(lines[-1][0][2] - word[2]) <= LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w[1]) for line in lines]
+
+
+def _join(words: List[List[Any]]) -> str:
+    return " ".join(word[0] for word in words)
+
+
+def _label(words: List[List[Any]]) -> Optional[str]:
+    """Up to three label words directly in front of a value (no digits)"""
+    label: List[str] = []
+    for word in reversed(words):
+        if any(char.isdigit() for char in word[0]) or len(label) == 3:
+            break
+        label.insert(0, word[0])
+    text = " ".join(label).lower()
+    return text if re.search(r"[a-z]", text) else None
+
+
+def _learn_field(lines: List[List[List[Any]]], value: Any, kind: str) -> Optional[Dict[str, Any]]:
+    """Find where value appears and the label that locates it"""
+    for line_index, line in enumerate(lines):
+        for start in range(len(line)):
+            for span in (1, 2, 3):
+                words = line[start:start + span]
+                if len(words) < span or not _matches(_join(words), value, kind):
+                    continue
+
+                label = _label(line[:start])
+                if label:
+                    return {"type": kind, "anchor": label, "position": "right"}
+
+                if line_index:
+                    above = [
+                        word for word in lines[line_index - 1]
+                        if word[1] <= words[-1][3] and word[3] >= words[0][1]
+                    ]
+                    label = _label(above)
+                    if label:
+                        return {
+                            "type": kind,
+                            "anchor": label,
+                            "position": "below",
+                            "x0": words[0][1],
+                            "x1": words[-1][3]
+                        }
+    return None
+
+
+def _apply_field(lines: List[List[List[Any]]], rule: Dict[str, Any]) -> Optional[Any]:
+    anchor = rule["anchor"]
+    for line_index, line in enumerate(lines):
+        text = _join(line)
+        position = text.lower().find(anchor)
+        if position < 0:
+            continue
+
+        if rule["position"] == "right":
+            rest = text[position + len(anchor):]
+        elif line_index + 1 < len(lines):
+            rest = _join([
+                word for word in lines[line_index + 1]
+                if rule["x0"] - 20 <= word[1] <= rule["x1"] + 20
+            ])
+        else:
+            continue
+
+        value = _parse(rest, rule["type"])
+        if value is not None:
+            return value
+    return None
+
+
+def _matches(text: str, value: Any, kind: str) -> bool:
+    if kind == "amount":
+        expected = _to_float(value)
+        found = _parse_amount(text)
+        return expected is not None and found is not None and abs(found - expected) < 0.005
+    if kind == "date":
+        return entity_extractor.extract_dates(text) == [str(value)]
+    return _clean(text).lower() == str(value).strip().lower()
+
+
+def _parse(text: str, kind: str) -> Optional[Any]:
+    if kind == "amount":
+        match = AMOUNT_PATTERN.search(text)
+        return parse_number(match.group(0)) if match else None
+    if kind == "date":
+        dates = entity_extractor.extract_dates(text)
+        return dates[0] if dates else None
+    words = text.split()
+    return _clean(words[0]) if words and _clean(words[0]) else None
+
+
+def _clean(text: str) -> str:
+    return text.strip().strip(":#").strip()
+
+
+def _parse_amount(text: str) -> Optional[float]:
+    """A cell or token that is a single amount (currency marks allowed)"""
+    cleaned = re.sub(r"[$€£¥₹]|\b[A-Z]{3}\b", "", text).strip()
+    if not cleaned or not re.fullmatch(r"-?[\d.,\s]+", cleaned) or not re.search(r"\d", cleaned):
+        return None
+    return parse_number(cleaned)
+
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _learn_table(tables: Dict[str, List[List[str]]], line_items: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Pick the table strategy and columns that reproduce the line items"""
+    best = None
+    for strategy, rows in tables.items():
+        votes = {column: Counter() for column in LINE_ITEM_COLUMNS}
+        matched = 0
+
+        for item in line_items:
+            total = _to_float(item.get("line_total"))
+            description = str(item.get("item_description") or "").strip().lower()
+            if total is None or not description:
+                continue
+
+            for row in rows:
+                cells = [cell.replace("\n", " ").strip() for cell in row]
+                total_columns = [i for i, cell in enumerate(cells) if _amount_equals(cell, total)]
+                description_columns = [
+                    i for i, cell in enumerate(cells)
+                    if len(cell) >= 3 and _parse_amount(cell) is None
+                    and (description in cell.lower() or cell.lower() in description)
+                ]
+                if not total_columns or not description_columns:
+                    continue
+
+                matched += 1
+                total_column = total_columns[-1]
+                votes["line_total"][total_column] += 1
+                votes["item_description"][description_columns[0]] += 1
+                for column in ("quantity", "unit_price"):
+                    expected = _to_float(item.get(column))
+                    for i, cell in enumerate(cells):
+                        if i != total_column and expected is not None and _amount_equals(cell, expected):
+                            votes[column][i] += 1
+                break
+
+        if matched and matched * 2 >= len(line_items) and (best is None or matched > best[0]):
+            columns = {column: count.most_common(1)[0][0] for column, count in votes.items() if count}
+            best = (matched, {"strategy": strategy, "columns": columns})
+
+    return best[1] if best else None
+
+
+def _amount_equals(cell: str, expected: float) -> bool:
+    found = _parse_amount(cell)
+    return found is not None and abs(found - expected) < 0.005
+
+
+def _apply_table(tables: Dict[str, List[List[str]]], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+    table = rules["table"]
+    columns = table["columns"]
+    line_items = []
+
+    for row in tables.get(table["strategy"]) or []:
+        cells = [cell.replace("\n", " ").strip() for cell in row]
+        if max(columns.values()) >= len(cells):
+            continue
+
+        description = cells[columns["item_description"]]
+        line_total = _parse_amount(cells[columns["line_total"]])
+        if not description or line_total is None or description.lower().startswith(TOTAL_ROW_LABELS):
+            continue
+
+        quantity = _parse_amount(cells[columns["quantity"]]) if "quantity" in columns else None
+        unit_price = _parse_amount(cells[columns["unit_price"]]) if "unit_price" in columns else None
+        quantity = quantity or 1
+        line_items.append({
+            "item_description": description,
+            "quantity": quantity,
+            "unit_price": unit_price if unit_price is not None else round(line_total / quantity, 2),
+            "line_total": line_total,
+            "category": rules["categories"].get(description.lower(), rules["default_category"])
+        })
+
+    return line_items
+
+
+def _is_consistent(invoice: Dict[str, Any]) -> bool:
+    """True when the line items add up to the subtotal or total"""
+    summary = invoice.get("invoice_summary") or {}
+    line_items = invoice.get("line_items") or []
+    total = _to_float(summary.get("total_amount")) or 0
+    if total <= 0 or not line_items or "error" in invoice or "extraction_note" in invoice:
+        return False
+
+    items_total = sum(_to_float(item.get("line_total")) or 0 for item in line_items)
+    subtotal = _to_float(summary.get("subtotal")) or 0
+    tax = _to_float(summary.get("tax_amount")) or 0
+    candidates = [value for value in (subtotal, total - tax, total) if value > 0]
+    return any(abs(items_total - value) <= max(0.01, value * 0.005) for value in candidates)
+
+
+def _agrees(template_invoice: Dict[str, Any], llm_invoice: Dict[str, Any]) -> bool:
+    """True when a template reproduces an LLM extraction's key values"""
+    ours, theirs = template_invoice["invoice_summary"], llm_invoice["invoice_summary"]
+    for field in ("invoice_number", "invoice_date", "total_amount"):
+        a, b = ours.get(field), theirs.get(field)
+        if _to_float(a) is not None and _to_float(b) is not None:
+            if abs(_to_float(a) - _to_float(b)) >= 0.005:
+                return False
+        elif str(a).strip().lower() != str(b).strip().lower():
+            return False
+    return len(template_invoice["line_items"]) == len(llm_invoice["line_items"])
+
+
+# Shared template service for the whole application
+template_service = TemplateService()
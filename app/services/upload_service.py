@@ -0,0 +1,309 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.routing import APIRoute
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.requests import Request
+
+from app.services.metrics import stage
+
+
+# Upload limits (MAX_FILE_SIZE is in MB, as documented in the README)
+MAX_FILE_SIZE = int(float(os.getenv("MAX_FILE_SIZE", "50")) * 1024 * 1024)
+MAX_REQUEST_SIZE = int(float(os.getenv("MAX_REQUEST_SIZE", "1024")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None  # defaults to the system temp dir
+
+
+class UploadTooLargeError(Exception):
+    """Raised as soon as an upload crosses the size limit"""
+
+
+class SpooledFile:
+    """An uploaded document spooled to a temporary file on disk"""
+
+    def __init__(self, filename: str, path: str, size: int, sha256: str):
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def link(self) -> "SpooledFile":
+        """A second name for the same file, which survives cleanup() of this one"""
+        path = f"{self.path}.{uuid.uuid4().hex[:8]}"
+        try:
+            os.link(self.path, path)
+        except OSError:
+            shutil.copyfile(self.path, path)
+        return SpooledFile(self.filename, path, self.size, self.sha256)
+
+    def cleanup(self):
+        """Delete the temporary file"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class UploadService:
+    """Copies uploads to disk in chunks, hashing and size-checking as it goes"""
+
+    def __init__(self, max_file_size: int = MAX_FILE_SIZE, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.max_file_size = max_file_size
+        self.chunk_size = chunk_size
+
+    async def spool(self, file: UploadFile) -> SpooledFile:
+        """Spool an UploadFile to a temporary file without loading it into memory.
+
+        Uploads parsed by UploadRoute are already on disk, hashed and
+        size-checked; their file is taken over instead of copied.
+        """
+        filename = file.filename or "unknown_file.pdf"
+        if isinstance(file, DiskUpload) and not file.adopted:
+            if file.received > self.max_file_size:
+                raise UploadTooLargeError(
+                    f"File {filename} exceeds the {self.max_file_size / (1024 * 1024):g}MB limit"
+                )
+            await asyncio.to_thread(file.file.flush)
+            file.adopted = True
+            return SpooledFile(filename, file.path, file.received, file.digest.hexdigest())
+
+        handle, path = tempfile.mkstemp(prefix="upload_", suffix=".pdf", dir=UPLOAD_TMP_DIR)
+        digest = hashlib.sha256()
+        size = 0
+
+        try:
+            with stage("upload_read"), os.fdopen(handle, "wb") as out:
+                while True:
+                    chunk = await file.read(self.chunk_size)
+                    if not chunk:
+                        break
+
+                    size += len(chunk)
+                    if size > self.max_file_size:
+                        raise UploadTooLargeError(
+                            f"File {filename} exceeds the {self.max_file_size / (1024 * 1024):g}MB limit"
+                        )
+
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+
+        return SpooledFile(filename, path, size, digest.hexdigest())
+
+    async def spool_bytes(self, content: bytes, filename: str) -> SpooledFile:
+        """Write in-memory content (e.g. from the job queue) to a temporary file"""
+        return await asyncio.to_thread(self._write_bytes, content, filename)
+
+    def _write_bytes(self, content: bytes, filename: str) -> SpooledFile:
+        handle, path = tempfile.mkstemp(prefix="upload_", suffix=".pdf", dir=UPLOAD_TMP_DIR)
+        with os.fdopen(handle, "wb") as out:
+            out.write(content)
+        return SpooledFile(filename, path, len(content), hashlib.sha256(content).hexdigest())
+
+
+class DiskUpload(UploadFile):
+    """A multipart file part written straight to a temporary file, hashed as it arrives.
+
+    The file is deleted when the request's form is closed, unless
+    UploadService.spool() has taken it over.
+    """
+
+    def __init__(self, filename: Optional[str], headers=None):
+        handle, path = tempfile.mkstemp(prefix="upload_", suffix=".pdf", dir=UPLOAD_TMP_DIR)
+        super().__init__(os.fdopen(handle, "w+b"), size=0, filename=filename, headers=headers)
+        self.path = path
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.adopted = False
+
+    async def close(self):
+        await super().close()
+        if not self.adopted:
+            self.discard()
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class DiskMultiPartParser(MultiPartParser):
+    """Multipart parser that writes file parts to disk and rejects one as soon as it crosses max_size"""
+
+    def __init__(self, *args, max_size: int = MAX_FILE_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_size = max_size
+        self._uploads = []
+
+    def on_headers_finished(self):
+        super().on_headers_finished()
+        part = self._current_part
+        if part.file is not None:
+            # Replace Starlette's in-memory spool, which would be copied to disk again later
+            part.file.file.close()
+            part.file = DiskUpload(part.file.filename, part.file.headers)
+            self._uploads.append(part.file)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        upload = self._current_part.file
+        if upload is not None:
+            upload.received += end - start
+            if self.max_size and upload.received > self.max_size:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File {upload.filename} exceeds the {self.max_size / (1024 * 1024):g}MB limit"
+                )
+            upload.digest.update(data[start:end])
+        super().on_part_data(data, start, end)
+
+    async def parse(self):
+        try:
+            return await super().parse()
+        except BaseException:
+            for upload in self._uploads:
+                upload.discard()
+            raise
+
+
+class _DiskUploadRequest(Request):
+    max_file_size = MAX_FILE_SIZE
+
+    async def _get_form(self, *, max_files=1000, max_fields=1000):
+        if self._form is None and self.headers.get("content-type", "").startswith("multipart/form-data"):
+            parser = DiskMultiPartParser(
+                self.headers, self.stream(),
+                max_files=max_files, max_fields=max_fields, max_size=self.max_file_size
+            )
+            try:
+                self._form = await parser.parse()
+            except MultiPartException as e:
+                raise HTTPException(status_code=400, detail=e.message)
+        return await super()._get_form(max_files=max_files, max_fields=max_fields)
+
+
+class UploadRoute(APIRoute):
+    """Route class whose multipart uploads go straight to disk, size-checked while parsed.
+
+    Each file part is held to MAX_FILE_SIZE as it streams in (route_limits
+    overrides it per path, 0: no limit), so an oversized file is rejected
+    with 413 before the rest of the body is read.
+    """
+
+    route_limits: Dict[str, int] = {}
+
+    @classmethod
+    def with_limits(cls, route_limits: Dict[str, int]) -> type:
+        return type(cls.__name__, (cls,), {"route_limits": route_limits})
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        request_class = type("Request", (_DiskUploadRequest,), {
+            "max_file_size": self.route_limits.get(self.path, MAX_FILE_SIZE)
+        })
+
+        async def disk_upload_handler(request: Request):
+            return await handler(request_class(request.scope, request.receive))
+
+        return disk_upload_handler
+
+
+class UploadLimitMiddleware:
+    """Rejects request bodies over MAX_REQUEST_SIZE before they are parsed.
+
+    Requests with a Content-Length over the limit are answered with 413
+    immediately; chunked bodies are counted while they stream in.
+    route_limits overrides the limit for specific paths (0: no limit).
+    """
+
+    def __init__(self, app, max_request_size: int = MAX_REQUEST_SIZE, route_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_request_size = max_request_size
+        self.route_limits = route_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.route_limits.get(scope.get("path"), self.max_request_size)
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = self._content_length(scope)
+        if content_length is not None and content_length > limit:
+            await self._reject(send, self.limit_message(limit))
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # HTTPException so the framework's body parser passes it through as a 413
+                    raise HTTPException(status_code=413, detail=self.limit_message(limit))
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except HTTPException as e:
+            if e.status_code != 413 or response_started:
+                raise
+            await self._reject(send, e.detail)
+
+    @staticmethod
+    def _content_length(scope) -> Optional[int]:
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    @staticmethod
+    def limit_message(limit: int) -> str:
+        return f"Request body exceeds the {limit / (1024 * 1024):g}MB limit"
+
+    async def _reject(self, send, message: str):
+        body = json.dumps({"detail": message}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Shared upload service for the whole application
+upload_service = UploadService()
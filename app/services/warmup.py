@@ -0,0 +1,84 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from typing import Dict
+
+from sqlalchemy import text
+
+
+logger = logging.getLogger(__name__)
+
+# Import heavy modules and start pools at startup instead of on the first request
+WARMUP_ENABLED = os.getenv("WARMUP", "true").lower() == "true"
+
+# Modules the handlers import lazily; optional ones are skipped when missing
+WARMUP_MODULES = (
+    "pandas",
+    "openpyxl",
+    "xlsxwriter",
+    "pdfplumber",
+    "pyarrow",
+    "pyarrow.parquet",
+    "app.services.extraction_service",
+    "app.services.excel_service",
+    "app.services.export_service",
+    "app.services.invoice_store",
+)
+
+
+async def warm_up() -> Dict[str, float]:
+    """Import heavy modules, start the PDF workers and open a database connection.
+
+    Runs in the lifespan hook of every web worker, before it accepts requests.
+    Returns the seconds spent per step; failures are logged, never raised,
+    so a missing optional package cannot keep the server from starting.
+    """
+    if not WARMUP_ENABLED:
+        return {}
+
+    timings: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    await asyncio.to_thread(_import_modules)
+    timings["imports"] = time.perf_counter() - start
+
+    from app.services.pdf_service import pdf_service
+
+    start = time.perf_counter()
+    try:
+        await pdf_service.warm_up()
+    except Exception as e:
+        logger.warning("PDF worker warm-up failed: %s", e)
+    timings["pdf_workers"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(_connect_database)
+    except Exception as e:
+        logger.warning("Database warm-up failed: %s", e)
+    timings["database"] = time.perf_counter() - start
+
+    logger.info(
+        "Warm-up finished in %.2fs (%s)",
+        sum(timings.values()),
+        ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    )
+    return timings
+
+
+def _import_modules():
+    for name in WARMUP_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.info("Skipping warm-up of %s: %s", name, e)
+
+
+def _connect_database():
+    """Open the first pooled connection so the first query does not pay for it"""
+    from app.database import engine
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
@@ -0,0 +1,42 @@
+"""Standalone job worker: python -m app.worker
+
+Runs the background extraction workers without the web server, so workers can
+be scaled separately from web processes (set JOB_WORKERS=0 on the web service).
+"""
+import asyncio
+import os
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+async def main():
+    from app.database import init_db
+    from app.services.job_service import job_service
+    from app.services.openai_service import close_openai_service
+    from app.services.pdf_service import pdf_service
+    from app.services.ocr_service import ocr_service
+
+    init_db()
+
+    # SIGTERM (deploys, scale-down) lets in-flight files finish within JOB_DRAIN_TIMEOUT
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await job_service.run_forever(int(os.getenv("JOB_WORKER_CONCURRENCY", "4")), stop_event)
+    finally:
+        await close_openai_service()
+        pdf_service.shutdown()
+        ocr_service.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1 @@
+# Benchmark harness: synthetic invoices, a stand-in OpenAI API and load scenarios
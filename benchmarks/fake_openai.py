@@ -0,0 +1,200 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions after a configurable latency, with a
+configurable share of 429 and 500 responses. Replies are shaped after the
+app's prompts (invoice JSON, analysis JSON, entities, combined, summary)
+and built from the document text, so responses and token counts scale with
+the input like the real API.
+
+    python -m benchmarks.fake_openai --port 8100 --latency 0.8 --jitter 0.3 --error-rate 0.01 --rate-limit-rate 0.02
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ITEM_LINE = re.compile(r"^(?P<description>.+?) (?P<quantity>\d+) (?P<price>\d+\.\d{2}) (?P<total>\d+\.\d{2})$", re.MULTILINE)
+TOTAL_LINE = re.compile(r"^Total Due (?P<total>\d+\.\d{2})$", re.MULTILINE)
+NUMBER_LINE = re.compile(r"Invoice No: (?P<number>\S+)")
+
+
+def create_app(
+    latency: float = 0.5,
+    jitter: float = 0.2,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    seed: int = 0
+) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    rng = random.Random(seed)
+    stats = {"requests": 0, "errors": 0, "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        await asyncio.sleep(max(0.0, rng.gauss(latency, jitter)) if jitter else latency)
+
+        roll = rng.random()
+        if roll < rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (benchmark)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": "0.5"}
+            )
+        if roll < rate_limit_rate + error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"message": "Injected server error", "type": "server_error"}}, status_code=500)
+
+        messages: List[Dict[str, Any]] = body.get("messages", [])
+        system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        content = _reply(system, user)
+
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        completion_tokens = len(content) // 4
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        model = body.get("model", "gpt-3.5-turbo")
+
+        if body.get("stream"):
+            return StreamingResponse(_stream(content, model), media_type="text/event-stream")
+
+        return {
+            "id": f"chatcmpl-bench-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    return app
+
+
+async def _stream(content: str, model: str):
+    """Server-sent chunks, a few words at a time"""
+    words = content.split(" ")
+    for start in range(0, len(words), 5):
+        piece = " ".join(words[start:start + 5]) + (" " if start + 5 < len(words) else "")
+        chunk = {
+            "id": "chatcmpl-bench-stream",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(0.01)
+    yield "data: [DONE]\n\n"
+
+
+def _reply(system: str, user: str) -> str:
+    # The combined prompt embeds the per-type analysis prompt, so it is checked first
+    if "exactly these three keys" in system:
+        return json.dumps({"structured_data": _analysis(user), "summary": _summary(user), "entities": _entities(user)})
+    if "for Excel export" in system:
+        return json.dumps(_invoice(user))
+    if "Extract key entities" in system:
+        return json.dumps(_entities(user))
+    if "summary" in system.lower():
+        return _summary(user)
+    return json.dumps(_analysis(user))
+
+
+def _invoice(text: str) -> Dict[str, Any]:
+    items = [
+        {
+            "item_description": match["description"],
+            "quantity": int(match["quantity"]),
+            "unit_price": float(match["price"]),
+            "line_total": float(match["total"]),
+            "category": "Office Supplies"
+        }
+        for match in ITEM_LINE.finditer(text)
+    ]
+    subtotal = round(sum(item["line_total"] for item in items), 2)
+    total = TOTAL_LINE.search(text)
+    number = NUMBER_LINE.search(text)
+    lines = text.splitlines()
+    return {
+        "invoice_summary": {
+            "invoice_number": number["number"] if number else "N/A",
+            "vendor_name": lines[2] if len(lines) > 2 else "Unknown Vendor",
+            "invoice_date": "2024-01-31",
+            "due_date": "N/A",
+            "subtotal": subtotal,
+            "tax_amount": round(float(total["total"]) - subtotal, 2) if total else 0,
+            "total_amount": float(total["total"]) if total else subtotal,
+            "po_number": "N/A",
+            "vendor_address": "N/A",
+            "currency": "GBP",
+            "payment_terms": "N/A"
+        },
+        "line_items": items
+    }
+
+
+def _analysis(text: str) -> Dict[str, Any]:
+    invoice = _invoice(text)
+    return {
+        "document_type": "invoice",
+        "key_topics": ["billing"],
+        "important_dates": ["2024-01-31"],
+        "key_figures": [str(invoice["invoice_summary"]["total_amount"])],
+        "entities": {"people": [], "organizations": [invoice["invoice_summary"]["vendor_name"]], "locations": []},
+        "action_items": ["Pay the invoice"]
+    }
+
+
+def _entities(text: str) -> Dict[str, Any]:
+    return {
+        "dates": ["2024-01-31"], "amounts": [], "emails": [], "phone_numbers": [],
+        "names": ["Contoso Corporation"], "addresses": []
+    }
+
+
+def _summary(text: str) -> str:
+    items = len(ITEM_LINE.findall(text))
+    return (
+        f"This invoice lists {items} line items for office supplies and services. "
+        "Payment is due on receipt; totals include VAT at 20 percent."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.2, help="standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Load scenarios against a local copy of the service.
+
+Starts the fake OpenAI server and the app (uvicorn, fresh SQLite database)
+as subprocesses, runs the selected scenarios and reports latency
+percentiles, files/sec and the peak RSS of the app's process tree
+(including PDF worker processes).
+
+    python -m benchmarks.run --scenario all --requests 50 --concurrency 8
+    python -m benchmarks.run --scenario batch --batch-size 20 --pages 3 --line-items 80 --json results.json
+
+Use --app-url to benchmark an already running server instead (RSS is then
+not measured).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.synthetic_pdfs import invoice_pdf
+
+SCENARIOS = ("extract", "batch", "export")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RSSSampler(threading.Thread):
+    """Samples the resident memory of a process and its children (Linux /proc)"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.peak_bytes = max(self.peak_bytes, self.current_bytes())
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def reset(self):
+        self.peak_bytes = self.current_bytes()
+
+    def current_bytes(self) -> int:
+        return sum(_rss(pid) for pid in _process_tree(self.pid))
+
+
+def _process_tree(root: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def _run_requests(count: int, concurrency: int, send) -> Dict[str, Any]:
+    """Call send(i) count times with bounded concurrency; send returns (ok, files)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+    files = 0
+
+    async def one(index: int):
+        nonlocal errors, files
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok, done = await send(index)
+            except Exception:
+                ok, done = False, 0
+            latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+            files += done
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(count)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": count,
+        "errors": errors,
+        "files": files,
+        "seconds": round(elapsed, 2),
+        "files_per_sec": round(files / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1)
+    }
+
+
+async def scenario_extract(client: httpx.AsyncClient, args, offset: int) -> Dict[str, Any]:
+    async def send(index: int):
+        pdf = invoice_pdf(offset + index, args.pages, args.line_items)
+        response = await client.post(
+            "/api/v1/extract",
+            files={"file": (f"invoice_{index}.pdf", pdf, "application/pdf")},
+            data={"extraction_type": "invoice", "analysis_mode": args.analysis_mode}
+        )
+        return response.status_code == 200, 1
+
+    return await _run_requests(args.requests, args.concurrency, send)
+
+
+async def scenario_batch(client: httpx.AsyncClient, args, offset: int) -> Dict[str, Any]:
+    async def send(index: int):
+        files = [
+            ("files", (f"invoice_{index}_{n}.pdf", invoice_pdf(offset + index * args.batch_size + n, args.pages, args.line_items), "application/pdf"))
+            for n in range(args.batch_size)
+        ]
+        response = await client.post("/api/v1/batch-extract", files=files)
+        if response.status_code != 200:
+            return False, 0
+        invoices = response.json()["invoices"]
+        return not any(invoice.get("error") for invoice in invoices), len(invoices)
+
+    return await _run_requests(max(1, args.requests // args.batch_size), args.concurrency, send)
+
+
+async def scenario_export(client: httpx.AsyncClient, args, offset: int) -> Dict[str, Any]:
+    invoices = [
+        {
+            "invoice_summary": {
+                "invoice_number": f"INV-{n}", "vendor_name": "ACME Supplies Ltd", "invoice_date": "2024-01-31",
+                "due_date": "N/A", "subtotal": 100.0, "tax_amount": 20.0, "total_amount": 120.0,
+                "po_number": "N/A", "vendor_address": "N/A", "currency": "GBP", "payment_terms": "N/A",
+                "filename": f"invoice_{n}.pdf"
+            },
+            "line_items": [
+                {"item_description": f"Item {i}", "quantity": 1, "unit_price": 1.0, "line_total": 1.0,
+                 "category": "Office Supplies", "filename": f"invoice_{n}.pdf"}
+                for i in range(args.line_items)
+            ]
+        }
+        for n in range(args.batch_size)
+    ]
+
+    async def send(index: int):
+        response = await client.post("/api/v1/export-excel", json={"invoices": invoices})
+        return response.status_code == 200 and len(response.content) > 0, len(invoices)
+
+    return await _run_requests(max(1, args.requests // 5), args.concurrency, send)
+
+
+SCENARIO_FUNCTIONS = {"extract": scenario_extract, "batch": scenario_batch, "export": scenario_export}
+
+
+def _start(command: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _wait_until_up(url: str, process: Optional[subprocess.Popen], timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{url} exited early:\n{process.stderr.read().decode(errors='replace')}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:g}s")
+
+
+async def run_scenarios(args, app_url: str, sampler: Optional[RSSSampler]) -> List[Dict[str, Any]]:
+    names = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    results = []
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=app_url, timeout=timeout, limits=limits) as client:
+        for offset, name in enumerate(names):
+            if sampler is not None:
+                sampler.reset()
+            result = await SCENARIO_FUNCTIONS[name](client, args, offset * 1_000_000)
+            result["scenario"] = name
+            result["peak_rss_mb"] = round(sampler.peak_bytes / (1024 * 1024), 1) if sampler else None
+            results.append(result)
+    return results
+
+
+def print_table(results: List[Dict[str, Any]]):
+    columns = ("scenario", "requests", "errors", "files", "files_per_sec", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb")
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--requests", type=int, default=40, help="files per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--line-items", type=int, default=20)
+    parser.add_argument("--analysis-mode", default="parallel")
+    parser.add_argument("--templates", action="store_true", help="let vendor templates replace LLM calls")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--fake-port", type=int, default=8766)
+    parser.add_argument("--app-url", help="benchmark this running server instead of starting one")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    processes: List[subprocess.Popen] = []
+    sampler = None
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        app_url = args.app_url
+        if app_url is None:
+            env = dict(os.environ)
+            fake = _start([
+                sys.executable, "-m", "benchmarks.fake_openai", "--port", str(args.fake_port),
+                "--latency", str(args.llm_latency), "--jitter", str(args.llm_jitter),
+                "--error-rate", str(args.llm_error_rate), "--rate-limit-rate", str(args.llm_rate_limit_rate)
+            ], env)
+            processes.append(fake)
+            _wait_until_up(f"http://127.0.0.1:{args.fake_port}/stats", fake)
+
+            env.update({
+                "OPENAI_API_KEY": "benchmark",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1",
+                "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                "TEMPLATES_ENABLED": "true" if args.templates else "false",
+                "JOB_WORKERS": "0"
+            })
+            app = _start([
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--port", str(args.app_port), "--log-level", "warning"
+            ], env)
+            processes.append(app)
+            app_url = f"http://127.0.0.1:{args.app_port}"
+            _wait_until_up(f"{app_url}/health", app)
+
+            sampler = RSSSampler(app.pid)
+            sampler.start()
+
+        results = asyncio.run(run_scenarios(args, app_url, sampler))
+        print_table(results)
+
+        if args.json:
+            report = {
+                "settings": vars(args),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "commit": _git_commit(),
+                "results": results
+            }
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Synthetic invoice PDFs for benchmarks.
+
+Writes minimal PDF files directly (Helvetica text, no extra dependencies),
+with a running header and footer on every page, a line-item table spread
+over the requested number of pages and totals at the end.
+
+    python -m benchmarks.synthetic_pdfs --count 20 --pages 3 --line-items 60 --out /tmp/invoices
+"""
+import argparse
+import os
+import random
+from typing import List, Tuple
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+ROW_HEIGHT = 16
+ITEMS_PER_PAGE = 38
+
+VENDORS = [
+    ("ACME Supplies Ltd", "12 Industrial Road, Springfield"),
+    ("Northwind Traders", "400 Harbour Street, Seattle"),
+    ("Globex Services GmbH", "Hauptstrasse 5, 10115 Berlin"),
+    ("Initech Consulting", "1 Office Park, Austin"),
+]
+PRODUCTS = [
+    "Printer paper A4", "Toner cartridge", "Stapler heavy duty", "Consulting hours",
+    "Software licence", "Cloud hosting", "Office chair", "Desk lamp", "Shipping",
+    "Support contract", "Training session", "USB-C cable", "Monitor 27 inch",
+]
+
+
+def invoice_pdf(seed: int, pages: int = 1, line_items: int = 10) -> bytes:
+    """A deterministic synthetic invoice for the given seed"""
+    rng = random.Random(seed)
+    vendor, address = VENDORS[seed % len(VENDORS)]
+    number = f"INV-{100000 + seed}"
+    date = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024"
+
+    items = []
+    for _ in range(line_items):
+        quantity = rng.randint(1, 20)
+        price = round(rng.uniform(1, 500), 2)
+        items.append((rng.choice(PRODUCTS), quantity, price, round(quantity * price, 2)))
+
+    pages = max(pages, -(-line_items // ITEMS_PER_PAGE), 1)
+    per_page = -(-line_items // pages) if line_items else 0
+    subtotal = round(sum(item[3] for item in items), 2)
+    tax = round(subtotal * 0.2, 2)
+
+    page_lines: List[List[Tuple[int, int, str]]] = []
+    for page in range(pages):
+        lines = [
+            (50, 750, vendor), (50, 736, address), (420, 750, "INVOICE"),
+            (420, 736, f"Invoice No: {number}"), (420, 722, f"Date: {date}"),
+            (50, 700, "Bill To: Contoso Corporation, 99 Main Street"),
+            (50, 670, "Description"), (300, 670, "Qty"), (380, 670, "Unit Price"), (480, 670, "Amount"),
+        ]
+        y = 652
+        for description, quantity, price, total in items[page * per_page:(page + 1) * per_page]:
+            lines += [(50, y, description), (300, y, str(quantity)), (380, y, f"{price:.2f}"), (480, y, f"{total:.2f}")]
+            y -= ROW_HEIGHT
+        if page == pages - 1:
+            lines += [
+                (380, y - 20, "Subtotal"), (480, y - 20, f"{subtotal:.2f}"),
+                (380, y - 36, "VAT 20%"), (480, y - 36, f"{tax:.2f}"),
+                (380, y - 52, "Total Due"), (480, y - 52, f"{subtotal + tax:.2f}"),
+            ]
+        lines += [(50, 40, f"{vendor} - {address} - Registered in England"), (500, 40, f"Page {page + 1} of {pages}")]
+        page_lines.append(lines)
+
+    return _write_pdf(page_lines)
+
+
+def _write_pdf(page_lines: List[List[Tuple[int, int, str]]]) -> bytes:
+    page_count = len(page_lines)
+    font_id = 3 + 2 * page_count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count)).encode(), page_count
+        ),
+    ]
+    for index, lines in enumerate(page_lines):
+        operations = ["BT /F1 9 Tf"]
+        for x, y, text in lines:
+            escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            operations.append(f"1 0 0 1 {x} {y} Tm ({escaped}) Tj")
+        operations.append("ET")
+        stream = "\n".join(operations).encode("latin-1")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (PAGE_WIDTH, PAGE_HEIGHT, 4 + 2 * index, font_id)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--line-items", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="synthetic_invoices")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for index in range(args.count):
+        path = os.path.join(args.out, f"invoice_{args.seed + index:05d}.pdf")
+        with open(path, "wb") as f:
+            f.write(invoice_pdf(args.seed + index, args.pages, args.line_items))
+    print(f"Wrote {args.count} invoices to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
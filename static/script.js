@@ -196,23 +196,54 @@ async function startBatchProcessing() {
         });
         
         // Show progress
-        updateProgress(10);
+        updateProgress(5);
         
-        // Send batch request
-        const response = await fetch('/api/v1/batch-extract', {
+        // Send batch request; results stream back one invoice at a time
+        const response = await fetch('/api/v1/batch-extract/stream', {
             method: 'POST',
+            headers: {
+                'Accept': 'application/x-ndjson'
+            },
             body: formData
         });
         
-        updateProgress(90);
-        
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
+        const invoices = new Array(selectedFiles.length);
+        let summary = null;
+        let batchId = null;
+        
+        await readEventStream(response, event => {
+            if (event.event === 'start') {
+                batchId = event.batch_id;
+            } else if (event.event === 'result' || (event.event === 'error' && event.invoice)) {
+                invoices[event.index] = event.invoice;
+                document.getElementById('processingStatus').textContent = `Finished ${event.filename}`;
+            } else if (event.event === 'progress') {
+                document.getElementById('processedCount').textContent = event.completed;
+                updateProgress(5 + Math.round(95 * event.completed / event.total));
+            } else if (event.event === 'error') {
+                throw new Error(event.error);
+            } else if (event.event === 'done') {
+                summary = event;
+                // null when storage failed part-way; the export then sends the full data
+                batchId = event.batch_id;
+            }
+        });
+        
         updateProgress(100);
         
+        const processed = invoices.filter(invoice => invoice);
+        const data = {
+            status: 'success',
+            batch_id: batchId,
+            processed_count: processed.length,
+            invoices: processed,
+            message: summary ? summary.message : `Successfully processed ${processed.length} invoice(s)`
+        };
+        
         // Store processed data
         processedData = data;
         
@@ -227,6 +258,28 @@ async function startBatchProcessing() {
     }
 }
 
+async function readEventStream(response, onEvent) {
+    // Parse an NDJSON response body line by line as it arrives
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        
+        lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+    }
+    
+    if (buffer.trim()) {
+        onEvent(JSON.parse(buffer));
+    }
+}
+
 function updateProgress(percentage) {
     const progressFill = document.getElementById('progressFill');
     progressFill.style.width = percentage + '%';
@@ -351,12 +404,14 @@ async function exportToExcel() {
         exportExcelBtn.disabled = true;
         exportExcelBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Generating Excel...';
         
+        // Stored batches are exported from the database; the full data is only
+        // sent when the batch could not be stored
         const response = await fetch('/api/v1/export-excel', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify(processedData)
+            body: JSON.stringify(processedData.batch_id ? { batch_id: processedData.batch_id } : processedData)
         });
         
         if (!response.ok) {